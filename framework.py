@@ -13,11 +13,6 @@ Basic Tank Widget Framework
 """
 
 import tank
-import platform
-import sys
-import traceback
-import os
-
 
 
 class blPythonFramework(tank.platform.Framework):
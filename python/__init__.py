@@ -8,4 +8,40 @@
 # agreement to the Shotgun Pipeline Toolkit Source Code License. All rights 
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
-from . import shotgun
\ No newline at end of file
+"""
+blPython is loaded lazily: its submodules are only imported on first attribute access, eg.
+blPython.shotgun, so importing the package doesn't pull in sgtk, the SG API or git helpers
+that the caller may never use.
+"""
+import sys
+import types
+import importlib
+
+from .core.config import CUSTOM_ENTITIES as custom_entities
+
+# Submodules imported on first access.
+LAZY_SUBMODULES = ('core', 'shotgun', 'git', 'events', 'release', 'scripts')
+
+
+class _LazyPackage(types.ModuleType):
+    """
+    Module type that imports the blPython submodules on first attribute access.
+    """
+
+    def __getattr__(self, name):
+        if name in LAZY_SUBMODULES:
+            # import_module sets the submodule as an attribute of this package.
+            return importlib.import_module('%s.%s' % (self.__name__, name))
+
+        raise AttributeError("module '%s' has no attribute '%s'" % (self.__name__, name))
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(LAZY_SUBMODULES))
+
+
+_package = _LazyPackage(__name__, __doc__)
+_package.__dict__.update(globals())
+
+# Keep the original module alive, Python 2 clears the globals of a module once it is garbage collected.
+_package._module = sys.modules[__name__]
+sys.modules[__name__] = _package
\ No newline at end of file
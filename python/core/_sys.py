@@ -61,4 +61,27 @@ def append_to_environment_variable(key, path):
     sys.path.insert(0, path)
     os.environ[key] = os.environ[key] + os.pathsep + path
     print(". Added path to os.environ[{}]: {}".format(key, path))
-    return 1
\ No newline at end of file
+    return 1
+
+
+def to_native_str(data):
+    """ to_native_str(data): converts the unicode strings of data to native strings
+
+    json returns unicode strings under Python 2, which os.environ and the env
+    blocks of subprocess don't accept. Converts every unicode string of data,
+    and of the dicts and lists it holds, to str. Under Python 3 data is
+    returned as is.
+    """
+    if sys.version_info[0] >= 3:
+        return data
+
+    if isinstance(data, unicode):
+        try:
+            return data.encode(sys.getfilesystemencoding() or 'utf-8')
+        except UnicodeEncodeError:
+            return data.encode('utf-8')
+    if isinstance(data, dict):
+        return dict((to_native_str(key), to_native_str(value)) for key, value in data.items())
+    if isinstance(data, list):
+        return [to_native_str(value) for value in data]
+    return data
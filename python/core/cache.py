@@ -0,0 +1,112 @@
+"""
+In-memory caches shared across the framework.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Thread-safe, size bounded least-recently-used cache with an optional time to live.
+
+    :param maxsize: The maximum number of entries. The least recently used entry is evicted beyond it.
+    :param ttl: Seconds an entry stays valid, or None for no expiry.
+    :param timer: Callable returning the current time, to be overridden by tests.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, timer=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """
+        Returns the value cached for key, or default if it is missing or has expired.
+        """
+        with self._lock:
+            item = self._data.pop(key, None)
+
+            if item is not None and self.ttl is not None and self.timer() - item[1] > self.ttl:
+                self.expirations += 1
+                item = None
+
+            if item is None:
+                self.misses += 1
+                return default
+
+            # Re-insert to mark as most recently used.
+            self._data[key] = item
+            self.hits += 1
+            return item[0]
+
+    def peek(self, key, default=None):
+        """
+        Returns the value cached for key like get, without counting a hit or miss or marking it as used.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (self.ttl is not None and self.timer() - item[1] > self.ttl):
+                return default
+            return item[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, self.timer())
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """
+        Removes key from the cache.
+
+        :return: True if the key was cached.
+        """
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def keys(self):
+        """
+        :return: list of the cached keys, least recently used first. Expired entries are included.
+        """
+        with self._lock:
+            return list(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        """
+        :return: dict of the cache counters, its size and hit rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'expirations': self.expirations,
+                    'size': len(self._data),
+                    'maxsize': self.maxsize,
+                    'hit_rate': float(self.hits) / lookups if lookups else 0.0}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = self.expirations = 0
@@ -9,7 +9,6 @@ Author: Patrick Macdonald
 Template Author: Patrick Macdonald
 """
 import os
-import json
 
 # r'C:\Users\Blacksmith\Documents\GitHub\pipeline\Python\shotgun\shotgun_config.json'
 #SHOTGUN_CONFIG_PATH = os.path.join()
@@ -0,0 +1,120 @@
+"""
+Process wide pool of Shotgun connections.
+
+shotgun_api3.Shotgun objects are not thread-safe and opening one costs a new HTTPS session, so the pool
+hands out one connection per thread and per set of credentials, and reuses it for the life of the thread.
+
+Tests can swap the pool, or just its factory, for one handing out mockgun-style stand-ins:
+
+    connection.set_pool(connection.ConnectionPool(factory=lambda site, script_name, api_key: mock_sg))
+"""
+import threading
+
+from blPython.core import config
+
+# The script user the framework connects as by default.
+DEFAULT_SCRIPT_NAME = "blPython"
+DEFAULT_API_KEY = "p7s&cwqohkxaNiwujgeombrsx"
+
+
+def create_connection(site, script_name, api_key):
+    """
+    The default connection factory.
+    """
+    # Imported here so the pool can be loaded before the SG API path has been added to sys.path.
+    import shotgun_api3
+
+    return shotgun_api3.Shotgun(site, script_name=script_name, api_key=api_key)
+
+
+class ConnectionPool(object):
+    """
+    Thread-safe pool of SG connections, one per thread and per (site, script_name, api_key).
+
+    :param factory: callable(site, script_name, api_key) returning a new connection.
+    """
+
+    def __init__(self, factory=create_connection):
+        self.factory = factory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+
+    def _get_connections(self):
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        return connections
+
+    def get(self, site, script_name, api_key):
+        """
+        Returns the calling thread's connection for the given credentials, creating it if needed.
+        """
+        key = (site, script_name, api_key)
+        connections = self._get_connections()
+
+        sg = connections.get(key)
+        if sg is not None:
+            with self._lock:
+                self.hits += 1
+            return sg
+
+        with self._lock:
+            self.misses += 1
+
+        sg = self.factory(site, script_name, api_key)
+        connections[key] = sg
+
+        with self._lock:
+            self.created += 1
+
+        return sg
+
+    def release(self):
+        """
+        Drops the calling thread's connections, eg. before a worker thread exits.
+        """
+        self._local.connections = {}
+
+    def stats(self):
+        """
+        :return: dict of the hit, miss and creation counters and the hit rate.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'created': self.created,
+                    'hit_rate': float(self.hits) / total if total else 0.0}
+
+
+_pool = ConnectionPool()
+
+
+def get_pool():
+    return _pool
+
+
+def set_pool(pool):
+    """
+    Replaces the process wide pool, eg. with one backed by mockgun for tests.
+
+    :return: The previous pool, so it can be restored.
+    """
+    global _pool
+    previous = _pool
+    _pool = pool
+    return previous
+
+
+def get_connection(script_name=DEFAULT_SCRIPT_NAME, api_key=DEFAULT_API_KEY, site=config.SHOTGUN_SITE):
+    """
+    Returns a pooled SG connection for the calling thread.
+
+    :param script_name: The SG script user. Defaults to the blPython script user.
+    :param api_key: The script user's api key
+    :param site: The SG site url. Defaults to the studio site.
+    """
+    return _pool.get(site, script_name, api_key)
@@ -2,6 +2,23 @@
 Utility methods for working with events.
 """
 import os
+import logging
+
+from blPython.core import connection
+from blPython.core.cache import LRUCache
+
+# Project types looked up by is_valid_event, keyed on (entity type, id).
+# The cache lives at module level so it is shared by every plugin in the daemon process.
+PROJECT_TYPE_CACHE = LRUCache(maxsize=int(os.environ.get('BLK_EVENTS_CACHE_SIZE', 1024)),
+                              ttl=int(os.environ.get('BLK_EVENTS_CACHE_TTL', 300)))
+
+# Reason codes logged with every validation decision.
+REASON_NO_PROJECT = 'no_project'
+REASON_LIVE = 'live'
+REASON_DEV = 'dev'
+REASON_DEV_SCRIPT = 'dev_script_outside_dev_mode'
+REASON_LIVE_SCRIPT = 'live_script_in_dev_mode'
+REASON_NOT_DEV_PROJECT = 'not_dev_project'
 
 def is_dev_script(script_path):
     '''
@@ -14,6 +31,50 @@ def is_dev_script(script_path):
     result = script_mode == 'dev'
     return result
 
+def get_project_entity(entity_type, entity_id, sg):
+    '''
+    Returns the entity with its sg_type field, memoized in PROJECT_TYPE_CACHE.
+
+    :param entity_type: The SG entity type, eg. 'Project'
+    :param entity_id: The entity id
+    :param sg: SG connection
+    :return: The entity dict or None if it doesn't exist
+    '''
+    key = (entity_type, entity_id)
+
+    project_entity = PROJECT_TYPE_CACHE.get(key)
+    if project_entity is None:
+        project_entity = sg.find_one(entity_type,
+                                     filters=[['id', 'is', entity_id]],
+                                     fields=['sg_type'])
+
+        # Don't cache missing entities, they may be created later on.
+        if project_entity:
+            PROJECT_TYPE_CACHE.set(key, project_entity)
+
+    return project_entity
+
+def invalidate_from_event(event):
+    '''
+    Drops the cached sg_type of the event's entity if the event changes it.
+
+    :param event: SG EventLogEntry dict
+    :return: True if a cached entry was removed
+    '''
+    meta = event.get('meta') or {}
+    if meta.get('attribute_name') != 'sg_type':
+        return False
+
+    return PROJECT_TYPE_CACHE.invalidate((meta.get('entity_type'), meta.get('entity_id')))
+
+def get_cache_stats():
+    '''
+    Returns the hit/miss statistics of the project type cache, eg. to size it.
+
+    :return: dict of cache statistics
+    '''
+    return PROJECT_TYPE_CACHE.stats()
+
 def is_valid_event(plugin_path, event, sg, logger):
     '''
     To prevent running event plugins on live projects during development, we launch
@@ -23,28 +84,40 @@ def is_valid_event(plugin_path, event, sg, logger):
     If the env var is not set, then all valid events will be processed by the plugin.
 
     :param event:
+    :param sg: SG connection. If None, the framework's pooled connection is used.
     :return:
     '''
 
     IS_DEV_SCRIPT = is_dev_script(plugin_path)
 
+    if sg is None:
+        sg = connection.get_connection()
+
+    # A change to a project's type must not be validated against the cached type.
+    invalidate_from_event(event)
+
     # Get the project entity and get it's sg_type field.
-    if event['project']:
-        project_entity = sg.find_one(event['project']['type'],
-                                     filters=[['id', 'is', event['project']['id']]],
-                                     fields=['sg_type'])
+    entity_type, entity_id = get_event_project_key(event)
+    project_entity = get_project_entity(entity_type, entity_id, sg)
 
-    else:
-        project_entity = sg.find_one(event['meta']['entity_type'],
-            filters=[['id','is',event['meta']['entity_id']]],
-            fields=['sg_type'])
+    return is_valid_for_project(IS_DEV_SCRIPT, event, project_entity, logger)
 
+def is_valid_for_project(IS_DEV_SCRIPT, event, project_entity, logger):
+    '''
+    Decides if an event is valid for a plugin once its project entity is known.
+
+    :param IS_DEV_SCRIPT: True if the plugin lives in a 'dev' folder
+    :param event: SG EventLogEntry dict
+    :param project_entity: The entity returned by get_project_entity
+    :return: True if the plugin should process the event
+    '''
+    # Only one compact record is logged per event at INFO. Its arguments are formatted lazily by the
+    # logger, so nothing is built when INFO is disabled. The full event dump is kept for DEBUG.
     if not project_entity:
+        logger.info('event=%s project=%s valid=%s reason=%s',
+                    event.get('id'), None, False, REASON_NO_PROJECT)
         return False
 
-    logger.info('event : %s' % event)
-    logger.info('project : %s' % project_entity)
-
     is_dev_mode = os.environ.get('BLK_EVENTS_DEV', False) # This is set before launching the daemon to set up us as a dev environment
     is_dev_project = project_entity.get('sg_type') == 'Dev'
 
@@ -52,14 +125,90 @@ def is_valid_event(plugin_path, event, sg, logger):
     # or if not in devmode run for all projects. (eg if run from the service.)
     event_is_valid = (is_dev_mode and is_dev_project and IS_DEV_SCRIPT) or (not is_dev_mode and not IS_DEV_SCRIPT)
 
-    if event_is_valid:
-        logger.info('This event is valid')
+    if not is_dev_mode:
+        reason = REASON_DEV_SCRIPT if IS_DEV_SCRIPT else REASON_LIVE
+    elif not IS_DEV_SCRIPT:
+        reason = REASON_LIVE_SCRIPT
     else:
-        logger.info('This event is invalid.\nThis is because :')
-        logger.info('. BLK_EVENTS_DEV(%s) AND project type(%s) AND script type(%s) is not True' % (
-            is_dev_mode, is_dev_project, IS_DEV_SCRIPT))
-        logger.info(
-            '. OR we are not in devmode(is_dev_mode:%s) AND this script is not in the live folder(IS_DEV_SCRIPT:%s).' % (
-            is_dev_mode, IS_DEV_SCRIPT))
-
-    return event_is_valid
\ No newline at end of file
+        reason = REASON_DEV if is_dev_project else REASON_NOT_DEV_PROJECT
+
+    logger.info('event=%s project=%s valid=%s reason=%s',
+                event.get('id'), project_entity.get('id'), event_is_valid, reason)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('event : %s', event)
+        logger.debug('project : %s', project_entity)
+
+        if not event_is_valid:
+            logger.debug('This event is invalid.\nThis is because :')
+            logger.debug('. BLK_EVENTS_DEV(%s) AND project type(%s) AND script type(%s) is not True',
+                         is_dev_mode, is_dev_project, IS_DEV_SCRIPT)
+            logger.debug('. OR we are not in devmode(is_dev_mode:%s) AND this script is not in the live folder(IS_DEV_SCRIPT:%s).',
+                         is_dev_mode, IS_DEV_SCRIPT)
+
+    return event_is_valid
+
+def are_valid_events(plugin_path, events, sg, logger):
+    '''
+    Batch version of is_valid_event.
+
+    The sg_type of every distinct project/entity in the batch that isn't cached yet is fetched with
+    one sg.find per entity type, instead of one query per event.
+
+    :param plugin_path: Path of the plugin processing the events
+    :param events: list of SG EventLogEntry dicts
+    :param sg: SG connection. If None, the framework's pooled connection is used.
+    :return: list of booleans, aligned with events
+    '''
+    IS_DEV_SCRIPT = is_dev_script(plugin_path)
+
+    if sg is None:
+        sg = connection.get_connection()
+
+    for event in events:
+        invalidate_from_event(event)
+
+    keys = [get_event_project_key(event) for event in events]
+    project_entities = get_project_entities(keys, sg)
+
+    return [is_valid_for_project(IS_DEV_SCRIPT, event, project_entities.get(key), logger)
+            for event, key in zip(events, keys)]
+
+def get_event_project_key(event):
+    '''
+    Returns the (entity type, id) whose sg_type decides if the event is valid.
+    This is the event's project, or the event's entity for events without a project.
+    '''
+    if event['project']:
+        return (event['project']['type'], event['project']['id'])
+
+    return (event['meta']['entity_type'], event['meta']['entity_id'])
+
+def get_project_entities(keys, sg):
+    '''
+    Returns the entities for several (entity type, id) keys with their sg_type field.
+    Uncached entities are fetched with one query per entity type.
+
+    :param keys: list of (entity type, id) tuples
+    :param sg: SG connection
+    :return: dict of {(entity type, id): entity dict}. Missing entities are left out.
+    '''
+    project_entities = {}
+    missing = {}
+
+    for key in set(keys):
+        project_entity = PROJECT_TYPE_CACHE.get(key)
+        if project_entity is None:
+            missing.setdefault(key[0], []).append(key[1])
+        else:
+            project_entities[key] = project_entity
+
+    for entity_type, entity_ids in missing.items():
+        results = sg.find(entity_type, [['id', 'in', sorted(entity_ids)]], ['sg_type'])
+
+        for project_entity in results:
+            key = (entity_type, project_entity['id'])
+            PROJECT_TYPE_CACHE.set(key, project_entity)
+            project_entities[key] = project_entity
+
+    return project_entities
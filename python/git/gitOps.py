@@ -3,6 +3,67 @@ Blacksmith VFX Git utilities
 """
 import re, os, sys
 import subprocess
+from collections import namedtuple
+
+from blPython.git import gitReader
+
+# The backend used by the read-only queries below.
+# 'cli' runs git for every query. 'native' reads the .git folder directly with gitReader and only falls
+# back to the git CLI for what it can't answer.
+BACKENDS = ('cli', 'native')
+BACKEND = os.environ.get('BL_GIT_BACKEND', 'cli')
+
+# Everything create_git_release_report needs to know about a repo's current checkout.
+GitMetadata = namedtuple('GitMetadata', ['repo_url',
+                                         'repo_name',
+                                         'branch',
+                                         'commit',
+                                         'commit_short',
+                                         'commit_comment',
+                                         'tags',
+                                         'tag_comment'])
+
+# The refs pointing at HEAD, see get_head_refs.
+HeadRefs = namedtuple('HeadRefs', ['branch', 'commit', 'commit_short', 'commit_message', 'tags', 'tag_messages'])
+
+# for-each-ref format of the refs pointing at HEAD. Fields are NUL separated and every record ends
+# with a NUL, as neither ref names nor messages can contain one.
+_REF_FORMAT = '%(HEAD)%00%(refname)%00%(objectname)%00%(objectname:short)%00%(contents)%00'
+
+
+def set_backend(backend):
+    """
+    Sets the backend used by the read-only gitOps queries.
+
+    :param backend: 'cli' or 'native'
+    """
+    global BACKEND
+    if backend not in BACKENDS:
+        raise ValueError('Unrecognised git backend : %s. Valid options are : %s' % (backend, BACKENDS))
+    BACKEND = backend
+
+
+def _read_native(path, query):
+    """
+    Answers a query with gitReader when the native backend is enabled.
+
+    :param query: callable taking a gitReader.GitRepoReader
+    :return: The query result, or None if the CLI has to be used instead.
+    """
+    if BACKEND != 'native':
+        return None
+
+    try:
+        return query(gitReader.GitRepoReader(path))
+    except (gitReader.UnsupportedError, IOError, OSError, ValueError):
+        return None
+
+
+def _git(path, *args):
+    """
+    Runs a git command in path and returns its output as text.
+    """
+    return subprocess.check_output(['git'] + list(args), cwd=path, universal_newlines=True)
 
 def is_git_repository(path):
     """
@@ -12,11 +73,11 @@ def is_git_repository(path):
     :return: True/False
     """
     try:
-        git_status = subprocess.check_output(['git', '-C', path, 'status'])
+        git_status = _git(path, 'status')
         result = 'Not a git repository' not in git_status or 'fatal' not in git_status
         return result
 
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, OSError) as e:
         return False
 
 
@@ -28,8 +89,12 @@ def get_git_remote_url_from_path(path):
     :return: String URL path to the remote repo
     """
 
+    git_output = _read_native(path, lambda reader: reader.get_remote_url())
+    if git_output is not None:
+        return git_output
+
     # get git output
-    git_output = subprocess.check_output(['git', 'config', '--get', 'remote.origin.url'], cwd=path)
+    git_output = _git(path, 'config', '--get', 'remote.origin.url')
 
     # remove trailing newline
     git_output = git_output.replace('\n','')
@@ -50,8 +115,19 @@ def get_git_repo_name_from_path(path, sanitize=True):
     # get the git remote url
     git_output = get_git_remote_url_from_path(path)
 
+    return get_git_repo_name_from_url(git_output, sanitize=sanitize)
+
+
+def get_git_repo_name_from_url(url, sanitize=True):
+    """
+    Returns the git repo name from a remote url.
+
+    :param url: The remote url of the repo
+    :param sanitize: default=True, sanitizes the git repo name if required.
+    :return:
+    """
     # get basename
-    git_output = os.path.basename(git_output)
+    git_output = os.path.basename(url)
 
     # strip extension
     git_output = os.path.splitext(git_output)[0]
@@ -74,8 +150,11 @@ def get_current_git_branch_from_path(path, strip_parent=True, sanitize=False):
     :return: <string> git branchname of the provided path
     """
 
-    # get git output
-    git_output = subprocess.check_output(['git', 'rev-parse', '--abbrev-ref', 'HEAD'], cwd=path)
+    git_output = _read_native(path, lambda reader: reader.get_branch())
+
+    if git_output is None:
+        # get git output
+        git_output = _git(path, 'rev-parse', '--abbrev-ref', 'HEAD')
 
     # remove trailing newline
     git_output = git_output.replace('\n','')
@@ -99,14 +178,18 @@ def get_current_commit_hash_from_path(path, short=True):
     :param short: Toggle to choose between short and long form commit hash.
     :return: string : The commit hash
     """
+    git_output = _read_native(path, lambda reader: reader.get_short_commit() if short else reader.get_head_commit())
+    if git_output is not None:
+        return git_output
+
     # build git query
-    args = ['git', 'rev-parse', '--verify', 'HEAD']
+    args = ['rev-parse', '--verify', 'HEAD']
 
     if short:
         args.append('--short')
 
     # get git output
-    git_output = subprocess.check_output(args, cwd=path)
+    git_output = _git(path, *args)
 
     # remove trailing newline
     git_output = git_output.replace('\n','')
@@ -123,10 +206,10 @@ def get_current_commit_comment_from_path(path):
     """
     # build git query
     #args = ['git', 'log', '--format=%B', '-n', 'l', 'HEAD']
-    args = ['git', 'show', '-s', '--format=%B']
+    args = ['show', '-s', '--format=%B']
 
     # get git output
-    git_output = subprocess.check_output(args, cwd=path)
+    git_output = _git(path, *args)
 
     # remove trailing newline
     git_output = git_output.replace('\n','')
@@ -141,11 +224,15 @@ def get_current_tags_from_path(path):
     :param path: Path to the local Git repo
     :return: List of tag strings
     """
+    tags = _read_native(path, lambda reader: reader.get_tags())
+    if tags is not None:
+        return tags
+
     # build git query
-    args = ['git', 'tag', '-l', '--points-at', 'HEAD']
+    args = ['tag', '-l', '--points-at', 'HEAD']
 
     # get git output
-    git_output = subprocess.check_output(args, cwd=path)
+    git_output = _git(path, *args)
 
     # extract paths from result. Each tag will be seperated by a newline
     tags = [i for i in git_output.split('\n') if i != '']
@@ -160,11 +247,11 @@ def repo_has_uncommitted_changes(path):
     :return: List of tag strings
     """
     # build git query
-    args = ['git', 'diff-index', '--quiet', 'HEAD']
+    args = ['diff-index', '--quiet', 'HEAD']
 
     # get git output
     try:
-        git_output = subprocess.check_output(args, cwd=path)
+        git_output = _git(path, *args)
         return False
     except:
         return True
@@ -178,17 +265,74 @@ def get_current_tag_messages_from_path(path):
     :param path: Path to the local Git repo
     :return: A single string with all tag messages concatenated.
     """
-    tags = get_current_tags_from_path(path)
+    # One for-each-ref call for all of the tags rather than one 'git tag -l' per tag.
+    git_output = _git(path, 'for-each-ref', '--points-at', 'HEAD', '--format=%(contents)%00', 'refs/tags')
+
+    tag_messages = ''.join(git_output.split('\0\n'))
+
+    return tag_messages
+
+
+def get_head_refs(path):
+    """
+    Gathers the branch, HEAD commit, commit message, tags and tag messages of the repo found at path, with
+    one git invocation : 'git for-each-ref --points-at HEAD' lists the current branch (flagged by %(HEAD))
+    with the commit hashes and message, along with the tags on HEAD and their messages.
+    A detached HEAD has no branch ref, so its commit is read with one extra 'git log' call.
+
+    :param path: Path to the local Git repo
+    :return: HeadRefs, the branch is 'HEAD' when detached
+    """
+    output = _git(path, 'for-each-ref', '--points-at', 'HEAD', '--format=%s' % _REF_FORMAT,
+                  'refs/heads', 'refs/tags')
 
+    branch = 'HEAD'
+    commit = commit_short = commit_message = None
+    tags = []
     tag_messages = ''
-    for tag in tags:
 
-        # build git query
-        args = ['git', 'tag', '-l', '--format=\'%(contents)\'', tag]
+    for record in output.split('\0\n'):
+        if not record:
+            continue
 
-        # get git output
-        tag_message = subprocess.check_output(args, cwd=path).split('\'')[1]
+        head, refname, objectname, objectname_short, contents = record.split('\0', 4)
+
+        if refname.startswith('refs/tags/'):
+            tags.append(refname[len('refs/tags/'):])
+            tag_messages += contents
+
+        elif head == '*':
+            branch = refname[len('refs/heads/'):]
+            commit, commit_short, commit_message = objectname, objectname_short, contents
+
+    if commit is None:
+        # Detached HEAD
+        commit, commit_short, commit_message = _git(path, 'log', '-1', '--format=%H%x00%h%x00%B', 'HEAD').split('\0', 2)
+
+    return HeadRefs(branch, commit, commit_short, commit_message, tags, tag_messages)
 
-        tag_messages += tag_message
 
-    return tag_messages
\ No newline at end of file
+def get_git_metadata(path):
+    """
+    Gathers the remote url, branch, HEAD commit, commit message, tags and tag messages of the repo
+    found at path, with two git invocations instead of one per field and one per tag.
+
+    - get_head_refs gives the branch, the commit and the tags on HEAD, with their messages.
+    - 'git config' gives the remote url.
+
+    The values match those returned by the individual get_current_*_from_path functions.
+
+    :param path: Path to the local Git repo
+    :return: GitMetadata
+    """
+    refs = get_head_refs(path)
+    repo_url = _git(path, 'config', '--get', 'remote.origin.url').replace('\n', '')
+
+    return GitMetadata(repo_url=repo_url,
+                       repo_name=get_git_repo_name_from_url(repo_url, sanitize=False),
+                       branch=refs.branch,
+                       commit=refs.commit,
+                       commit_short=refs.commit_short,
+                       commit_comment=refs.commit_message.replace('\n', ''),
+                       tags=refs.tags,
+                       tag_comment=refs.tag_messages)
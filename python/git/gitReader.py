@@ -0,0 +1,458 @@
+"""
+Reads the current branch, HEAD commit, remote url and tags of a git repo straight from its .git folder,
+without starting a git process.
+
+Only plain repos and worktrees using the files ref backend are understood. Anything the reader can't
+answer with certainty (reftable, config includes, quoted config values, deltified tag objects,
+GIT_DIR overrides...) raises UnsupportedError, so callers can fall back to the git CLI.
+"""
+import os
+import re
+import struct
+import zlib
+
+SHA_PATTERN = re.compile('^[0-9a-f]{40}$')
+
+
+class UnsupportedError(Exception):
+    """
+    Raised when a query can't be answered from the .git folder alone.
+    """
+
+
+def _to_str(data):
+    """
+    Returns bytes as the native str type, so results match the CLI's on Python 2 and 3.
+    """
+    return data if isinstance(data, str) else data.decode('utf-8')
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return _to_str(f.read())
+
+
+def find_git_dirs(path):
+    """
+    Finds the git folder of the repo containing path, like git does when run from path.
+
+    :param path: A path inside the work tree
+    :return: (git_dir, common_dir). They only differ for worktrees.
+    """
+    if os.environ.get('GIT_DIR') or os.environ.get('GIT_COMMON_DIR'):
+        raise UnsupportedError('GIT_DIR is set')
+
+    current = os.path.abspath(path)
+    while True:
+        dot_git = os.path.join(current, '.git')
+
+        if os.path.isdir(dot_git):
+            git_dir = dot_git
+            break
+
+        if os.path.isfile(dot_git):
+            content = _read(dot_git).strip()
+            if not content.startswith('gitdir:'):
+                raise UnsupportedError('Unrecognised .git file : %s' % dot_git)
+            git_dir = os.path.normpath(os.path.join(current, content[len('gitdir:'):].strip()))
+            break
+
+        parent = os.path.dirname(current)
+        if parent == current:
+            raise UnsupportedError('No git repo found at %s' % path)
+        current = parent
+
+    common_dir = git_dir
+    commondir_file = os.path.join(git_dir, 'commondir')
+    if os.path.isfile(commondir_file):
+        common_dir = os.path.normpath(os.path.join(git_dir, _read(commondir_file).strip()))
+
+    return git_dir, common_dir
+
+
+def read_config(common_dir):
+    """
+    Parses the repo's config file.
+
+    :return: dict of {(section, subsection, key): [values]}. Section and key names are lowercased.
+    """
+    config = {}
+    config_path = os.path.join(common_dir, 'config')
+    if not os.path.isfile(config_path):
+        return config
+
+    section = subsection = None
+    for line in _read(config_path).splitlines():
+        line = line.strip()
+        if not line or line[0] in '#;':
+            continue
+
+        if line.startswith('['):
+            match = re.match(r'^\[\s*([A-Za-z0-9.-]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]$', line)
+            if not match:
+                raise UnsupportedError('Unsupported config section : %s' % line)
+
+            section, subsection = match.group(1).lower(), match.group(2)
+            if subsection is not None:
+                subsection = re.sub(r'\\(.)', r'\1', subsection)
+
+            if section in ('include', 'includeif'):
+                raise UnsupportedError('Config includes are not supported')
+            continue
+
+        if section is None:
+            raise UnsupportedError('Config value outside of a section : %s' % line)
+
+        if '=' in line:
+            key, value = line.split('=', 1)
+        else:
+            # A key without a value is a boolean true
+            key, value = line, 'true'
+
+        # Quotes, escapes and line continuations need git's own parser.
+        if '"' in value or '\\' in value:
+            raise UnsupportedError('Unsupported config value : %s' % line)
+
+        value = re.split('[#;]', value, 1)[0].strip()
+
+        config.setdefault((section, subsection, key.strip().lower()), []).append(value)
+
+    if config.get(('extensions', None, 'refstorage'), ['files'])[-1] != 'files':
+        raise UnsupportedError('Only the files ref storage is supported')
+
+    return config
+
+
+def read_packed_refs(common_dir):
+    """
+    :return: dict of {refname: (sha, peeled sha or None)}. When the file records peeled values,
+        refs that aren't annotated tags are peeled to themselves.
+    """
+    refs = {}
+    packed_refs_path = os.path.join(common_dir, 'packed-refs')
+    if not os.path.isfile(packed_refs_path):
+        return refs
+
+    traits = []
+    refname = None
+    for line in _read(packed_refs_path).splitlines():
+        if line.startswith('# pack-refs with:'):
+            traits = line[len('# pack-refs with:'):].split()
+            continue
+
+        if not line or line.startswith('#'):
+            continue
+
+        if line.startswith('^'):
+            if refname is not None:
+                refs[refname] = (refs[refname][0], line[1:].strip())
+            continue
+
+        sha, refname = line.split(' ', 1)
+        refs[refname] = (sha, None)
+
+    # With these traits a missing peeled line means the ref doesn't point to a tag object.
+    for refname, (sha, peeled) in refs.items():
+        if peeled is None and ('fully-peeled' in traits or ('peeled' in traits and refname.startswith('refs/tags/'))):
+            refs[refname] = (sha, sha)
+
+    return refs
+
+
+def read_loose_refs(common_dir, prefix):
+    """
+    :return: dict of {refname: sha} of the loose refs under prefix, eg. 'refs/tags'
+    """
+    refs = {}
+    root = os.path.join(common_dir, *prefix.split('/'))
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            file_path = os.path.join(dirpath, filename)
+            refname = prefix + '/' + os.path.relpath(file_path, root).replace(os.sep, '/')
+
+            content = _read(file_path).strip()
+            if content.startswith('ref:'):
+                raise UnsupportedError('Symbolic ref : %s' % refname)
+            refs[refname] = content
+
+    return refs
+
+
+def resolve_ref(git_dir, common_dir, refname, packed_refs=None):
+    """
+    Resolves a ref name to a commit sha, following symbolic refs.
+
+    :return: The sha the ref points to.
+    """
+    for i in range(10):
+        # Per worktree refs (HEAD) live in the git dir, the others in the common dir.
+        ref_path = os.path.join(git_dir if refname == 'HEAD' else common_dir, *refname.split('/'))
+
+        if os.path.isfile(ref_path):
+            content = _read(ref_path).strip()
+        else:
+            if packed_refs is None:
+                packed_refs = read_packed_refs(common_dir)
+            if refname not in packed_refs:
+                raise UnsupportedError('Unable to resolve ref : %s' % refname)
+            content = packed_refs[refname][0]
+
+        if content.startswith('ref:'):
+            refname = content[len('ref:'):].strip()
+            continue
+
+        if not SHA_PATTERN.match(content):
+            raise UnsupportedError('Unrecognised ref content in %s' % refname)
+
+        return content
+
+    raise UnsupportedError('Too many levels of symbolic refs')
+
+
+# Object types as stored in pack files.
+PACK_OBJECT_TYPES = {1: 'commit', 2: 'tree', 3: 'blob', 4: 'tag'}
+
+
+def find_in_pack_index(index_path, sha):
+    """
+    Looks up an object in a version 2 pack index.
+
+    :return: The offset of the object in the pack, or None if it isn't in this pack.
+    """
+    binary_sha = bytearray.fromhex(sha)
+
+    with open(index_path, 'rb') as f:
+        header = f.read(8)
+        if header[:4] != b'\377tOc' or struct.unpack('>I', header[4:])[0] != 2:
+            raise UnsupportedError('Unsupported pack index : %s' % index_path)
+
+        fanout = struct.unpack('>256I', f.read(256 * 4))
+        count = fanout[255]
+        low = fanout[binary_sha[0] - 1] if binary_sha[0] else 0
+        high = fanout[binary_sha[0]]
+
+        names_start = 8 + 256 * 4
+        while low < high:
+            middle = (low + high) // 2
+            f.seek(names_start + middle * 20)
+            name = bytearray(f.read(20))
+
+            if name == binary_sha:
+                offsets_start = names_start + count * 24
+                f.seek(offsets_start + middle * 4)
+                offset = struct.unpack('>I', f.read(4))[0]
+
+                if offset & 0x80000000:
+                    f.seek(offsets_start + count * 4 + (offset & 0x7fffffff) * 8)
+                    offset = struct.unpack('>Q', f.read(8))[0]
+
+                return offset
+            elif name < binary_sha:
+                low = middle + 1
+            else:
+                high = middle
+
+    return None
+
+
+def read_packed_object(common_dir, sha):
+    """
+    Reads an object from the repo's pack files. Deltified objects aren't supported.
+
+    :return: (object type, object body), where the body is only read for tags.
+    """
+    pack_dir = os.path.join(common_dir, 'objects', 'pack')
+    if not os.path.isdir(pack_dir):
+        raise UnsupportedError('Object %s not found' % sha)
+
+    for file_name in os.listdir(pack_dir):
+        if not file_name.endswith('.idx'):
+            continue
+
+        offset = find_in_pack_index(os.path.join(pack_dir, file_name), sha)
+        if offset is None:
+            continue
+
+        with open(os.path.join(pack_dir, file_name[:-4] + '.pack'), 'rb') as f:
+            f.seek(offset)
+            byte = bytearray(f.read(1))[0]
+            object_type = PACK_OBJECT_TYPES.get((byte >> 4) & 7)
+            if object_type is None:
+                raise UnsupportedError('Object %s is deltified' % sha)
+
+            # Skip the variable length size
+            while byte & 0x80:
+                byte = bytearray(f.read(1))[0]
+
+            if object_type != 'tag':
+                return object_type, None
+
+            decompressor = zlib.decompressobj()
+            body = b''
+            while b'\n' not in body:
+                chunk = f.read(4096)
+                if not chunk:
+                    break
+                body += decompressor.decompress(chunk)
+
+            return object_type, body
+
+    raise UnsupportedError('Object %s not found' % sha)
+
+
+def read_object(common_dir, sha):
+    """
+    Reads a loose or packed object.
+
+    :return: (object type, object body). The body of packed objects is only read for tags.
+    """
+    object_path = os.path.join(common_dir, 'objects', sha[:2], sha[2:])
+    if not os.path.isfile(object_path):
+        return read_packed_object(common_dir, sha)
+
+    with open(object_path, 'rb') as f:
+        data = zlib.decompress(f.read())
+
+    header, body = data.split(b'\0', 1)
+    return _to_str(header.split(b' ')[0]), body
+
+
+def get_tag_target(common_dir, sha):
+    """
+    Returns the object an annotated tag points to, or None if sha isn't a tag object.
+    """
+    object_type, body = read_object(common_dir, sha)
+    if object_type != 'tag':
+        return None
+
+    # The first line of a tag object is 'object <sha>'
+    return _to_str(body.split(b'\n', 1)[0].split(b' ')[1])
+
+
+def peel(common_dir, sha):
+    """
+    Follows annotated tags down to the object they finally point to.
+    """
+    for i in range(10):
+        target = get_tag_target(common_dir, sha)
+        if target is None:
+            return sha
+        sha = target
+
+    raise UnsupportedError('Too many levels of tags')
+
+
+class GitRepoReader(object):
+    """
+    Read-only view of a repo's .git folder.
+
+    :param path: A path inside the work tree of the repo.
+    """
+
+    def __init__(self, path):
+        self.git_dir, self.common_dir = find_git_dirs(path)
+        self._packed_refs = None
+        self._config = None
+
+    @property
+    def packed_refs(self):
+        if self._packed_refs is None:
+            self._packed_refs = read_packed_refs(self.common_dir)
+        return self._packed_refs
+
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = read_config(self.common_dir)
+        return self._config
+
+    def get_config_value(self, section, subsection, key):
+        """
+        Returns the last value of a key in the repo's config, like 'git config --get'.
+        """
+        values = self.config.get((section.lower(), subsection, key.lower()))
+        if not values:
+            # It may still be set in the global or system config.
+            raise UnsupportedError('%s.%s.%s is not set in the repo config' % (section, subsection, key))
+        return values[-1]
+
+    def get_head_ref(self):
+        """
+        :return: The full ref name HEAD points to, or None for a detached HEAD.
+        """
+        content = _read(os.path.join(self.git_dir, 'HEAD')).strip()
+        if content.startswith('ref:'):
+            return content[len('ref:'):].strip()
+        return None
+
+    def get_branch(self):
+        """
+        The equivalent of 'git rev-parse --abbrev-ref HEAD'.
+        """
+        # Fails on an unborn branch, like git does.
+        self.get_head_commit()
+        head_ref = self.get_head_ref()
+        if head_ref is None:
+            return 'HEAD'
+
+        if not head_ref.startswith('refs/heads/'):
+            raise UnsupportedError('HEAD points outside of refs/heads : %s' % head_ref)
+
+        branch = head_ref[len('refs/heads/'):]
+
+        # git disambiguates branch names shadowed by another ref.
+        for refname in ('refs/%s' % branch, 'refs/tags/%s' % branch, 'refs/remotes/%s' % branch):
+            if refname in self.packed_refs or os.path.isfile(os.path.join(self.common_dir, *refname.split('/'))):
+                raise UnsupportedError('Ambiguous branch name : %s' % branch)
+
+        return branch
+
+    def get_head_commit(self):
+        """
+        The equivalent of 'git rev-parse HEAD'.
+        """
+        return resolve_ref(self.git_dir, self.common_dir, 'HEAD', self.packed_refs)
+
+    def get_short_commit(self):
+        """
+        The equivalent of 'git rev-parse --short HEAD'.
+        Without an explicit core.abbrev git picks the length from the number of objects, which can't be
+        known cheaply, so that case is left to the CLI.
+        """
+        abbrev = self.config.get(('core', None, 'abbrev'))
+        if not abbrev or not abbrev[-1].isdigit():
+            raise UnsupportedError('core.abbrev is not set to a length')
+
+        return self.get_head_commit()[:max(4, int(abbrev[-1]))]
+
+    def get_remote_url(self, remote='origin'):
+        """
+        The equivalent of 'git config --get remote.<remote>.url'.
+        """
+        return self.get_config_value('remote', remote, 'url')
+
+    def get_tags(self):
+        """
+        The equivalent of 'git tag -l --points-at HEAD'.
+        Before git 2.42 the CLI only dereferenced one level of tag, so it won't list tags of tags.
+
+        :return: Sorted list of tag names
+        """
+        head = self.get_head_commit()
+
+        tags = dict((refname, values) for refname, values in self.packed_refs.items()
+                    if refname.startswith('refs/tags/'))
+        for refname, sha in read_loose_refs(self.common_dir, 'refs/tags').items():
+            tags[refname] = (sha, None)
+
+        result = []
+        for refname, (sha, peeled) in tags.items():
+            if peeled is None:
+                peeled = peel(self.common_dir, sha)
+
+            # Like git 2.42+, tags of tags are matched on the object they finally point to.
+            if sha == head or peeled == head:
+                result.append(refname[len('refs/tags/'):])
+
+        return sorted(result)
@@ -0,0 +1,94 @@
+"""
+Blacksmith VFX multi-repo status scanner
+
+Queries the branch, HEAD commit, dirty state and tags of many git repos concurrently, eg. every repo
+under the pipeline share, and yields the results as they complete. With the cli backend each repo costs
+two git invocations, see gitOps.get_head_refs, the native backend only runs git for the dirty state.
+"""
+import os
+from collections import namedtuple, OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from blPython.git import gitOps
+
+RepoStatus = namedtuple('RepoStatus', ['path', 'branch', 'commit', 'dirty', 'tags', 'error'])
+
+DEFAULT_WORKERS = 8
+
+
+def find_repos(root, max_depth=3):
+    """
+    Finds the git repos under root. Repos aren't searched for nested repos.
+
+    :param root: The folder to search
+    :param max_depth: How many folder levels below root to search
+    :return: Sorted list of repo paths
+    """
+    repos = []
+    root = os.path.abspath(root)
+    root_depth = root.rstrip(os.sep).count(os.sep)
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        if '.git' in dirnames or '.git' in filenames:
+            repos.append(dirpath)
+            del dirnames[:]
+            continue
+
+        if dirpath.rstrip(os.sep).count(os.sep) - root_depth >= max_depth:
+            del dirnames[:]
+
+    return sorted(repos)
+
+
+def get_repo_status(path):
+    """
+    Returns the status of a single repo. Errors are reported in the result rather than raised.
+
+    :param path: Path to the local Git repo
+    :return: RepoStatus
+    """
+    try:
+        if gitOps.BACKEND == 'native':
+            # Read from the .git folder, without starting git
+            branch = gitOps.get_current_git_branch_from_path(path, strip_parent=False)
+            commit = gitOps.get_current_commit_hash_from_path(path, short=False)
+            tags = gitOps.get_current_tags_from_path(path)
+        else:
+            refs = gitOps.get_head_refs(path)
+            branch, commit, tags = refs.branch, refs.commit, refs.tags
+
+        return RepoStatus(path=path, branch=branch, commit=commit, dirty=gitOps.repo_has_uncommitted_changes(path),
+                          tags=tags, error=None)
+    except Exception as e:
+        return RepoStatus(path=path, branch=None, commit=None, dirty=None, tags=None, error=str(e))
+
+
+def scan(paths, workers=DEFAULT_WORKERS):
+    """
+    Queries the status of several repos on a bounded pool of threads.
+
+    :param paths: list of repo paths
+    :param workers: The maximum number of repos queried at once
+    :return: Generator of RepoStatus, in the order they complete
+    """
+    pool = ThreadPool(max(1, min(workers, len(paths) or 1)))
+    try:
+        for status in pool.imap_unordered(get_repo_status, paths):
+            yield status
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def scan_root(root, workers=DEFAULT_WORKERS, max_depth=3):
+    """
+    Finds the repos under root and scans them.
+
+    :return: Generator of RepoStatus, in the order they complete
+    """
+    return scan(find_repos(root, max_depth=max_depth), workers=workers)
+
+
+def status_to_dict(status):
+    return OrderedDict(zip(status._fields, status))
@@ -0,0 +1,279 @@
+"""
+Blacksmith VFX release copy pipeline
+
+Copies a release in phases, each timed:
+
+- scan: list the folders and files to release
+- hash: sha256 every source file, building the release manifest
+- copy: copy the files on a bounded pool of threads. Large files are split in chunks copied in parallel,
+  which keeps several requests in flight on latency bound network shares.
+- verify: hash every destination file and check it against the manifest
+
+The manifest and timings are written to the release as release_manifest.json.
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import time
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'release_manifest.json'
+MANIFEST_VERSION = 1
+
+DEFAULT_WORKERS = 8
+
+# Files above LARGE_FILE_SIZE are copied as CHUNK_SIZE chunks.
+LARGE_FILE_SIZE = 64 * 1024 * 1024
+CHUNK_SIZE = 16 * 1024 * 1024
+
+# Size of the reads and writes.
+BUFFER_SIZE = 1024 * 1024
+
+ManifestEntry = namedtuple('ManifestEntry', ['path', 'size', 'sha256', 'executable'])
+CopyJob = namedtuple('CopyJob', ['src', 'dest', 'size'])
+CopyTask = namedtuple('CopyTask', ['src', 'dest', 'offset', 'length'])
+
+
+class PhaseTimer(object):
+    """
+    Records the duration of named phases, in the order they ran.
+    """
+
+    def __init__(self):
+        self.timings = OrderedDict()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(self.timings.get(name, 0.0) + time.time() - start, 3)
+
+
+def run_tasks(function, items, workers=DEFAULT_WORKERS):
+    """
+    Maps function over items on a bounded pool of threads.
+
+    :return: list of results, in the order of items
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        results = pool.map(function, items)
+        pool.close()
+        return results
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def hash_file(path):
+    """
+    :return: sha256 hex digest of the file's content
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(BUFFER_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def is_executable(path):
+    return bool(os.stat(path).st_mode & 0o111)
+
+
+def walk(path, ignore_dirs=()):
+    """
+    Lists the folders and files under path, in a deterministic order. Folder symlinks are followed
+    like shutil.copytree does.
+
+    :param ignore_dirs: Folder names excluded at any depth
+    :return: (list of relative folder paths, list of (relative file path, absolute file path))
+    """
+    if not os.path.isdir(path):
+        raise ValueError('Path is not a valid directory.')
+
+    directories = []
+    files = []
+    for root, dirs, file_names in os.walk(path, followlinks=True):
+        dirs[:] = sorted(d for d in dirs if d not in ignore_dirs)
+
+        folder = os.path.relpath(root, path)
+        if folder != os.curdir:
+            directories.append(folder.replace(os.sep, '/'))
+
+        for file_name in sorted(file_names):
+            relative_path = file_name if folder == os.curdir else os.path.join(folder, file_name)
+            files.append((relative_path.replace(os.sep, '/'), os.path.join(root, file_name)))
+
+    return directories, files
+
+
+def hash_files(files, workers=DEFAULT_WORKERS):
+    """
+    Hashes files in parallel.
+
+    :param files: list of (relative path, absolute path) as returned by walk
+    :return: list of ManifestEntry
+    """
+    def get_entry(item):
+        relative_path, file_path = item
+        return ManifestEntry(relative_path, os.path.getsize(file_path), hash_file(file_path), is_executable(file_path))
+
+    return run_tasks(get_entry, files, workers)
+
+
+def get_path(root, relative_path):
+    return os.path.join(root, *relative_path.split('/'))
+
+
+def get_copy_tasks(job, large_file_size=LARGE_FILE_SIZE, chunk_size=CHUNK_SIZE):
+    """
+    Splits a copy in to tasks, large files get a task per chunk.
+    """
+    if job.size <= large_file_size:
+        return [CopyTask(job.src, job.dest, 0, None)]
+
+    return [CopyTask(job.src, job.dest, offset, min(chunk_size, job.size - offset))
+            for offset in range(0, job.size, chunk_size)]
+
+
+def copy_task(task):
+    """
+    Copies a whole file, or a chunk of it in to a destination file that already exists.
+    """
+    if task.length is None:
+        with open(task.src, 'rb') as src, open(task.dest, 'wb') as dest:
+            shutil.copyfileobj(src, dest, BUFFER_SIZE)
+        return
+
+    with open(task.src, 'rb') as src, open(task.dest, 'r+b') as dest:
+        src.seek(task.offset)
+        dest.seek(task.offset)
+        remaining = task.length
+        while remaining > 0:
+            data = src.read(min(BUFFER_SIZE, remaining))
+            if not data:
+                raise IOError('%s was truncated while being copied' % task.src)
+            dest.write(data)
+            remaining -= len(data)
+
+
+def copy_files(jobs, workers=DEFAULT_WORKERS, large_file_size=LARGE_FILE_SIZE, chunk_size=CHUNK_SIZE):
+    """
+    Copies files on a bounded pool of threads. The file contents are copied, not their metadata.
+
+    :param jobs: list of CopyJob
+    """
+    tasks = []
+    for job in jobs:
+        job_tasks = get_copy_tasks(job, large_file_size=large_file_size, chunk_size=chunk_size)
+        if len(job_tasks) > 1:
+            # Allocate the destination so every chunk can be written in place.
+            with open(job.dest, 'wb') as f:
+                f.truncate(job.size)
+        tasks += job_tasks
+
+    run_tasks(copy_task, tasks, workers)
+
+
+def verify_files(root, entries, workers=DEFAULT_WORKERS):
+    """
+    Checks the files under root against their manifest entries.
+
+    :raises RuntimeError: Listing the files that are missing or don't match
+    """
+    def is_valid(entry):
+        path = get_path(root, entry.path)
+        return (os.path.isfile(path) and os.path.getsize(path) == entry.size and
+                hash_file(path) == entry.sha256)
+
+    invalid = [entry.path for entry, valid in zip(entries, run_tasks(is_valid, entries, workers)) if not valid]
+    if invalid:
+        raise RuntimeError('Release verification failed for : %s' % ', '.join(invalid))
+
+
+def build_manifest(source, directories, entries, stats, timings):
+    manifest = OrderedDict()
+    manifest['version'] = MANIFEST_VERSION
+    manifest['source'] = source
+    manifest['stats'] = stats
+    manifest['timings'] = timings
+    manifest['directories'] = directories
+    manifest['files'] = [OrderedDict(zip(entry._fields, entry)) for entry in entries]
+    return manifest
+
+
+def make_dirs(dest, directories):
+    if not os.path.isdir(dest):
+        os.makedirs(dest)
+    for directory in directories:
+        path = get_path(dest, directory)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+
+def copy_tree(source, dest, ignore_dirs=(), workers=DEFAULT_WORKERS, verify=True,
+              large_file_size=LARGE_FILE_SIZE, chunk_size=CHUNK_SIZE):
+    """
+    Copies the release at source to dest, see the module docstring for the phases.
+
+    :param source: The folder to release, eg. a repo checkout
+    :param dest: The release folder to create, it must not exist yet
+    :param ignore_dirs: Folder names excluded at any depth
+    :param workers: The maximum number of files hashed or copied at once
+    :param verify: Check every copied file against the manifest
+    :return: The manifest dict, also written to dest as release_manifest.json
+    """
+    if os.path.exists(dest):
+        raise RuntimeError('Release path already exists : %s' % dest)
+
+    timer = PhaseTimer()
+    with timer.phase('scan'):
+        directories, files = walk(source, ignore_dirs=ignore_dirs)
+
+    with timer.phase('hash'):
+        entries = hash_files(files, workers)
+
+    with timer.phase('copy'):
+        make_dirs(dest, directories)
+        copy_files([CopyJob(get_path(source, entry.path), get_path(dest, entry.path), entry.size) for entry in entries],
+                   workers, large_file_size=large_file_size, chunk_size=chunk_size)
+
+        # Keep the modes and modification times like shutil.copytree
+        for entry in entries:
+            shutil.copystat(get_path(source, entry.path), get_path(dest, entry.path))
+
+    if verify:
+        with timer.phase('verify'):
+            verify_files(dest, entries, workers)
+
+    stats = OrderedDict([('files', len(entries)),
+                         ('bytes', sum(entry.size for entry in entries)),
+                         ('workers', workers),
+                         ('verified', verify)])
+    manifest = build_manifest(source, directories, entries, stats, timer.timings)
+    write_manifest(dest, manifest)
+
+    logger.debug('. Copied %s files to %s : %s' % (len(entries), dest, dict(timer.timings)))
+    return manifest
+
+
+def read_manifest(release_path):
+    with open(os.path.join(release_path, MANIFEST_NAME)) as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
+
+
+def write_manifest(release_path, manifest):
+    with open(os.path.join(release_path, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
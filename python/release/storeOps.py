@@ -0,0 +1,238 @@
+"""
+Blacksmith VFX content-addressed release store
+
+Every released file is stored once, under the sha256 of its content, in an object store at the
+release root. A release folder is then materialized from the store with hardlinks, reflinks where the
+filesystem supports copy-on-write clones, or plain copies as a last resort, and described by a
+release_manifest.json written into it.
+
+Releasing a branch that only changed a few files therefore only adds those files to the store, the
+rest of the release is links to objects that are already there.
+
+Objects are made read-only. A hardlinked release file is the object, so released files must never be
+edited in place.
+"""
+import os
+import stat
+import errno
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+
+from blPython.release import copyOps
+
+logger = logging.getLogger(__name__)
+
+# The ways a release file can be created from its object, in the order 'auto' tries them.
+METHODS = ('hardlink', 'reflink', 'copy')
+
+# Linux ioctl cloning a file's extents on copy-on-write filesystems, eg. btrfs or xfs.
+FICLONE = 0x40049409
+
+
+def reflink(src, dest):
+    """
+    Clones src to dest sharing its data blocks, on filesystems that support it.
+
+    :raises OSError: If the platform or filesystem can't clone files
+    """
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks are not supported on this platform')
+
+    with open(src, 'rb') as src_file:
+        with open(dest, 'wb') as dest_file:
+            try:
+                fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+                return
+            except (IOError, OSError) as e:
+                # Python 2 raises IOError from ioctl
+                error = OSError(e.errno, e.strerror)
+
+    os.remove(dest)
+    raise error
+
+
+class ObjectStore(object):
+    """
+    Content-addressed store of release files.
+
+    :param path: The store folder, eg. <release root>/_store
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.objects_path = os.path.join(path, 'objects')
+
+    def get_object_path(self, digest, executable=False):
+        """
+        Executable files are stored apart from identical non executable ones, the links share the object's mode.
+        """
+        return os.path.join(self.objects_path, digest[:2], digest[2:] + ('.x' if executable else ''))
+
+    def has(self, digest, executable=False):
+        return os.path.isfile(self.get_object_path(digest, executable))
+
+    def get_tmp_path(self, digest, executable=False):
+        """
+        Objects are written to a temporary file first, so an interrupted release never leaves a partial object behind.
+        """
+        object_path = self.get_object_path(digest, executable)
+        object_folder = os.path.dirname(object_path)
+        try:
+            os.makedirs(object_folder)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        return '%s.%s.%s.tmp' % (object_path, os.getpid(), threading.current_thread().ident)
+
+    def commit(self, tmp_path, digest, executable=False):
+        """
+        Moves a fully written temporary file in to place as the object.
+        """
+        object_path = self.get_object_path(digest, executable)
+        os.chmod(tmp_path, 0o555 if executable else 0o444)
+
+        try:
+            os.rename(tmp_path, object_path)
+        except OSError:
+            # Another release stored the same content first (Windows doesn't rename over files).
+            os.chmod(tmp_path, stat.S_IWRITE)
+            os.remove(tmp_path)
+            if not os.path.isfile(object_path):
+                raise
+
+    def add(self, path, digest=None, executable=None):
+        """
+        Adds a file to the store, unless its content is already stored.
+
+        :param digest: The file's sha256, hashed from the file if not given
+        :param executable: Whether the file is executable, read from the file if not given
+        :return: True if a new object was written
+        """
+        digest = digest or copyOps.hash_file(path)
+        executable = copyOps.is_executable(path) if executable is None else executable
+
+        if self.has(digest, executable):
+            return False
+
+        tmp_path = self.get_tmp_path(digest, executable)
+        shutil.copyfile(path, tmp_path)
+        self.commit(tmp_path, digest, executable)
+        return True
+
+    def add_entries(self, source, entries, workers=copyOps.DEFAULT_WORKERS):
+        """
+        Adds the manifest entries that aren't stored yet, copying them in parallel.
+
+        :param source: The folder the entry paths are relative to
+        :param entries: list of copyOps.ManifestEntry
+        :return: list of the entries that were added
+        """
+        new_entries = OrderedDict()
+        for entry in entries:
+            key = (entry.sha256, entry.executable)
+            if key not in new_entries and not self.has(*key):
+                new_entries[key] = entry
+
+        jobs = [copyOps.CopyJob(copyOps.get_path(source, entry.path), self.get_tmp_path(*key), entry.size)
+                for key, entry in new_entries.items()]
+        copyOps.copy_files(jobs, workers)
+
+        for job, (key, entry) in zip(jobs, new_entries.items()):
+            self.commit(job.dest, *key)
+
+        return list(new_entries.values())
+
+    def materialize(self, digest, executable, dest, method='auto'):
+        """
+        Creates dest from a stored object.
+
+        :param method: 'hardlink', 'reflink' or 'copy', or 'auto' to use the first one that works
+        :return: The method used
+        """
+        object_path = self.get_object_path(digest, executable)
+        methods = METHODS if method == 'auto' else (method,)
+
+        for current_method in methods:
+            try:
+                if current_method == 'hardlink':
+                    if not hasattr(os, 'link'):
+                        # Python 2 on Windows
+                        continue
+                    os.link(object_path, dest)
+                elif current_method == 'reflink':
+                    reflink(object_path, dest)
+                    os.chmod(dest, 0o755 if executable else 0o644)
+                else:
+                    shutil.copyfile(object_path, dest)
+                    os.chmod(dest, 0o755 if executable else 0o644)
+                return current_method
+
+            except OSError as e:
+                if current_method == methods[-1]:
+                    raise
+                logger.debug('. Unable to %s %s : %s' % (current_method, dest, e))
+
+        raise OSError(errno.EOPNOTSUPP, 'Unable to create %s from the store' % dest)
+
+    def release(self, source, dest, ignore_dirs=(), method='auto', workers=copyOps.DEFAULT_WORKERS, verify=True):
+        """
+        Stores the files under source and materializes them as the release folder dest.
+
+        The release runs in timed phases, see copyOps : scan, hash, store (new objects only), materialize and verify.
+
+        :param source: The folder to release, eg. a repo checkout
+        :param dest: The release folder to create, it must not exist yet
+        :param ignore_dirs: Folder names excluded at any depth
+        :param method: How release files are created from their objects, see materialize
+        :param workers: The maximum number of files hashed, copied or linked at once
+        :param verify: Check the release files against the manifest. Files hardlinked to objects that were already
+            stored are skipped, they are the object itself and were checked when it was released first.
+        :return: The manifest dict, also written to dest as release_manifest.json
+        """
+        if os.path.exists(dest):
+            raise RuntimeError('Release path already exists : %s' % dest)
+
+        timer = copyOps.PhaseTimer()
+        with timer.phase('scan'):
+            directories, files = copyOps.walk(source, ignore_dirs=ignore_dirs)
+
+        with timer.phase('hash'):
+            entries = copyOps.hash_files(files, workers)
+
+        with timer.phase('store'):
+            added = self.add_entries(source, entries, workers)
+
+        with timer.phase('materialize'):
+            copyOps.make_dirs(dest, directories)
+            used = copyOps.run_tasks(
+                lambda entry: self.materialize(entry.sha256, entry.executable, copyOps.get_path(dest, entry.path), method),
+                entries, workers)
+
+        checked = []
+        if verify:
+            added_keys = set((entry.sha256, entry.executable) for entry in added)
+            checked = [entry for entry, used_method in zip(entries, used)
+                       if used_method != 'hardlink' or (entry.sha256, entry.executable) in added_keys]
+            with timer.phase('verify'):
+                copyOps.verify_files(dest, checked, workers)
+
+        stats = OrderedDict([('files', len(entries)),
+                             ('bytes', sum(entry.size for entry in entries)),
+                             ('new_objects', len(added)),
+                             ('new_bytes', sum(entry.size for entry in added)),
+                             ('methods', dict((m, used.count(m)) for m in METHODS)),
+                             ('workers', workers),
+                             ('verified', verify),
+                             ('verified_files', len(checked))])
+        manifest = copyOps.build_manifest(source, directories, entries, stats, timer.timings)
+        manifest['store'] = self.path
+        copyOps.write_manifest(dest, manifest)
+
+        logger.debug('. Released %s files to %s, %s new objects : %s' % (
+            len(entries), dest, len(added), dict(timer.timings)))
+        return manifest
@@ -0,0 +1,244 @@
+"""
+Blacksmith VFX release uploads
+
+Uploads release packages to SG file fields, eg. PipelineConfiguration.uploaded_config :
+
+- The upload is skipped when the field already holds an Attachment with the package's archive digest,
+  see zipOps, so re-running a release whose upload went through but whose SG updates didn't never
+  uploads the package twice.
+- Uploads failing on a network or server error are retried with exponential backoff. Local file errors,
+  eg. a permission error reading the package, aren't retried.
+- Before each retry the field is checked for the package, see find_earlier_upload, so an attempt that
+  failed after SG stored the file, eg. on a read timeout, isn't uploaded twice.
+- A progress callback is called as the upload goes through its states, with the bytes sent and the
+  transfer rate.
+
+shotgun_api3 uploads a file in a single call, splitting large files in to parts internally. It neither
+reports progress within that call nor resumes a partial upload, so progress is reported per attempt and
+a retried upload starts over.
+"""
+import os
+import time
+import errno
+import socket
+import logging
+from collections import namedtuple, OrderedDict
+
+try:
+    from http.client import HTTPException
+except ImportError:
+    from httplib import HTTPException
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETRIES = 3
+
+# Seconds to wait before the first retry, doubled for each retry after it.
+DEFAULT_BACKOFF = 2.0
+
+# errnos of local file errors, which a retry wouldn't fix.
+LOCAL_ERRNOS = (errno.ENOENT, errno.EACCES, errno.EPERM, errno.EISDIR, errno.ENOTDIR)
+
+# Release report fields left out of the Attachment metadata, see get_attachment_metadata.
+METADATA_EXCLUDED_FIELDS = ('file_digests',)
+
+# The states an upload reports progress for.
+STARTED = 'started'
+UPLOADED = 'uploaded'
+RETRYING = 'retrying'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class UploadProgress(namedtuple('UploadProgress', ['state', 'path', 'bytes_sent', 'total', 'attempt', 'seconds'])):
+    """
+    Progress of an upload, passed to the progress callback. seconds is the time spent on the current attempt.
+    """
+    __slots__ = ()
+
+    @property
+    def mb_per_second(self):
+        return self.bytes_sent / (1024.0 * 1024.0) / self.seconds if self.seconds else 0.0
+
+
+class UploadResult(namedtuple('UploadResult', ['attachment_id', 'skipped', 'attempts', 'size', 'seconds'])):
+    """
+    Summary of an upload. seconds is the time spent on the attempt that succeeded.
+    """
+    __slots__ = ()
+
+    @property
+    def mb_per_second(self):
+        if self.skipped or not self.seconds:
+            return 0.0
+        return self.size / (1024.0 * 1024.0) / self.seconds
+
+
+def log_upload_progress(progress, log=logger):
+    """
+    Logs the progress of an upload, eg. as the progress callback of upload with the logger of the calling tool:
+    functools.partial(log_upload_progress, log=logger)
+
+    :param progress: UploadProgress
+    :param log: The logger to log to
+    """
+    file_name = os.path.basename(progress.path)
+    if progress.state == SKIPPED:
+        log.info('. %s is already uploaded, skipping the upload.' % file_name)
+    elif progress.state == STARTED:
+        log.info('. Uploading %s, %.1f MB (attempt %s)' % (file_name, progress.total / (1024.0 * 1024.0), progress.attempt))
+    elif progress.state == UPLOADED:
+        log.info('. Uploaded %s in %.2fs (%.1f MB/s)' % (file_name, progress.seconds, progress.mb_per_second))
+    else:
+        log.warning('. Upload of %s %s after %.2fs (attempt %s)' % (file_name, progress.state, progress.seconds,
+                                                                  progress.attempt))
+
+
+def get_retry_errors():
+    """
+    :return: The exception types an upload is retried on : network errors and SG server errors.
+    """
+    errors = [IOError, OSError, socket.error, HTTPException]
+    try:
+        import shotgun_api3
+        errors.append(shotgun_api3.ProtocolError)
+    except (ImportError, AttributeError):
+        pass
+    return tuple(errors)
+
+
+def is_local_error(error):
+    """
+    :return: True if error is a local file error, eg. a missing package or a permission error, rather than a
+        network error. Socket errors are OSErrors on Python 3, so they are told apart by their errno and filename.
+    """
+    return isinstance(error, EnvironmentError) and (error.errno in LOCAL_ERRNOS or bool(error.filename))
+
+
+def get_attachment_metadata(report_data):
+    """
+    Returns the release report fields stored as a package Attachment's metadata : every field but the per file
+    digests, which stay in the report inside the package. find_uploaded only needs the archive digest.
+
+    :param report_data: The release report dict
+    :return: OrderedDict
+    """
+    return OrderedDict((key, value) for key, value in report_data.items() if key not in METADATA_EXCLUDED_FIELDS)
+
+
+def find_uploaded(sg, attachment, archive_digest, display_name=None):
+    """
+    Checks whether an Attachment is a package with the given archive digest. The digest is part of the
+    release report stored as the Attachment's metadata.
+
+    SG is only queried if the attachment dict could hold the package but doesn't have its metadata : a file field
+    value has the Attachment's name, so an Attachment named after another package, eg. the previous release,
+    doesn't match.
+
+    :param attachment: The Attachment entity dict held by a file field, or None
+    :param display_name: The package's Attachment name
+    :return: The Attachment id, or None if it doesn't match
+    """
+    if not attachment or not archive_digest or not attachment.get('id'):
+        return None
+
+    if 'metadata' in attachment:
+        return attachment['id'] if archive_digest in (attachment['metadata'] or '') else None
+
+    if display_name and attachment.get('name') and attachment['name'] != display_name:
+        return None
+
+    result = sg.find_one('Attachment', [['id', 'is', attachment['id']], ['metadata', 'contains', archive_digest]])
+    return result['id'] if result else None
+
+
+def find_earlier_upload(sg, entity_type, entity_id, field_name, display_name, archive_digest=None, current=None):
+    """
+    Checks whether a failed upload went through anyway, eg. a read timeout after SG stored the file. The field
+    holds the package if its Attachment has the package's archive digest or, as the metadata of a new Attachment
+    is only set after the upload, if it replaced current and has the package's name.
+
+    :param current: The Attachment the field held before the upload
+    :return: The Attachment id, or None if the package isn't there
+    """
+    entity = sg.find_one(entity_type, [['id', 'is', entity_id]], [field_name])
+    attachment = entity.get(field_name) if entity else None
+    if not attachment:
+        return None
+
+    attachment_id = find_uploaded(sg, attachment, archive_digest, display_name)
+    if attachment_id is not None:
+        return attachment_id
+
+    if current and attachment.get('id') == current.get('id'):
+        return None
+    return attachment['id'] if attachment.get('name') == display_name else None
+
+
+def upload(sg, entity_type, entity_id, path, field_name, display_name=None, archive_digest=None, current=None,
+           retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, progress=None, retry_errors=None, sleep=time.sleep):
+    """
+    Uploads a file to an entity's file field, see the module docstring.
+
+    :param sg: SG connection
+    :param path: The file to upload
+    :param field_name: The file field to upload to, eg. 'uploaded_config'
+    :param display_name: The Attachment name, by default the file name
+    :param archive_digest: The package's archive digest. If given, the upload is skipped when current matches it.
+    :param current: The Attachment the field currently holds, as returned by a find of the entity, optionally with
+        its metadata, see find_uploaded
+    :param retries: How many times a failed upload is retried
+    :param backoff: Seconds to wait before the first retry, doubled for each retry after it
+    :param progress: Optional callable(UploadProgress)
+    :param retry_errors: The exception types to retry on, see get_retry_errors
+    :param sleep: Called with the seconds to wait between attempts
+    :return: UploadResult
+    :raises: The last error once the retries are exhausted, or any error that isn't retried
+    """
+    size = os.path.getsize(path)
+    display_name = display_name or os.path.basename(path)
+    retry_errors = retry_errors or get_retry_errors()
+
+    def report(state, bytes_sent, attempt, seconds):
+        if progress is not None:
+            progress(UploadProgress(state, path, bytes_sent, size, attempt, seconds))
+
+    attachment_id = find_uploaded(sg, current, archive_digest, display_name)
+    if attachment_id is not None:
+        report(SKIPPED, 0, 0, 0.0)
+        return UploadResult(attachment_id, True, 0, size, 0.0)
+
+    attempt = 0
+    while True:
+        attempt += 1
+        start = time.time()
+        report(STARTED, 0, attempt, 0.0)
+        try:
+            attachment_id = sg.upload(entity_type, entity_id, path, field_name=field_name, display_name=display_name)
+        except retry_errors as e:
+            if is_local_error(e):
+                raise
+
+            if attempt > retries:
+                report(FAILED, 0, attempt, time.time() - start)
+                raise
+
+            delay = backoff * 2 ** (attempt - 1)
+            logger.debug('. Upload of %s failed (attempt %s), retrying in %ss : %s' % (path, attempt, delay, e))
+            report(RETRYING, 0, attempt, time.time() - start)
+            sleep(delay)
+
+            try:
+                attachment_id = find_earlier_upload(sg, entity_type, entity_id, field_name, display_name,
+                                                    archive_digest, current)
+            except retry_errors as e:
+                logger.debug('. Unable to check for an earlier upload of %s : %s' % (path, e))
+                continue
+
+            if attachment_id is None:
+                continue
+            logger.debug('. Upload of %s went through on attempt %s' % (path, attempt))
+
+        seconds = time.time() - start
+        report(UPLOADED, size, attempt, seconds)
+        return UploadResult(attachment_id, False, attempt, size, seconds)
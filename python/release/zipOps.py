@@ -0,0 +1,893 @@
+"""
+Blacksmith VFX release packaging
+
+Builds release zips with the members compressed on a pool of threads. zlib releases the GIL while it
+compresses, so the members are deflated in parallel, then written into the archive, pre-compressed,
+in a deterministic order.
+
+Given the previous release zip, members that haven't changed since are copied across as their raw
+compressed bytes and only the changed files are compressed. Zip doesn't record the compression level,
+so the level of the previous release is read from its report, see read_level.
+
+Each file is read once: the same read feeds its CRC32, its SHA-256 and the compressor. The member
+digests and an archive digest derived from them are returned with the zip stats.
+
+The compression is chosen per member, see parse_compression : 'auto' deflates text but stores formats
+that are already compressed, eg. images, which deflate would spend time on for no gain.
+
+zipgit builds the zip from a commit instead of the working copy, streaming 'git archive' through the
+same engine, so only tracked content is released.
+
+Writing pre-compressed members goes through zipfile internals, see open_member, which is only done on
+the interpreters in TESTED_VERSIONS. On others RAW_WRITES is False: the workers only read and hash the
+members, they are compressed by ZipFile.writestr on the writing thread and none are reused.
+"""
+import io
+import os
+import sys
+import time
+import json
+import stat
+import struct
+import tarfile
+import subprocess
+import zlib
+import zipfile
+import hashlib
+import logging
+import multiprocessing
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IGNORE_DIRS = ['.git', '.idea']
+
+# Files above this size are streamed into the archive on the writing thread, rather than being held
+# in memory by a worker.
+LARGE_FILE_SIZE = 64 * 1024 * 1024
+
+# The most uncompressed data handed to the workers at once.
+MAX_BATCH_SIZE = 256 * 1024 * 1024
+
+# Size of the reads when streaming files and copying raw members from a previous archive.
+CHUNK_SIZE = 1024 * 1024
+
+# Compressions accepted by parse_compression, besides 'auto'.
+COMPRESSION_TYPES = OrderedDict([('store', zipfile.ZIP_STORED),
+                                 ('deflate', zipfile.ZIP_DEFLATED),
+                                 ('bzip2', getattr(zipfile, 'ZIP_BZIP2', 12)),
+                                 ('lzma', getattr(zipfile, 'ZIP_LZMA', 14))])
+COMPRESSION_NAMES = list(COMPRESSION_TYPES) + ['auto']
+
+# Formats that are already compressed, 'auto' compression stores them as they are.
+STORED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.exr', '.ico', '.icns', '.webp', '.mov', '.mp4', '.mp3',
+                     '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.whl', '.egg', '.jar')
+
+# The interpreters open_member is tested on, its zipfile internals differ between Python 2 and 3.
+TESTED_VERSIONS = [(2, 7), (3, 6), (3, 7), (3, 8), (3, 9), (3, 10), (3, 11), (3, 12), (3, 13)]
+
+PY2 = sys.version_info[0] == 2
+
+ZipMember = namedtuple('ZipMember', ['path', 'arcname', 'size'])
+
+
+class Compression(namedtuple('Compression', ['compress_type', 'level', 'stored_extensions'])):
+    """
+    How the members of a zip are compressed. Members with one of stored_extensions are stored, the others use
+    compress_type at level, None for the default level.
+    """
+    __slots__ = ()
+
+    def get_compress_type(self, arcname):
+        if self.stored_extensions and os.path.splitext(arcname)[1].lower() in self.stored_extensions:
+            return zipfile.ZIP_STORED
+        return self.compress_type
+
+
+class ZipStats(namedtuple('ZipStats', ['files', 'bytes_in', 'bytes_out', 'seconds', 'reused', 'digests',
+                                         'level'])):
+    """
+    Summary of a zip run. bytes_in is the uncompressed size of the members, bytes_out their size in the archive,
+    reused the number of members copied from the previous archive, digests an OrderedDict of
+    {arcname: sha256} of the members, in archive order, and level the compression level of the compressed
+    members, None for the default level.
+    """
+    __slots__ = ()
+
+    @property
+    def mb_per_second(self):
+        return self.bytes_in / (1024.0 * 1024.0) / self.seconds if self.seconds else 0.0
+
+    @property
+    def ratio(self):
+        return float(self.bytes_out) / self.bytes_in if self.bytes_in else 1.0
+
+    @property
+    def archive_digest(self):
+        return get_archive_digest(self.digests)
+
+
+def parse_compression(value):
+    """
+    Parses a compression option : 'store', 'deflate', 'bzip2', 'lzma' or 'auto', optionally followed by a level,
+    eg. 'deflate:9'. 'auto' deflates every member except the formats in STORED_EXTENSIONS, which are stored.
+
+    :return: Compression
+    :raises ValueError: If the compression or its level isn't supported
+    """
+    name, _, level = value.lower().partition(':')
+    if name not in COMPRESSION_NAMES:
+        raise ValueError('Unknown compression %s, expected one of : %s' % (name, ', '.join(COMPRESSION_NAMES)))
+
+    compress_type = COMPRESSION_TYPES.get(name, zipfile.ZIP_DEFLATED)
+    if compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)  and PY2:
+        raise ValueError('%s compression requires Python 3' % name)
+
+    if not level:
+        level = None
+    elif compress_type in (zipfile.ZIP_STORED, COMPRESSION_TYPES['lzma']):
+        raise ValueError('%s compression has no level' % name)
+    else:
+        minimum = 0 if compress_type == zipfile.ZIP_DEFLATED else 1
+        if not level.isdigit() or not minimum <= int(level) <= 9:
+            raise ValueError('%s compression level must be %s to 9, not %s' % (name, minimum, level))
+        level = int(level)
+
+    return Compression(compress_type, level, STORED_EXTENSIONS if name == 'auto' else ())
+
+
+def get_compression(ziph, compression=None):
+    """
+    :return: compression, or the Compression of an open zipfile if it is None
+    """
+    if compression is not None:
+        return compression
+    return Compression(ziph.compression, getattr(ziph, 'compresslevel', None), ())
+
+
+def set_compress_type(zinfo, compress_type):
+    zinfo.compress_type = compress_type
+    if compress_type == COMPRESSION_TYPES['lzma']:
+        # The lzma data ends with an end of stream marker, flagged like zipfile does.
+        zinfo.flag_bits |= 0x02
+
+
+def supports_raw_writes():
+    """
+    :return: True if pre-compressed members can be written on this interpreter, see open_member.
+    """
+    if tuple(sys.version_info[:2]) not in TESTED_VERSIONS:
+        return False
+
+    names = ['_writecheck', '_didModify', 'filelist', 'NameToInfo', 'fp']
+    if not PY2:
+        names += ['start_dir', '_writing', '_lock']
+
+    ziph = zipfile.ZipFile(io.BytesIO(), 'w')
+    try:
+        return all(hasattr(ziph, name) for name in names)
+    finally:
+        ziph.close()
+
+
+RAW_WRITES = supports_raw_writes()
+
+
+def get_default_workers():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def get_archive_digest(digests):
+    """
+    Digest of an archive's content, the sha256 of its sorted 'sha256sum' style listing:
+    '<member sha256>  <arcname>' lines. It doesn't depend on the compression or the member order.
+
+    :param digests: dict of {arcname: sha256}
+    """
+    listing = ''.join('%s  %s\n' % (digests[arcname], arcname) for arcname in sorted(digests))
+    return hashlib.sha256(listing.encode('utf-8')).hexdigest()
+
+
+def read_report(ziph, name):
+    """
+    Reads the json report member of a release zip, eg. package_info.json.
+
+    :return: dict, empty if the archive has no report
+    """
+    try:
+        return json.loads(ziph.read(name).decode('utf-8'))
+    except (KeyError, ValueError):
+        return {}
+
+
+def read_digests(ziph, name):
+    """
+    Reads the member digests of a release zip from its json report member, see read_report.
+
+    :return: dict of {arcname: sha256}, empty if the archive has no digests
+    """
+    return read_report(ziph, name).get('file_digests') or {}
+
+
+def read_level(ziph, name):
+    """
+    Reads the compression level of the members of a release zip from its json report member, see ZipStats.level.
+
+    :return: The level, None for the default level, which releases that don't record it were compressed with
+    """
+    return read_report(ziph, name).get('compression_level')
+
+
+def add_report_digests(report, stats):
+    """
+    Adds the file and archive digests and the compression level of a zip to a json release report and rewrites
+    the report file, see read_report.
+
+    :param report: dict of the report 'data' and its 'report_path', eg. as created by the packagers
+    :param stats: The ZipStats of the zipped files
+    :return: report
+    """
+    report_dict = report['data']
+    report_dict['archive_digest'] = stats.archive_digest
+    report_dict['file_digests'] = stats.digests
+    report_dict['compression_level'] = stats.level
+
+    # The report path isn't part of the report file
+    json_report = json.dumps(OrderedDict((k, v) for k, v in report_dict.items() if k != 'report_file_path'))
+
+    with open(report['report_path'], 'w') as fp:
+        fp.write(json_report)
+
+    return report
+
+
+def log_stats(stats, log=logger):
+    """
+    Logs the summary of a zip run at info level.
+
+    :param stats: ZipStats
+    :param log: The logger of the calling tool
+    """
+    log.info('. Zipped %s files (%s reused) in %.2fs (%.1f MB/s)' % (
+        stats.files, stats.reused, stats.seconds, stats.mb_per_second))
+
+
+def list_files(path, ignore_dirs=DEFAULT_IGNORE_DIRS, exclude=()):
+    """
+    Lists the files under path, in a deterministic order, skipping any folder named in ignore_dirs.
+
+    :param path: The folder to list
+    :param ignore_dirs: Folder names excluded at any depth, eg. '.git'
+    :param exclude: arcnames of files to skip, eg. 'package_info.json'
+    :return: list of ZipMember, arcnames are relative to path and use '/'
+    """
+    if not os.path.isdir(path):
+        raise ValueError('Path is not a valid directory.')
+
+    members = []
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if d not in ignore_dirs)
+
+        folder = os.path.relpath(root, path)
+        for file_name in sorted(files):
+            file_path = os.path.join(root, file_name)
+            arcname = (file_name if folder == os.curdir else os.path.join(folder, file_name)).replace(os.sep, '/')
+            if arcname not in exclude:
+                members.append(ZipMember(file_path, arcname, os.path.getsize(file_path)))
+
+    return members
+
+
+def get_zip_info(path, arcname, compress_type):
+    """
+    Returns the ZipInfo zipfile.ZipFile.write would create for path.
+    """
+    st = os.stat(path)
+    zinfo = zipfile.ZipInfo(arcname, time.localtime(st.st_mtime)[0:6])
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+    set_compress_type(zinfo, compress_type)
+    zinfo.file_size = st.st_size
+    return zinfo
+
+
+def get_compressor(compress_type, level=None):
+    """
+    :return: An object with compress and flush methods producing compress_type data, in the raw form zip
+        stores it, or None for stored members.
+    """
+    if compress_type == zipfile.ZIP_STORED:
+        return None
+
+    if compress_type == zipfile.ZIP_DEFLATED:
+        return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None else level, zlib.DEFLATED, -15)
+
+    # bzip2 and lzma members require Python 3, which ships the modules, if it was built with them.
+    if compress_type == COMPRESSION_TYPES['bzip2'] and not PY2:
+        import bz2
+        return bz2.BZ2Compressor(9 if level is None else level)
+
+    if compress_type == COMPRESSION_TYPES['lzma'] and not PY2:
+        # zipfile's compressor writes the lzma properties header zip expects, it has no level.
+        import lzma
+        return zipfile.LZMACompressor()
+
+    raise ValueError('Unsupported compression type : %s' % compress_type)
+
+
+class MemberWriter(object):
+    """
+    Checksums and compresses a member's data in a single pass.
+    """
+
+    def __init__(self, compress_type, level=None):
+        self.compressor = get_compressor(compress_type, level)
+        self.sha = hashlib.sha256()
+        self.crc = 0
+        self.file_size = 0
+        self.compress_size = 0
+
+    def write(self, data):
+        """
+        :return: The compressed data
+        """
+        self.sha.update(data)
+        self.crc = zlib.crc32(data, self.crc)
+        self.file_size += len(data)
+        if self.compressor is not None:
+            data = self.compressor.compress(data)
+        self.compress_size += len(data)
+        return data
+
+    def flush(self):
+        data = self.compressor.flush() if self.compressor is not None else b''
+        self.compress_size += len(data)
+        return data
+
+    def update(self, zinfo):
+        """
+        Sets the CRC and sizes of the data written on zinfo.
+
+        :return: The sha256 hex digest of the data written
+        """
+        zinfo.CRC = self.crc & 0xffffffff
+        zinfo.file_size = self.file_size
+        zinfo.compress_size = self.compress_size
+        return self.sha.hexdigest()
+
+
+def compress_data(zinfo, data, compress_type, level=None):
+    """
+    Compresses a member's data.
+
+    :return: (zinfo, compressed bytes, sha256)
+    """
+    writer = MemberWriter(compress_type, level)
+    data = writer.write(data) + writer.flush()
+    return zinfo, data, writer.update(zinfo)
+
+
+def compress_member(member, compress_type, level=None):
+    """
+    Reads and compresses a single member.
+
+    :return: (ZipInfo, compressed bytes, sha256)
+    """
+    zinfo = get_zip_info(member.path, member.arcname, compress_type)
+
+    with open(member.path, 'rb') as f:
+        return compress_data(zinfo, f.read(), compress_type, level)
+
+
+def read_member(member, compress_type):
+    """
+    Reads and hashes a single member, for write_member without RAW_WRITES.
+
+    :return: (ZipInfo, uncompressed bytes, sha256)
+    """
+    zinfo = get_zip_info(member.path, member.arcname, compress_type)
+
+    with open(member.path, 'rb') as f:
+        data = f.read()
+    return zinfo, data, hashlib.sha256(data).hexdigest()
+
+
+def get_checksums(path):
+    """
+    :return: (CRC32, sha256) of a file
+    """
+    crc = 0
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+            sha.update(chunk)
+    return crc & 0xffffffff, sha.hexdigest()
+
+
+def index_zip(ziph):
+    """
+    :return: dict of {arcname: ZipInfo} of the members of an open zipfile.
+    """
+    return dict((zinfo.filename, zinfo) for zinfo in ziph.infolist())
+
+
+def is_same_compression(zinfo, previous_info, level=None, previous_level=None):
+    """
+    Checks that a member is compressed like it was in a previous archive : unencrypted, with the same compression
+    type and, unless it is stored, the same level.
+    """
+    return (previous_info.compress_type == zinfo.compress_type and
+            (zinfo.compress_type == zipfile.ZIP_STORED or previous_level == level) and
+            not previous_info.flag_bits & 0x1)
+
+
+def is_unchanged(zinfo, previous_info, level=None, previous_level=None):
+    """
+    Compares the ZipInfo of a file with its ZipInfo in a previous archive. A file is unchanged if its
+    size and modification time match and it is compressed the same way, see is_same_compression.
+    """
+    # Zip stores the modification time with a two second resolution.
+    return (previous_info.file_size == zinfo.file_size and
+            previous_info.date_time[:5] == zinfo.date_time[:5] and
+            previous_info.date_time[5] // 2 == zinfo.date_time[5] // 2 and
+            is_same_compression(zinfo, previous_info, level, previous_level))
+
+
+def iter_raw(ziph, zinfo, chunk_size=CHUNK_SIZE):
+    """
+    Yields the compressed bytes of a member of an open zipfile, as they are stored.
+    """
+    ziph.fp.seek(zinfo.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, ziph.fp.read(zipfile.sizeFileHeader))
+    if header[zipfile._FH_SIGNATURE] != zipfile.stringFileHeader:
+        raise zipfile.BadZipfile('Bad magic number for file header : %s' % zinfo.filename)
+
+    offset = zinfo.header_offset + zipfile.sizeFileHeader
+    offset += header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH]
+
+    remaining = zinfo.compress_size
+    while remaining > 0:
+        # Seek every time, the caller may use the file between chunks.
+        ziph.fp.seek(offset)
+        chunk = ziph.fp.read(min(chunk_size, remaining))
+        if not chunk:
+            raise zipfile.BadZipfile('Truncated member : %s' % zinfo.filename)
+        offset += len(chunk)
+        remaining -= len(chunk)
+        yield chunk
+
+
+def get_reuse_info(member, compress_type, previous_info=None, previous_digest=None, verify_crc=False, level=None,
+                   previous_level=None):
+    """
+    Checks whether a member is unchanged since the previous archive.
+
+    :param previous_info: The member's ZipInfo in the previous archive, if any
+    :param previous_digest: The member's sha256 in the previous archive, if known
+    :param verify_crc: Also compare the CRC32 of unchanged files, which costs a read but no compression
+    :param level: The compression level of the member
+    :param previous_level: The compression level of the previous archive, see read_level
+    :return: (ZipInfo, sha256) if the member can be copied from the previous archive, otherwise None
+    """
+    if previous_info is None:
+        return None
+
+    zinfo = get_zip_info(member.path, member.arcname, compress_type)
+    if not is_unchanged(zinfo, previous_info, level, previous_level):
+        return None
+
+    digest = previous_digest
+    if verify_crc or not digest:
+        crc, digest = get_checksums(member.path)
+        if verify_crc and crc != previous_info.CRC:
+            return None
+
+    zinfo.CRC = previous_info.CRC
+    zinfo.compress_size = previous_info.compress_size
+    return zinfo, digest
+
+
+def prepare_member(member, compress_type, level=None, previous_info=None, previous_digest=None, verify_crc=False,
+                   previous_level=None):
+    """
+    Compresses a member unless it is unchanged since the previous archive.
+
+    :return: (ZipInfo, compressed bytes, sha256), the bytes are None if the member can be copied from the
+        previous archive. Without RAW_WRITES the bytes are uncompressed, see write_member.
+    """
+    if not RAW_WRITES:
+        return read_member(member, compress_type)
+
+    reuse = get_reuse_info(member, compress_type, previous_info, previous_digest, verify_crc, level, previous_level)
+    if reuse is not None:
+        return reuse[0], None, reuse[1]
+
+    return compress_member(member, compress_type, level)
+
+
+@contextmanager
+def open_member(ziph, zinfo):
+    """
+    Positions an open zipfile to write a member and registers the member once it is written.
+
+    zipfile has no public API for this, so it is done the way ZipFile.writestr does it on each of the
+    TESTED_VERSIONS. Check RAW_WRITES before calling it.
+
+    :return: The archive's file object
+    """
+    if not RAW_WRITES:
+        raise RuntimeError('Writing raw zip members is untested on Python %s.%s' % tuple(sys.version_info[:2]))
+
+    if PY2:
+        # Python 2 appends at the current position and has no write lock.
+        zinfo.header_offset = ziph.fp.tell()
+        ziph._writecheck(zinfo)
+        ziph._didModify = True
+
+        yield ziph.fp
+
+        ziph.filelist.append(zinfo)
+        ziph.NameToInfo[zinfo.filename] = zinfo
+    else:
+        # Python 3 tracks the end of the written members in start_dir, and serializes writes with _lock and
+        # the _writing flag of ZipFile.open.
+        with ziph._lock:
+            if ziph._writing:
+                raise ValueError("Can't write to the zip archive while an open writing handle exists")
+
+            ziph.fp.seek(ziph.start_dir)
+            zinfo.header_offset = ziph.fp.tell()
+            ziph._writecheck(zinfo)
+            ziph._didModify = True
+
+            yield ziph.fp
+
+            ziph.start_dir = ziph.fp.tell()
+            ziph.filelist.append(zinfo)
+            ziph.NameToInfo[zinfo.filename] = zinfo
+
+
+def write_raw(ziph, zinfo, data):
+    """
+    Writes an already compressed member into an open zipfile.
+
+    zinfo must carry the CRC, file_size and compress_size of the member, data is written as is.
+    data is either bytes or an iterable of bytes.
+    """
+    if isinstance(data, bytes):
+        data = [data]
+
+    with open_member(ziph, zinfo) as fp:
+        fp.write(zinfo.FileHeader())
+        for chunk in data:
+            fp.write(chunk)
+
+
+def write_member(ziph, zinfo, data, level=None):
+    """
+    Writes a member prepared by the workers, see prepare_member. Without RAW_WRITES, data is uncompressed and
+    is compressed by the public ZipFile.writestr.
+    """
+    if RAW_WRITES:
+        write_raw(ziph, zinfo, data)
+    elif level is None:
+        ziph.writestr(zinfo, data)
+    else:
+        ziph.writestr(zinfo, data, compresslevel=level)
+
+
+def write_stream(ziph, member, compress_type, level=None):
+    """
+    Streams a file into an open zipfile, see write_fileobj.
+
+    :return: (ZipInfo, sha256)
+    """
+    if not RAW_WRITES:
+        if level is None:
+            ziph.write(member.path, member.arcname, compress_type)
+        else:
+            ziph.write(member.path, member.arcname, compress_type, compresslevel=level)
+        return ziph.NameToInfo[member.arcname], get_checksums(member.path)[1]
+
+    zinfo = get_zip_info(member.path, member.arcname, compress_type)
+    with open(member.path, 'rb') as f:
+        return write_fileobj(ziph, zinfo, f, compress_type, level)
+
+
+def write_fileobj(ziph, zinfo, fileobj, compress_type, level=None):
+    """
+    Streams a file object into an open zipfile, compressing and checksumming it chunk by chunk.
+    The member's header is rewritten once its CRC and sizes are known, so the archive must be seekable.
+
+    :param zinfo: The member's ZipInfo, its file_size must be set
+    :return: (ZipInfo, sha256)
+    """
+    if not RAW_WRITES:
+        data = fileobj.read()
+        write_member(ziph, zinfo, data, level)
+        return zinfo, hashlib.sha256(data).hexdigest()
+
+    writer = MemberWriter(compress_type, level)
+
+    # The header size depends on zip64, so decide it up front like zipfile does.
+    zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    zinfo.compress_size = zinfo.CRC = 0
+
+    with open_member(ziph, zinfo) as fp:
+        fp.write(zinfo.FileHeader(zip64))
+        for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b''):
+            fp.write(writer.write(chunk))
+        fp.write(writer.flush())
+
+        digest = writer.update(zinfo)
+        end = fp.tell()
+        fp.seek(zinfo.header_offset)
+        fp.write(zinfo.FileHeader(zip64))
+        fp.seek(end)
+
+    return zinfo, digest
+
+
+def get_batches(members, large_file_size=LARGE_FILE_SIZE, max_batch_size=MAX_BATCH_SIZE):
+    """
+    Splits members into consecutive batches of at most max_batch_size bytes. Large files get a batch of their own.
+    """
+    batch = []
+    batch_size = 0
+
+    for member in members:
+        if member.size > large_file_size:
+            if batch:
+                yield batch
+            yield [member]
+            batch = []
+            batch_size = 0
+            continue
+
+        if batch and batch_size + member.size > max_batch_size:
+            yield batch
+            batch = []
+            batch_size = 0
+
+        batch.append(member)
+        batch_size += member.size
+
+    if batch:
+        yield batch
+
+
+def zipdir(path, ziph, ignore_dirs=DEFAULT_IGNORE_DIRS, workers=None, large_file_size=LARGE_FILE_SIZE,
+           previous=None, previous_digests=None, verify_crc=False, exclude=(), compression=None, previous_level=None):
+    """
+    Zips the contents of 'path' into zipfile ziph ignoring folders specified in 'ignore_dirs'.
+    The members are compressed on a pool of threads and written in a deterministic, sorted order.
+
+    :param path: The folder to zip
+    :param ziph: zipfile.ZipFile open for writing. Its compression is used unless compression is given.
+    :param ignore_dirs: Folder names excluded at any depth. By default the git and pycharm folders.
+    :param workers: Number of compression threads, defaults to the number of cpus.
+    :param large_file_size: Files above this size are streamed on the writing thread rather than compressed by the pool.
+    :param previous: zipfile.ZipFile of the previous release, open for reading. Unchanged members are copied from it.
+    :param previous_digests: dict of {arcname: sha256} of the previous release, see read_digests. Reused members
+        missing from it are read once to hash them.
+    :param verify_crc: Also compare the CRC32 of files before copying them from the previous release.
+    :param exclude: arcnames of files to leave out, eg. a report written after zipping
+    :param compression: Compression of the members, see parse_compression.
+    :param previous_level: The compression level of the previous release, see read_level. Compressed members
+        are only reused if it matches the level of compression.
+    :return: ZipStats
+    """
+    start = time.time()
+    members = list_files(path, ignore_dirs=ignore_dirs, exclude=exclude)
+    compression = get_compression(ziph, compression)
+
+    # Without RAW_WRITES members can't be copied from the previous archive
+    previous_index = index_zip(previous) if previous is not None and RAW_WRITES else {}
+    previous_digests = previous_digests or {}
+
+    def prepare(member):
+        return prepare_member(member, compression.get_compress_type(member.arcname), compression.level,
+                              previous_index.get(member.arcname), previous_digests.get(member.arcname), verify_crc,
+                              previous_level)
+
+    bytes_in = 0
+    bytes_out = 0
+    reused = 0
+    digests = OrderedDict()
+    pool = ThreadPool(workers or get_default_workers())
+    try:
+        for batch in get_batches(members, large_file_size=large_file_size):
+            if len(batch) == 1 and batch[0].size > large_file_size:
+                member = batch[0]
+                compress_type = compression.get_compress_type(member.arcname)
+                reuse = get_reuse_info(member, compress_type, previous_index.get(member.arcname),
+                                       previous_digests.get(member.arcname), verify_crc, compression.level,
+                                       previous_level)
+                if reuse is None:
+                    zinfo, digests[member.arcname] = write_stream(ziph, member, compress_type, compression.level)
+                    bytes_in += zinfo.file_size
+                    bytes_out += zinfo.compress_size
+                    continue
+                results = [(reuse[0], None, reuse[1])]
+            else:
+                results = pool.imap(prepare, batch)
+
+            for zinfo, data, digest in results:
+                if data is None:
+                    write_raw(ziph, zinfo, iter_raw(previous, previous_index[zinfo.filename]))
+                    reused += 1
+                else:
+                    write_member(ziph, zinfo, data, compression.level)
+                digests[zinfo.filename] = digest
+                bytes_in += zinfo.file_size
+                bytes_out += zinfo.compress_size
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    stats = ZipStats(len(members), bytes_in, bytes_out, time.time() - start, reused, digests, compression.level)
+    logger.debug('. Zipped %s files (%s reused), %.1f MB in %.2fs (%.1f MB/s)' % (
+        stats.files, reused, bytes_in / (1024.0 * 1024.0), stats.seconds, stats.mb_per_second))
+    return stats
+
+
+def get_tar_zip_info(tarinfo, compress_type):
+    """
+    Returns the ZipInfo of a 'git archive' tar member. Symlinks are stored as links, like git's own zip format does.
+    """
+    zinfo = zipfile.ZipInfo(tarinfo.name, time.localtime(tarinfo.mtime)[0:6])
+    file_type = stat.S_IFLNK if tarinfo.issym() else stat.S_IFREG
+    zinfo.external_attr = ((file_type | tarinfo.mode) & 0xFFFF) << 16
+    set_compress_type(zinfo, compress_type)
+    zinfo.file_size = tarinfo.size
+    return zinfo
+
+
+def is_ignored(arcname, ignore_dirs):
+    return any(folder in ignore_dirs for folder in arcname.split('/')[:-1])
+
+
+def prepare_data(zinfo, data, compress_type, level=None, previous_info=None, previous_digest=None,
+                 previous_level=None):
+    """
+    Compresses a member's data unless it is identical to the member in the previous archive.
+
+    :return: (ZipInfo, compressed bytes, sha256), the bytes are None if the member can be copied from the
+        previous archive. Without RAW_WRITES the bytes are uncompressed, see write_member.
+    """
+    if not RAW_WRITES:
+        return zinfo, data, hashlib.sha256(data).hexdigest()
+
+    if previous_info is not None and previous_digest and previous_info.file_size == len(data) and \
+            is_same_compression(zinfo, previous_info, level, previous_level):
+        digest = hashlib.sha256(data).hexdigest()
+        if digest == previous_digest:
+            zinfo.CRC = previous_info.CRC
+            zinfo.compress_size = previous_info.compress_size
+            return zinfo, None, digest
+
+    return compress_data(zinfo, data, compress_type, level)
+
+
+def zipgit(path, ziph, treeish='HEAD', ignore_dirs=DEFAULT_IGNORE_DIRS, workers=None, large_file_size=LARGE_FILE_SIZE,
+           previous=None, previous_digests=None, exclude=(), compression=None, previous_level=None):
+    """
+    Zips the files committed at treeish, streaming 'git archive' through the compression pool. Untracked
+    and ignored files, eg. .pyc files, are left out and the working copy isn't walked. Submodule content
+    isn't part of 'git archive' output.
+
+    Every member gets the commit time as its modification time, so unchanged members are reused from the
+    previous archive by comparing their content with previous_digests.
+
+    :param path: Path to the local Git repo
+    :param ziph: zipfile.ZipFile open for writing. Its compression is used unless compression is given.
+    :param treeish: The commit or tree to zip
+    :param ignore_dirs: Folder names excluded at any depth, as for zipdir.
+    :param workers: Number of compression threads, defaults to the number of cpus.
+    :param large_file_size: Files above this size are streamed on the writing thread rather than compressed by the pool.
+    :param previous: zipfile.ZipFile of the previous release, open for reading.
+    :param previous_digests: dict of {arcname: sha256} of the previous release, see read_digests.
+    :param exclude: arcnames of files to leave out, eg. a report written after zipping
+    :param compression: Compression of the members, see parse_compression.
+    :param previous_level: The compression level of the previous release, as for zipdir.
+    :return: ZipStats
+    """
+    start = time.time()
+    compression = get_compression(ziph, compression)
+
+    previous_index = index_zip(previous) if previous is not None and RAW_WRITES else {}
+    previous_digests = previous_digests or {}
+
+    def prepare(item):
+        zinfo, data = item
+        return prepare_data(zinfo, data, zinfo.compress_type, compression.level, previous_index.get(zinfo.filename),
+                            previous_digests.get(zinfo.filename), previous_level)
+
+    files = 0
+    bytes_in = 0
+    bytes_out = 0
+    reused = 0
+    digests = OrderedDict()
+
+    def write_results(results):
+        written = 0
+        for zinfo, data, digest in results:
+            if data is None:
+                write_raw(ziph, zinfo, iter_raw(previous, previous_index[zinfo.filename]))
+                written += 1
+            else:
+                write_member(ziph, zinfo, data, compression.level)
+            digests[zinfo.filename] = digest
+        return written
+
+    command = ['git', 'archive', '--format=tar', treeish]
+    process = subprocess.Popen(command, cwd=path, stdout=subprocess.PIPE)
+    pool = ThreadPool(workers or get_default_workers())
+    try:
+        batch = []
+        batch_size = 0
+        with tarfile.open(fileobj=process.stdout, mode='r|') as tar:
+            for tarinfo in tar:
+                if not (tarinfo.isfile() or tarinfo.issym()) or tarinfo.name in exclude or \
+                        is_ignored(tarinfo.name, ignore_dirs):
+                    continue
+
+                zinfo = get_tar_zip_info(tarinfo, compression.get_compress_type(tarinfo.name))
+                files += 1
+
+                if tarinfo.isfile() and tarinfo.size > large_file_size:
+                    reused += write_results(pool.imap(prepare, batch))
+                    batch = []
+                    batch_size = 0
+
+                    zinfo, digests[zinfo.filename] = write_fileobj(ziph, zinfo, tar.extractfile(tarinfo),
+                                                                   zinfo.compress_type, compression.level)
+                    bytes_in += zinfo.file_size
+                    continue
+
+                if tarinfo.issym():
+                    # A link's data is its target
+                    data = tarinfo.linkname
+                    if not isinstance(data, bytes):
+                        data = data.encode('utf-8')
+                else:
+                    data = tar.extractfile(tarinfo).read()
+
+                zinfo.file_size = len(data)
+                bytes_in += len(data)
+
+                if batch and batch_size + len(data) > MAX_BATCH_SIZE:
+                    reused += write_results(pool.imap(prepare, batch))
+                    batch = []
+                    batch_size = 0
+
+                batch.append((zinfo, data))
+                batch_size += len(data)
+
+        reused += write_results(pool.imap(prepare, batch))
+        pool.close()
+    except tarfile.TarError:
+        # git writes nothing when it fails, eg. for an unknown treeish, report its error rather than tarfile's
+        if process.wait():
+            raise subprocess.CalledProcessError(process.returncode, command)
+        raise
+    finally:
+        pool.terminate()
+        pool.join()
+        process.stdout.close()
+        return_code = process.wait()
+
+    if return_code:
+        raise subprocess.CalledProcessError(return_code, command)
+
+    bytes_out = sum(zinfo.compress_size for zinfo in ziph.infolist() if zinfo.filename in digests)
+    stats = ZipStats(files, bytes_in, bytes_out, time.time() - start, reused, digests, compression.level)
+    logger.debug('. Zipped %s files from %s (%s reused), %.1f MB in %.2fs (%.1f MB/s)' % (
+        stats.files, treeish, reused, bytes_in / (1024.0 * 1024.0), stats.seconds, stats.mb_per_second))
+    return stats
@@ -0,0 +1,208 @@
+"""
+The env_bundler precomputes the resolved env of every (engine, project, optional user) combination in to an
+env bundle, see blPython.shotgun.env_bundle, so farm tasks can activate their env without talking to SG.
+
+- The engines of a project are those of the Software entities linked to it, unless --engines is given.
+- With --users, a combination is also built for every user linked to an environment entity.
+- The environment graph is fetched once for all the combinations.
+- Rebuilding only rewrites the combinations whose environment entities have a new 'updated_at'.
+- Use --check to list the combinations with an updated environment entity, in one query, without rebuilding.
+
+A JSON report is written to stdout.
+"""
+
+import os, sys
+import logging
+import argparse
+import json
+import time
+from collections import OrderedDict
+
+# Add path to sys.path for Blacksmith python modules
+# Temporary logic to find the current release path relative to this file
+# This should be removed once the repos are split and a studio wide BLPYTHON env var is in place.
+if not os.environ.get('BLPYTHON'):
+    tools_dir = os.path.dirname(__file__)
+    scripts_dir = os.path.dirname(tools_dir)
+    blPython_dir = os.path.dirname(scripts_dir)
+    blPythonPackage_dir = os.path.dirname(blPython_dir)
+    BL_PYTHON_PATH = blPythonPackage_dir
+else:
+    BL_PYTHON_PATH = os.environ.get('BLPYTHON')
+
+sys.path.append(BL_PYTHON_PATH)
+
+# Get Blacksmith modules.
+from blPython.shotgun import env, env_bundle
+
+# Setup logging
+logger = logging.getLogger('env_bundler')
+logger.setLevel(logging.DEBUG)
+
+# create console handler, logging goes to stderr so stdout only holds the json
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+
+# create formatter
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+# add formatter to ch
+ch.setFormatter(formatter)
+
+# add ch to logger
+logger.addHandler(ch)
+
+
+def get_args():
+    """
+    Get the arguments and return them
+    :return: parsed argument object
+    """
+    examples = """Examples:\npython env_bundler.py S:\\pipeline\\env_bundle\npython env_bundler.py --projects 314 --engines tk-nuke tk-maya --users S:\\pipeline\\env_bundle\npython env_bundler.py --check S:\\pipeline\\env_bundle"""
+
+    parser = argparse.ArgumentParser(
+        description='Precompute the resolved env of every engine, project and user combination for farm launches.',
+        epilog=examples,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        add_help=True)
+
+    parser.add_argument('bundle', help='The bundle folder to build.')
+    parser.add_argument('-p', '--projects', nargs='+', type=int, default=None, help='The ids of the projects to build, by default every project.')
+    parser.add_argument('-e', '--engines', nargs='+', default=None, help='The engines to build, by default those of the Software linked to each project.')
+    parser.add_argument('-u', '--users', action="store_true", help='Also build a combination for every user with environments of their own.')
+    parser.add_argument('-f', '--force', action="store_true", help='Rewrite every combination, even those whose environments are unchanged.')
+    parser.add_argument('-c', '--check', action="store_true", help='Only list the combinations with an updated environment, exit code 1 if there are any.')
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    return parser.parse_args()
+
+
+def get_combinations(sg, project_ids=None, engine_names=None, users=False):
+    """
+    Returns the combinations to build.
+
+    :param sg: SG connection
+    :param project_ids: The ids of the projects to build, by default every project
+    :param engine_names: The engines to build, by default those of the Software linked to each project
+    :param users: Also build a combination for every user linked to an environment entity
+    :return: list of (engine name, Project entity dict, HumanUser entity dict or None)
+    """
+    projects = sg.find('Project', [['id', 'in', project_ids]] if project_ids else [], ['sg_env', 'sg_software'])
+
+    softwares = []
+    if not engine_names:
+        softwares = sg.find('Software', [['engine', 'is_not', None]], ['engine', 'project_sg_software_projects'])
+
+    user_entities = [None]
+    if users:
+        seen = set()
+        for environment in sg.find(env.ENVIRONMENT_ENTITY_TYPE, [], ['human_user_sg_env_human_users']):
+            for user in environment['human_user_sg_env_human_users'] or []:
+                if user['id'] not in seen:
+                    seen.add(user['id'])
+                    user_entities.append({'type': user['type'], 'id': user['id']})
+
+    combinations = []
+    for project in projects:
+        names = engine_names or sorted(set(
+            software['engine'] for software in softwares
+            if project['id'] in [p['id'] for p in software['project_sg_software_projects'] or []]))
+        for engine_name in names:
+            for user in user_entities:
+                combinations.append((engine_name, project, user))
+    return combinations
+
+
+def build_bundle(sg, path, project_ids=None, engine_names=None, users=False, force=False):
+    """
+    Builds or updates an env bundle, see the module docstring.
+
+    :param sg: SG connection
+    :param path: The bundle folder
+    :param force: Rewrite every combination, even those whose environments are unchanged
+    :return: OrderedDict, the build report
+    """
+    start = time.time()
+    bundle = env_bundle.EnvBundle(path)
+    combinations = get_combinations(sg, project_ids=project_ids, engine_names=engine_names, users=users)
+    logger.info('. Building %s env combinations in %s' % (len(combinations), path))
+
+    # Look the layers up once per project and engine, and once per user
+    base_layers = {}
+    user_layers = {}
+    layers = []
+    for engine_name, project, user in combinations:
+        if (engine_name, project['id']) not in base_layers:
+            base_layers[(engine_name, project['id'])] = env.get_env_layers(sg, engine_name, project, None)
+        combination_layers = OrderedDict(base_layers[(engine_name, project['id'])])
+
+        if user is not None:
+            if user['id'] not in user_layers:
+                user_layers[user['id']] = env.get_user_env_entities(sg, user)
+            combination_layers['user'] = user_layers[user['id']]
+        layers.append(combination_layers)
+
+    # Fetch the environment graph of every combination in one walk
+    resolver = env.EnvironmentResolver(sg)
+    for user_entities in user_layers.values():
+        resolver.add(user_entities)
+    resolver.fetch([env_entity['id'] for combination_layers in layers
+                    for env_entities in combination_layers.values() for env_entity in env_entities])
+
+    written = []
+    unchanged = []
+    for (engine_name, project, user), combination_layers in zip(combinations, layers):
+        user_id = user['id'] if user else None
+        key = env_bundle.make_key(engine_name, project['id'], user_id)
+        environments = resolver.get_updated_at([env_entity['id'] for env_entities in combination_layers.values()
+                                                for env_entity in env_entities])
+
+        if not force and bundle.is_current(key, environments):
+            unchanged.append(key)
+            continue
+
+        bundle.write(engine_name, project['id'], user_id, env.resolve_layers(resolver, combination_layers),
+                     environments)
+        written.append(key)
+
+    # Drop the combinations of the projects built that no longer exist, eg. an engine removed from a project
+    built = set(env_bundle.make_key(engine_name, project['id'], user['id'] if user else None)
+                for engine_name, project, user in combinations)
+    project_ids = set(project['id'] for engine_name, project, user in combinations)
+    removed = sorted(key for key, entry in bundle.index['combinations'].items()
+                     if key not in built and entry['key'][1] in project_ids)
+    for key in removed:
+        bundle.remove(key)
+
+    bundle.write_index()
+
+    report = OrderedDict([('bundle', path),
+                          ('combinations', len(combinations)),
+                          ('written', written),
+                          ('unchanged', unchanged),
+                          ('removed', removed),
+                          ('seconds', round(time.time() - start, 3))])
+
+    logger.info('. Wrote %s, kept %s and removed %s env combinations in %.2fs' % (len(written), len(unchanged),
+                                                                                   len(removed), report['seconds']))
+    return report
+
+
+if __name__ == "__main__":
+    args = get_args()
+    sg = env.get_sg()
+
+    if args.check:
+        stale = env_bundle.EnvBundle(args.bundle).check_freshness(sg)
+        for key in stale:
+            logger.info('. %s has an updated environment' % key)
+
+        sys.stdout.write(json.dumps({'bundle': args.bundle, 'stale': stale}, indent=2) + '\n')
+        sys.exit(1 if stale else 0)
+
+    report = build_bundle(sg, args.bundle, project_ids=args.projects, engine_names=args.engines, users=args.users,
+                          force=args.force)
+    sys.stdout.write(json.dumps(report, indent=2) + '\n')
@@ -0,0 +1,90 @@
+"""
+The env_server runs the node-local env service, see blPython.shotgun.env_service, so every process on a
+workstation or render node shares one resolution of each env.
+
+- Start it once per node, eg. from a login script or the render node's service manager.
+- Processes get their Env from it with blPython.shotgun.env_service.get_env.
+- Use --stats to print the counters of a running service.
+
+"""
+
+import os, sys
+import logging
+import argparse
+import json
+
+# Add path to sys.path for Blacksmith python modules
+# Temporary logic to find the current release path relative to this file
+# This should be removed once the repos are split and a studio wide BLPYTHON env var is in place.
+if not os.environ.get('BLPYTHON'):
+    tools_dir = os.path.dirname(__file__)
+    scripts_dir = os.path.dirname(tools_dir)
+    blPython_dir = os.path.dirname(scripts_dir)
+    blPythonPackage_dir = os.path.dirname(blPython_dir)
+    BL_PYTHON_PATH = blPythonPackage_dir
+else:
+    BL_PYTHON_PATH = os.environ.get('BLPYTHON')
+
+sys.path.append(BL_PYTHON_PATH)
+
+# Get Blacksmith modules.
+from blPython.shotgun import env_service
+
+# Setup logging
+logger = logging.getLogger('env_server')
+logger.setLevel(logging.DEBUG)
+
+# create console handler
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+
+# create formatter
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+# add formatter to ch
+ch.setFormatter(formatter)
+
+# add ch to logger
+logger.addHandler(ch)
+
+
+def get_args():
+    """
+    Get the arguments and return them
+    :return: parsed argument object
+    """
+    examples = """Examples:\npython env_server.py\npython env_server.py --port 47318 --ttl 600\npython env_server.py --stats"""
+
+    host, port = env_service.get_address()
+
+    parser = argparse.ArgumentParser(
+        description='Serve resolved envs to the processes of this node.',
+        epilog=examples,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        add_help=True)
+
+    parser.add_argument('-H', '--host', action="store", type=str, default=host, help='The address to listen on, keep it local.')
+    parser.add_argument('-p', '--port', action="store", type=int, default=port, help='The port to listen on.')
+    parser.add_argument('-t', '--ttl', action="store", type=int, default=int(os.environ.get('BL_ENV_SERVICE_TTL', env_service.DEFAULT_TTL)), help='Seconds a resolved env is served before being resolved again.')
+    parser.add_argument('-w', '--workers', action="store", type=int, default=env_service.DEFAULT_WORKERS, help='The number of threads resolving envs from SG, each keeps its SG connection.')
+    parser.add_argument('-s', '--stats', action="store_true", help='Print the stats of the running service and exit.')
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+
+    if args.stats:
+        client = env_service.EnvServiceClient((args.host, args.port))
+        sys.stdout.write(json.dumps(client.stats(), indent=2) + '\n')
+        sys.exit(0)
+
+    server = env_service.EnvServer(env_service.EnvService(ttl=args.ttl, workers=args.workers), (args.host, args.port))
+    logger.info('. Serving envs on %s:%s' % server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
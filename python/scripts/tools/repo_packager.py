@@ -17,11 +17,11 @@ import traceback
 import argparse
 import pprint
 import json
+import functools
 import getpass
 import datetime
+import subprocess
 import re
-import shutil
-import errno
 
 from collections import OrderedDict
 
@@ -41,7 +41,9 @@ sys.path.append(BL_PYTHON_PATH)
 
 # Get Blacksmith modules.
 from blPython.core import config
+from blPython.core import connection
 from blPython.git import gitOps
+from blPython.release import zipOps, storeOps, copyOps, uploadOps
 
 # Add path to SG API (for shotgun_api3 and sgtk imports)
 sys.path.append(config.SG_API_PATH)
@@ -51,6 +53,13 @@ import shotgun_api3
 
 # Global Variables
 STUDIO_RELEASE_PATH = r'S:\pipeline\_release'
+
+# Folder of the content-addressed store the release folders are materialized from, in the release path
+RELEASE_STORE_FOLDER = '_store'
+
+# Folders left out of release folders materialized from the store. Their files would be hardlinked read-only
+# objects shared by every release, and git writes to .git in place.
+RELEASE_STORE_IGNORE_DIRS = ['.git', '.idea']
 TESTING = True
 DEBUG_MODE = False # Sets the logger to DEBUG if enabled.
 
@@ -91,6 +100,11 @@ def get_args():
     # parser.add_argument('-i', '--pc_id', action="store", type=int, required=True, help='The pipeline configuration ID to upload the pc zip package to.')
     parser.add_argument('-p', '--path', action="store", required=False, type=str, help='The path of the pipeline configuration to zip and upload. If this argument is not specified, the current working directory will be used instead.')
     parser.add_argument('-u', '--upload', action="store", required=False, type=bool, default=False, help='Set this to True to upload the package to SG.')
+    parser.add_argument('-i', '--incremental', action="store_true", help='Reuse the unchanged files of the previous release package instead of recompressing them.')
+    parser.add_argument('-s', '--store', action="store_true", help='Link the files of the release folder from the content-addressed release store, leaving out .git and .idea, instead of copying every file. Only use it on release shares that support hardlinks, released files must then never be edited in place.')
+    parser.add_argument('-e', '--export', action="store_true", help='Zip the files committed at HEAD rather than the working copy, leaving out untracked files.')
+    parser.add_argument('-z', '--compression', action="store", type=zipOps.parse_compression, default='deflate', help='How the package files are compressed : store, deflate, bzip2, lzma or auto, optionally with a level, eg. deflate:9. auto deflates every file except already compressed formats like png or exr, which are stored.')
+    parser.add_argument('-w', '--workers', action="store", type=int, default=copyOps.DEFAULT_WORKERS, help='The maximum number of files hashed or copied at once.')
 
     if len(sys.argv) == 1:
         parser.print_help()
@@ -99,35 +113,6 @@ def get_args():
     return parser.parse_args()
 
 
-def zipdir(path, ziph, ignore_dirs=['.git','.idea']):
-    """
-    Zips the contents of 'path' into zipfile ziph ignoring folders specified in 'ignore_dirs'
-    :param path: Path to the local Git repo
-    :param ziph:
-    :param ignore_dirs: By default this method ignores git and pycharm folders.
-    :return:
-    """
-
-    # Verify path is a directory
-    if not os.path.isdir(path):
-        raise ValueError('Path is not a valid directory.')
-
-    # get the length of the path. This is used later to ensure the zipfile contents exclude the parent path
-    length = len(path)
-
-    for root, dirs, files in os.walk(path):
-        folder = root[length:]  # path without "parent"
-
-        # Exclude the .git and .idea folders from the zipfile
-        for dir_to_ignore in ignore_dirs:
-            if dir_to_ignore in dirs:
-                dirs.remove(dir_to_ignore)
-
-        # Add the files and remove the parent path
-        for file in files:
-            ziph.write(os.path.join(root, file), os.path.join(folder, file))
-
-
 def create_git_release_report(path, report_type='json'):
     """
     Creates a report of type txt or json containing various useful data.
@@ -144,17 +129,23 @@ def create_git_release_report(path, report_type='json'):
 
     report_dict = OrderedDict()
 
-    if gitOps.is_git_repository(path):
+    # Gather all the git metadata in one go, this fails if path isn't a git repo.
+    try:
+        git_metadata = gitOps.get_git_metadata(path)
+    except (subprocess.CalledProcessError, OSError):
+        git_metadata = None
+
+    if git_metadata:
 
         # get the git remote url
-        report_dict['repo_url'] = gitOps.get_git_remote_url_from_path(path)
+        report_dict['repo_url'] = git_metadata.repo_url
 
         # get the git repo name
-        report_dict['repo_name'] = gitOps.get_git_repo_name_from_path(path, sanitize=False)
+        report_dict['repo_name'] = git_metadata.repo_name
         logger.debug('. git_repo_name : %s' % report_dict['repo_name'])
 
         # get the branchname
-        report_dict['branch'] = gitOps.get_current_git_branch_from_path(path, strip_parent=False)
+        report_dict['branch'] = git_metadata.branch
         logger.debug('. Current branch : %s' % report_dict['branch'])
 
         # get the current user, time and date
@@ -164,12 +155,12 @@ def create_git_release_report(path, report_type='json'):
         report_dict['released_on'] = now.strftime("%m.%d.%Y")
 
         # get latest commit hash
-        report_dict['commit'] = gitOps.get_current_commit_hash_from_path(path, short=True)
-        report_dict['commit_comment'] = (gitOps.get_current_commit_comment_from_path(path))
+        report_dict['commit'] = git_metadata.commit_short
+        report_dict['commit_comment'] = git_metadata.commit_comment
 
         # get tag from path
-        report_dict['tags'] = gitOps.get_current_tags_from_path(path)
-        report_dict['tag_comment'] = gitOps.get_current_tag_messages_from_path(path)
+        report_dict['tags'] = git_metadata.tags
+        report_dict['tag_comment'] = git_metadata.tag_comment
 
         # Create the report
         if report_type == 'txt':
@@ -219,30 +210,27 @@ def create_git_release_report(path, report_type='json'):
     else:
         raise ValueError('Path does not point to a valid git repo : %s' % path)
 
-def copy(src, dest):
+def get_previous_package(zip_release_path, git_repo_name):
     """
-    Copy method that copies a source file our directory to the provided path.
+    Returns the most recently written release package of a repo in its _packages folder.
 
-    :param src:
-    :param dest:
-    :return:
+    :param zip_release_path: The repo's _packages folder
+    :param git_repo_name: The sanitized repo name the packages are prefixed with
+    :return: path to the package or None
     """
-    try:
-        # Check if the source is a file or directory and use the correct shutil method accordingly.
-        if os.path.isdir(src):
-            shutil.copytree(src, dest, ignore=shutil.ignore_patterns())
-        else:
-            shutil.copy(src, dest)
-
-    except OSError as e:
-        # If the error was caused because the source wasn't a directory
-        logger.debug('. e.errno : %s' % e.errno)
-        if e.errno == errno.ENOTDIR:
-            shutil.copy(src, dest)
-        else:
-            raise RuntimeError('Directory not copied. Error: %s' % e)
-
-def release_branch(path):
+    if not os.path.isdir(zip_release_path):
+        return None
+
+    packages = [os.path.join(zip_release_path, f) for f in os.listdir(zip_release_path)
+                if f.startswith('%s_' % git_repo_name) and f.endswith('.zip')]
+    if not packages:
+        return None
+
+    return max(packages, key=os.path.getmtime)
+
+
+def release_branch(path, incremental=False, use_store=False, workers=copyOps.DEFAULT_WORKERS, export=False,
+                   compression=None, release_root=None, timer=None, zip_workers=None):
     """
     Utility to zip up the currently checked out branch of a git repository at the provided path.
     By default, the .git and .idea folders are excluded from the archive.
@@ -250,8 +238,20 @@ def release_branch(path):
     The archive label will be the name of the currently checked out branch.
     On success, the zipfile path is returned.
     :param path: Path to the local Git repo
+    :param incremental: Reuse the compressed files of the previous release package that haven't changed.
+    :param use_store: Materialize the release folder from the content-addressed release store, rather than copying
+    every file. The .git and .idea folders are left out, see RELEASE_STORE_IGNORE_DIRS and blPython.release.storeOps.
+    :param workers: The maximum number of files hashed or copied at once.
+    :param export: Zip the files committed at HEAD with git archive, rather than walking the working copy.
+    :param compression: zipOps.Compression of the package files, by default they are deflated.
+    :param release_root: The studio release path to release to, by default STUDIO_RELEASE_PATH.
+    :param timer: Optional copyOps.PhaseTimer recording the report, zip and release phases.
+    :param zip_workers: The number of compression threads, by default the number of cpus.
     :return: path to the created zipfile.
     """
+    release_root = release_root or STUDIO_RELEASE_PATH
+    timer = timer or copyOps.PhaseTimer()
+
     # Check if path is valid git repo
     logger.debug('. Checking path is valid git repo : %s' % path)
 
@@ -273,7 +273,7 @@ def release_branch(path):
         # The package will be saved to a 'release' folder in the parent folder of the repo
 
         # define the root release folder for the current git repo
-        repo_release_path = os.path.join(STUDIO_RELEASE_PATH, git_repo_name)
+        repo_release_path = os.path.join(release_root, git_repo_name)
 
         # define the branch folder for this release, this has to be a semantic version under the release branch
         # This is where the actual release will live.
@@ -300,41 +300,60 @@ def release_branch(path):
             os.makedirs(zip_release_path)
 
         # create the report to include in the zipfile
-        report = create_git_release_report(path, report_type='json')
+        with timer.phase('report'):
+            report = create_git_release_report(path, report_type='json')
+        report_name = os.path.basename(report['report_path'])
 
-        # create the zipfile
-        try:
-            logger.debug('. Creating zipfile : %s' % zipfile_path)
-            zipf = zipfile.ZipFile(zipfile_path, 'w', zipfile.ZIP_DEFLATED)
-            zipdir(path, zipf)
-            zipf.close()
+        # Find the previous package to reuse the unchanged files from
+        previous_package = get_previous_package(zip_release_path, git_repo_name) if incremental else None
+        logger.debug('. Previous package : %s' % previous_package)
 
-        except RuntimeError:
-            logger.error('. Zipfile creation failed!\n. %s' % traceback.print_exc())
+        # create the zipfile
+        with timer.phase('zip'):
+            try:
+                logger.debug('. Creating zipfile : %s' % zipfile_path)
+                compression = compression or zipOps.parse_compression('deflate')
+                zipf = zipfile.ZipFile(zipfile_path, 'w', compression.compress_type)
+                previous_zipf = zipfile.ZipFile(previous_package, 'r') if previous_package else None
+                try:
+                    previous_digests = zipOps.read_digests(previous_zipf, report_name) if previous_zipf else None
+                    previous_level = zipOps.read_level(previous_zipf, report_name) if previous_zipf else None
+                    # Export the files committed at HEAD, untracked files, eg. .pyc files, are left out
+                    zip_function = zipOps.zipgit if export else zipOps.zipdir
+                    stats = zip_function(path, zipf, previous=previous_zipf, previous_digests=previous_digests,
+                                         exclude=[report_name], compression=compression,
+                                         previous_level=previous_level, workers=zip_workers)
+                    zipOps.log_stats(stats, logger)
+                finally:
+                    if previous_zipf:
+                        previous_zipf.close()
+
+                # Add the digests hashed while zipping to the report, and the report to the zipfile last
+                zipOps.add_report_digests(report, stats)
+                zipf.write(report['report_path'], report_name)
+                zipf.close()
+
+            except RuntimeError:
+                logger.error('. Zipfile creation failed!\n. %s' % traceback.print_exc())
 
         # Checkout out the branch in the release folder
         # Initial simple implementation is to simply copy our source path in to the destination folder
         # TODO Perhaps this should be updated with an actual git checkout method.
         logger.debug('. Path : %s' % path)
 
-        # Get the files and folders to copy
-        files = os.listdir(path)
-
-        for file in files:
-
-            # Get the source path
-            source = os.path.join(path,file)
-
-            # If the source is a directory, add the folder to the destination path
-            if os.path.isdir(source):
-                dest_dir = os.path.join(branch_release_path,os.path.basename(source))
+        with timer.phase('release'):
+            if use_store:
+                # Store the files once by content and link them in to the release folder
+                store = storeOps.ObjectStore(os.path.join(release_root, RELEASE_STORE_FOLDER))
+                manifest = store.release(path, branch_release_path, ignore_dirs=RELEASE_STORE_IGNORE_DIRS,
+                                         workers=workers)
             else:
-                # Otherwise set the destination path to the root of the branch release path
-                dest_dir = branch_release_path
+                # Copy every file in parallel, verified against the release manifest. The whole repo, .git
+                # included, is copied as it always has been, so the release folder is still a working repo
+                manifest = copyOps.copy_tree(path, branch_release_path, workers=workers)
 
-            # Copy the item
-            logger.debug('. Copying %s to %s' % (source,dest_dir))
-            copy(source, dest_dir)
+        logger.debug('. Release stats : %s' % pprint.pformat(dict(manifest['stats'])))
+        logger.debug('. Release timings : %s' % pprint.pformat(dict(manifest['timings'])))
 
         logger.debug('. Finished releasing package to %s' % pprint.pformat(branch_release_path))
         return (zipfile_path, branch_release_path, report)
@@ -343,57 +362,50 @@ def release_branch(path):
         raise ValueError('Path does not point to a valid git repository.')
 
 
-def upload_package_to_sg(pipeline_configuration_archive, pipeline_configuration_id, report_data=None):
+def upload_package_to_sg(pipeline_configuration_archive, pipeline_configuration_id, report_data=None, retries=uploadOps.DEFAULT_RETRIES):
 
     # NOT IMPLEMENTED YET
     # TODO : Updat this package to work with generic repos.
 
     logger.info('. Uploading config to pipeline configuration %s' % pipeline_configuration_id)
-    logger.info('. report_data %s' % report_data)
+    logger.info('. report_data %s' % (uploadOps.get_attachment_metadata(report_data) if report_data else report_data))
 
     SHOTGUN_CONFIG_PATH = os.path.join(os.environ.get('PIPELINE_ROOT'), 'Python/shotgun/shotgun_config.json')
 
     with open(SHOTGUN_CONFIG_PATH) as f:
         config = json.load(f)
 
-    sg = shotgun_api3.Shotgun(
-        config["SHOTGUN_SITE"],
-        'upload_pipeline_config_archive',
-        'qInx7cbtvdxrhufmu~ezzszlb'
-    )
+    sg = connection.get_connection('upload_pipeline_config_archive',
+                                   'qInx7cbtvdxrhufmu~ezzszlb',
+                                   site=config["SHOTGUN_SITE"])
 
-    # get pipeline configuration
-    pipeline_config = sg.find_one('PipelineConfiguration', [['id','is',pipeline_configuration_id]])
+    # get pipeline configuration, with the package and descriptor it currently holds
+    pipeline_config = sg.find_one('PipelineConfiguration', [['id','is',pipeline_configuration_id]], ['uploaded_config', 'descriptor'])
 
     if pipeline_config:
         logger.info('. Pipeline configuration valid. Processing upload now...')
 
-        # upload archive
-        uploaded_file_id = sg.upload('PipelineConfiguration',
+        # upload archive, unless this package is already uploaded. Failed uploads are retried.
+        upload_result = uploadOps.upload(sg, 'PipelineConfiguration',
                   pipeline_configuration_id,
                   pipeline_configuration_archive,
                   field_name="uploaded_config",
-                  display_name=os.path.basename(pipeline_configuration_archive))
+                  archive_digest=(report_data or {}).get('archive_digest'),
+                  current=pipeline_config.get('uploaded_config'),
+                  retries=retries,
+                  progress=functools.partial(uploadOps.log_upload_progress, log=logger))
+        uploaded_file_id = upload_result.attachment_id
 
         logger.info('. pipeline_configuration_version : %s' % uploaded_file_id)
 
-        # update descriptor
-
         # form the descriptor string
         descriptor_str = 'sgtk:descriptor:shotgun?entity_type=PipelineConfiguration&id=%s&field=uploaded_config&version=%s' % (pipeline_configuration_id, uploaded_file_id)
         logger.info('. descriptor_str : %s' % descriptor_str)
-        logger.info('. Updating descriptor field')
-
-        # prepare the update data
-        data = {'descriptor' : descriptor_str,}
-
-        # udate the entity
-        update_pc_descriptor = sg.update('PipelineConfiguration',
-                  pipeline_configuration_id,
-                  data)
-
-        logger.info('. PipelineConfiguration descriptor updated : %s' % update_pc_descriptor)
 
+        if upload_result.skipped and pipeline_config.get('descriptor') == descriptor_str:
+            # A previous release already uploaded this package and updated SG
+            logger.info('. PipelineConfiguration descriptor is up to date.')
+            return
 
         # Add report/metadata to uploaded file(the SG 'Attachment') and set type
 
@@ -403,7 +415,8 @@ def upload_package_to_sg(pipeline_configuration_archive, pipeline_configuration_
         if report_data:
 
             # Add the report dict to the metadata field of the attachment
-            data['metadata'] = str(report_data)
+            # The per file digests stay in the package's report, they can run to hundreds of KB
+            data['metadata'] = str(uploadOps.get_attachment_metadata(report_data))
             data['description'] = str(report_data.get('commit_comment',''))
             # This section is commented out as to implement this would require checking if the tags
             # already exist on SG and if not, creating them.
@@ -412,11 +425,14 @@ def upload_package_to_sg(pipeline_configuration_archive, pipeline_configuration_
             # if len(report_data['tags'])>0:
             #     data['tags'] = report_data['tags']
 
-        # udate the entity
-        update_file_metadata_result = sg.update('Attachment',
-                  uploaded_file_id,
-                  data)
+        # update the descriptor and the uploaded file in a single request
+        logger.info('. Updating descriptor field')
+        update_pc_descriptor, update_file_metadata_result = sg.batch([
+            {'request_type': 'update', 'entity_type': 'PipelineConfiguration', 'entity_id': pipeline_configuration_id,
+             'data': {'descriptor': descriptor_str}},
+            {'request_type': 'update', 'entity_type': 'Attachment', 'entity_id': uploaded_file_id, 'data': data}])
 
+        logger.info('. PipelineConfiguration descriptor updated : %s' % update_pc_descriptor)
         logger.info('. Uploaded file metadata updated : %s' % update_file_metadata_result)
 
     else:
@@ -470,10 +486,10 @@ def is_valid_repo(path):
     if re.match(pattern, current_branch_name):
         logger.debug('. branchname %s passes semantic versioning validation.' % current_branch_name)
     else:
-        raise RuntimeError("The branch %s checked out at %s, does not have a valid release branch name. Please ensure it follows semantic versioning standards." % (current_branch_name, project_file_path))
+        raise RuntimeError("The branch %s checked out at %s, does not have a valid release branch name. Please ensure it follows semantic versioning standards." % (current_branch_name, path))
 
     if gitOps.repo_has_uncommitted_changes(path):
-        raise RuntimeError("The branch %s checked out at %s, has uncommitted changes. Please commit and push before trying again." % (current_branch_name, project_file_path))
+        raise RuntimeError("The branch %s checked out at %s, has uncommitted changes. Please commit and push before trying again." % (current_branch_name, path))
 
     return True
 
@@ -499,7 +515,7 @@ if __name__ == "__main__":
 
     # Create the config archive
     logger.info('. %s is a valid release branch. Initiating release...' % project_file_path)
-    pipeline_configuration_archive, branch_release_path, report = release_branch(project_file_path)
+    pipeline_configuration_archive, branch_release_path, report = release_branch(project_file_path, incremental=args.incremental, use_store=args.store, workers=args.workers, export=args.export, compression=args.compression)
 
     logger.info('. Release package :  %s' % pipeline_configuration_archive)
     logger.info('. Release report : %s' % pprint.pformat(dict(report['data'])))
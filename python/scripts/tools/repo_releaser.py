@@ -0,0 +1,185 @@
+"""
+The repo_releaser releases several repos at once, eg. a config with the frameworks and apps it uses, running
+the repo_packager validation and release of each repo on a pool of processes.
+
+- Progress is logged as each repo completes.
+- A repo failing to validate or release doesn't stop the others, its error is reported instead.
+- One aggregate JSON report, with the timings of every repo and phase, is written to stdout, and to --report if given.
+- The exit code is 1 if any repo failed.
+
+"""
+
+import os, sys
+import logging
+import argparse
+import json
+import time
+import multiprocessing
+import traceback
+from collections import OrderedDict
+
+# Add path to sys.path for Blacksmith python modules
+# Temporary logic to find the current release path relative to this file
+# This should be removed once the repos are split and a studio wide BLPYTHON env var is in place.
+if not os.environ.get('BLPYTHON'):
+    tools_dir = os.path.dirname(__file__)
+    scripts_dir = os.path.dirname(tools_dir)
+    blPython_dir = os.path.dirname(scripts_dir)
+    blPythonPackage_dir = os.path.dirname(blPython_dir)
+    BL_PYTHON_PATH = blPythonPackage_dir
+else:
+    BL_PYTHON_PATH = os.environ.get('BLPYTHON')
+
+sys.path.append(BL_PYTHON_PATH)
+
+# Get Blacksmith modules.
+from blPython.release import zipOps, copyOps
+from blPython.scripts.tools import repo_packager
+
+# Setup logging
+logger = logging.getLogger('repo_releaser')
+logger.setLevel(logging.DEBUG)
+
+# create console handler, logging goes to stderr so stdout only holds the json
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+
+# create formatter
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+# add formatter to ch
+ch.setFormatter(formatter)
+
+# add ch to logger
+logger.addHandler(ch)
+
+RELEASED = 'released'
+FAILED = 'failed'
+
+
+def get_args():
+    """
+    Get the arguments and return them
+    :return: parsed argument object
+    """
+    examples = """Examples:\npython repo_releaser.py S:\\pipeline\\blk_sg_config\\shotgun-config\\master S:\\pipeline\\tk-framework-blPython\npython repo_releaser.py --processes 4 --incremental --report release_report.json <repos>"""
+
+    parser = argparse.ArgumentParser(
+        description='Validate and release several git repos at once, see repo_packager.py.',
+        epilog=examples,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        add_help=True)
+
+    parser.add_argument('repos', nargs='+', help='Paths of the repos to release.')
+    parser.add_argument('-p', '--processes', action="store", type=int, default=None, help='The maximum number of repos released at once, by default the number of cpus.')
+    parser.add_argument('-i', '--incremental', action="store_true", help='Reuse the unchanged files of the previous release packages instead of recompressing them.')
+    parser.add_argument('-s', '--store', action="store_true", help='Link the files of the release folders from the content-addressed release store instead of copying them, see repo_packager.py.')
+    parser.add_argument('-e', '--export', action="store_true", help='Zip the files committed at HEAD rather than the working copies, leaving out untracked files.')
+    parser.add_argument('-z', '--compression', action="store", type=zipOps.parse_compression, default='deflate', help='How the package files are compressed, see repo_packager.py.')
+    parser.add_argument('-w', '--workers', action="store", type=int, default=copyOps.DEFAULT_WORKERS, help='The maximum number of files hashed or copied at once, per repo.')
+    parser.add_argument('-o', '--release-root', action="store", type=str, default=None, help='The studio release path to release to, by default repo_packager.STUDIO_RELEASE_PATH.')
+    parser.add_argument('-r', '--report', action="store", type=str, default=None, help='Path to write the aggregate JSON report to.')
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    return parser.parse_args()
+
+
+def release_repo(job):
+    """
+    Validates and releases a single repo. Runs in a pool process, so errors are reported in the result rather than raised.
+
+    :param job: (repo path, dict of repo_packager.release_branch keyword arguments)
+    :return: OrderedDict of the repo's result
+    """
+    path, options = job
+    start = time.time()
+    timer = copyOps.PhaseTimer()
+
+    result = OrderedDict([('path', path), ('status', FAILED), ('package', None), ('release_path', None),
+                          ('archive_digest', None), ('error', None), ('seconds', None), ('timings', timer.timings)])
+    try:
+        with timer.phase('validate'):
+            repo_packager.is_valid_repo(path)
+
+        package, release_path, report = repo_packager.release_branch(path, timer=timer, **options)
+        result['status'] = RELEASED
+        result['package'] = package
+        result['release_path'] = release_path
+        result['archive_digest'] = report['data'].get('archive_digest')
+    except Exception as e:
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+        logger.debug('. Release of %s failed :\n%s' % (path, traceback.format_exc()))
+
+    result['seconds'] = round(time.time() - start, 3)
+    return result
+
+
+def release_repos(paths, processes=None, **options):
+    """
+    Releases repos on a pool of processes.
+
+    :param paths: list of repo paths
+    :param processes: The maximum number of repos released at once, by default the number of cpus.
+    :param options: repo_packager.release_branch keyword arguments, eg. incremental=True. By default the cpus are
+        shared between the processes' compression threads, see zip_workers.
+    :return: OrderedDict, the aggregate report
+    """
+    # A repo given twice is released once
+    paths = list(OrderedDict.fromkeys(os.path.abspath(path) for path in paths))
+    processes = max(1, min(processes or zipOps.get_default_workers(), len(paths)))
+    options = dict(options)
+    options['zip_workers'] = options.get('zip_workers') or max(1, zipOps.get_default_workers() // processes)
+    logger.info('. Releasing %s repos with %s processes' % (len(paths), processes))
+
+    start = time.time()
+    results = {}
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(release_repo, [(path, options) for path in paths]):
+            results[result['path']] = result
+            if result['status'] == RELEASED:
+                logger.info('. [%s/%s] Released %s in %.2fs' % (len(results), len(paths), result['path'], result['seconds']))
+            else:
+                logger.error('. [%s/%s] Failed to release %s : %s' % (len(results), len(paths), result['path'], result['error']))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    repos = [results[path] for path in paths]
+
+    # Total time spent in each phase, summed over the repos
+    phases = OrderedDict()
+    for result in repos:
+        for phase, seconds in result['timings'].items():
+            phases[phase] = round(phases.get(phase, 0.0) + seconds, 3)
+
+    report = OrderedDict([('repos_count', len(repos)),
+                          ('released', len([r for r in repos if r['status'] == RELEASED])),
+                          ('failed', len([r for r in repos if r['status'] == FAILED])),
+                          ('processes', processes),
+                          ('seconds', round(time.time() - start, 3)),
+                          ('phases', phases),
+                          ('repos', repos)])
+
+    logger.info('. Released %s of %s repos in %.2fs' % (report['released'], len(repos), report['seconds']))
+    return report
+
+
+if __name__ == "__main__":
+    args = get_args()
+
+    report = release_repos(args.repos, processes=args.processes, incremental=args.incremental,
+                           use_store=args.store, workers=args.workers, export=args.export,
+                           compression=args.compression, release_root=args.release_root)
+
+    json_report = json.dumps(report, indent=2)
+    sys.stdout.write(json_report + '\n')
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(json_report)
+
+    sys.exit(1 if report['failed'] else 0)
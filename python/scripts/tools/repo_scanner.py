@@ -0,0 +1,110 @@
+"""
+The repo_scanner reports the branch, HEAD commit, dirty state and tags of every git repo under one or
+more folders, eg. S:\pipeline, querying the repos concurrently.
+
+- Each result is written to stdout as a line of JSON as soon as it completes.
+- Use --array to write a single JSON array once every repo has been scanned instead.
+
+"""
+
+import os, sys
+import logging
+import argparse
+import json
+import time
+
+# Add path to sys.path for Blacksmith python modules
+# Temporary logic to find the current release path relative to this file
+# This should be removed once the repos are split and a studio wide BLPYTHON env var is in place.
+if not os.environ.get('BLPYTHON'):
+    tools_dir = os.path.dirname(__file__)
+    scripts_dir = os.path.dirname(tools_dir)
+    blPython_dir = os.path.dirname(scripts_dir)
+    blPythonPackage_dir = os.path.dirname(blPython_dir)
+    BL_PYTHON_PATH = blPythonPackage_dir
+else:
+    BL_PYTHON_PATH = os.environ.get('BLPYTHON')
+
+sys.path.append(BL_PYTHON_PATH)
+
+# Get Blacksmith modules.
+from blPython.git import gitOps, gitScan
+
+# Setup logging
+logger = logging.getLogger('repo_scanner')
+logger.setLevel(logging.DEBUG)
+
+# create console handler, logging goes to stderr so stdout only holds the json
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+
+# create formatter
+formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+# add formatter to ch
+ch.setFormatter(formatter)
+
+# add ch to logger
+logger.addHandler(ch)
+
+
+def get_args():
+    """
+    Get the arguments and return them
+    :return: parsed argument object
+    """
+    examples = """Examples:\npython repo_scanner.py S:\\pipeline\npython repo_scanner.py --repos S:\\pipeline\\blk_sg_config\\shotgun-config\\master --array"""
+
+    parser = argparse.ArgumentParser(
+        description='Report the branch, commit, dirty state and tags of every git repo found under the given folders.',
+        epilog=examples,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        add_help=True)
+
+    parser.add_argument('roots', nargs='*', help='Folders to search for git repos.')
+    parser.add_argument('-r', '--repos', nargs='*', default=[], help='Repo paths to scan directly, without searching.')
+    parser.add_argument('-w', '--workers', action="store", type=int, default=gitScan.DEFAULT_WORKERS, help='The maximum number of repos queried at once.')
+    parser.add_argument('-d', '--depth', action="store", type=int, default=3, help='How many folder levels below each root to search for repos.')
+    parser.add_argument('-b', '--backend', action="store", choices=gitOps.BACKENDS, default=gitOps.BACKEND, help='The gitOps backend to query the repos with.')
+    parser.add_argument('-a', '--array', action="store_true", help='Write a single JSON array instead of one JSON object per line.')
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    return parser.parse_args()
+
+
+def scan(roots, repos=None, workers=gitScan.DEFAULT_WORKERS, depth=3, array=False, stream=sys.stdout):
+    """
+    Scans the repos under roots plus the given repos and writes the results to stream as JSON.
+
+    :return: list of RepoStatus
+    """
+    paths = list(repos or [])
+    for root in roots:
+        paths += gitScan.find_repos(root, max_depth=depth)
+
+    logger.info('. Scanning %s repos with %s workers' % (len(paths), workers))
+    start = time.time()
+
+    results = []
+    for status in gitScan.scan(paths, workers=workers):
+        results.append(status)
+
+        if not array:
+            stream.write(json.dumps(gitScan.status_to_dict(status)) + '\n')
+            stream.flush()
+
+    if array:
+        stream.write(json.dumps([gitScan.status_to_dict(status) for status in results], indent=2) + '\n')
+
+    logger.info('. Scanned %s repos in %.2fs' % (len(results), time.time() - start))
+    return results
+
+
+if __name__ == "__main__":
+    args = get_args()
+    gitOps.set_backend(args.backend)
+
+    scan(args.roots, repos=args.repos, workers=args.workers, depth=args.depth, array=args.array)
@@ -5,8 +5,10 @@ import traceback
 import argparse
 import pprint
 import json
+import functools
 import getpass
 import datetime
+import subprocess
 
 from collections import OrderedDict
 
@@ -26,7 +28,9 @@ sys.path.append(BL_PYTHON_PATH)
 
 # Get Blacksmith modules.
 from blPython.core import config
+from blPython.core import connection
 from blPython.git import gitOps
+from blPython.release import zipOps, uploadOps
 
 # Add path to SG API (for shotgun_api3 and sgtk imports)
 sys.path.append(config.SG_API_PATH)
@@ -56,7 +60,7 @@ def get_args():
     Get the arguments and return them
     :return: parsed argument object
     """
-    examples = """Examples:\npython sg_packager.py --path S:\pipeline\blk_sg_config\shotgun-config\users\pm\shotgun-config --pc_id 66\npython sg_packager.py --pc_id 66"""
+    examples = """Examples:\npython sg_packager.py --path S:\\pipeline\\blk_sg_config\\shotgun-config\\users\\pm\\shotgun-config --pc_id 66\npython sg_packager.py --pc_id 66"""
 
     parser = argparse.ArgumentParser(
         description='Create a zip archive of a SG Pipeline Configuration and upload it to a SG Pipeline Configuration Entity. This tool will also upload any git metadata related to the \'metadata\' field of the SG \'attachment\' entity.',
@@ -66,6 +70,8 @@ def get_args():
 
     parser.add_argument('-i', '--pc_id', action="store", type=int, required=True, help='The pipeline configuration ID to upload the pc zip package to.')
     parser.add_argument('-p', '--path', action="store", required=False, type=str, help='The path of the pipeline configuration to zip and upload. If this argument is not specified, the current working directory will be used instead.')
+    parser.add_argument('-r', '--retries', action="store", type=int, default=uploadOps.DEFAULT_RETRIES, help='How many times a failed upload is retried, waiting longer after each attempt.')
+    parser.add_argument('-z', '--compression', action="store", type=zipOps.parse_compression, default='deflate', help='How the package files are compressed : store, deflate, bzip2, lzma or auto, optionally with a level, eg. deflate:9. auto deflates every file except already compressed formats like png or exr, which are stored.')
 
     if len(sys.argv) == 1:
         parser.print_help()
@@ -74,35 +80,6 @@ def get_args():
     return parser.parse_args()
 
 
-def zipdir(path, ziph, ignore_dirs=['.git','.idea']):
-    """
-    Zips the contents of 'path' into zipfile ziph ignoring folders specified in 'ignore_dirs'
-    :param path: Path to the local Git repo
-    :param ziph:
-    :param ignore_dirs: By default this method ignores git and pycharm folders.
-    :return:
-    """
-
-    # Verify path is a directory
-    if not os.path.isdir(path):
-        raise ValueError('Path is not a valid directory.')
-
-    # get the length of the path. This is used later to ensure the zipfile contents exclude the parent path
-    length = len(path)
-
-    for root, dirs, files in os.walk(path):
-        folder = root[length:]  # path without "parent"
-
-        # Exclude the .git and .idea folders from the zipfile
-        for dir_to_ignore in ignore_dirs:
-            if dir_to_ignore in dirs:
-                dirs.remove(dir_to_ignore)
-
-        # Add the files and remove the parent path
-        for file in files:
-            ziph.write(os.path.join(root, file), os.path.join(folder, file))
-
-
 def create_git_release_report(path, report_type='json'):
     """
     Creates a report of type txt or json containing various useful data.
@@ -119,17 +96,23 @@ def create_git_release_report(path, report_type='json'):
 
     report_dict = OrderedDict()
 
-    if gitOps.is_git_repository(path):
+    # Gather all the git metadata in one go, this fails if path isn't a git repo.
+    try:
+        git_metadata = gitOps.get_git_metadata(path)
+    except (subprocess.CalledProcessError, OSError):
+        git_metadata = None
+
+    if git_metadata:
 
         # get the git remote url
-        report_dict['repo_url'] = gitOps.get_git_remote_url_from_path(path)
+        report_dict['repo_url'] = git_metadata.repo_url
 
         # get the git repo name
-        report_dict['repo_name'] = gitOps.get_git_repo_name_from_path(path, sanitize=False)
+        report_dict['repo_name'] = git_metadata.repo_name
         logger.debug('. git_repo_name : %s' % report_dict['repo_name'])
 
         # get the branchname
-        report_dict['branch'] = gitOps.get_current_git_branch_from_path(path, strip_parent=False)
+        report_dict['branch'] = git_metadata.branch
         logger.debug('. Current branch : %s' % report_dict['branch'])
 
         # get the current user, time and date
@@ -139,12 +122,12 @@ def create_git_release_report(path, report_type='json'):
         report_dict['released_on'] = now.strftime("%m.%d.%Y")
 
         # get latest commit hash
-        report_dict['commit'] = gitOps.get_current_commit_hash_from_path(path, short=True)
-        report_dict['commit_comment'] = (gitOps.get_current_commit_comment_from_path(path))
+        report_dict['commit'] = git_metadata.commit_short
+        report_dict['commit_comment'] = git_metadata.commit_comment
 
         # get tag from path
-        report_dict['tags'] = gitOps.get_current_tags_from_path(path)
-        report_dict['tag_comment'] = gitOps.get_current_tag_messages_from_path(path)
+        report_dict['tags'] = git_metadata.tags
+        report_dict['tag_comment'] = git_metadata.tag_comment
 
         # Create the report
         if report_type == 'txt':
@@ -193,7 +176,7 @@ def create_git_release_report(path, report_type='json'):
         raise ValueError('Path does not point to a valid git repo : %s' % path)
 
 
-def zip_branch(path):
+def zip_branch(path, compression=None):
     """
     Utility to zip up the currently checked out branch of a git repository at the provided path.
     By default, the .git and .idea folders are excluded from the archive.
@@ -201,6 +184,7 @@ def zip_branch(path):
     The archive label will be the name of the currently checked out branch.
     On success, the zipfile path is returned.
     :param path: Path to the local Git repo
+    :param compression: zipOps.Compression of the package files, by default they are deflated.
     :return: path to the created zipfile.
     """
     # Check if path is valid git repo
@@ -232,10 +216,18 @@ def zip_branch(path):
         # create the report to include in the zipfile
         report = create_git_release_report(path, report_type='json')
 
+        report_name = os.path.basename(report['report_path'])
+
         # create the zipfile
         try:
-            zipf = zipfile.ZipFile(zipfile_path, 'w', zipfile.ZIP_DEFLATED)
-            zipdir(path, zipf)
+            compression = compression or zipOps.parse_compression('deflate')
+            zipf = zipfile.ZipFile(zipfile_path, 'w', compression.compress_type)
+            stats = zipOps.zipdir(path, zipf, exclude=[report_name], compression=compression)
+            zipOps.log_stats(stats, logger)
+
+            # Add the digests hashed while zipping to the report, and the report to the zipfile last
+            zipOps.add_report_digests(report, stats)
+            zipf.write(report['report_path'], report_name)
             zipf.close()
             return (zipfile_path, report)
 
@@ -246,54 +238,47 @@ def zip_branch(path):
         raise ValueError('Path does not point to a valid git repository.')
 
 
-def upload_pc_to_sg(pipeline_configuration_archive, pipeline_configuration_id, report_data=None):
+def upload_pc_to_sg(pipeline_configuration_archive, pipeline_configuration_id, report_data=None, retries=uploadOps.DEFAULT_RETRIES):
 
     logger.info('. Uploading config to pipeline configuration %s' % pipeline_configuration_id)
-    logger.info('. report_data %s' % report_data)
+    logger.info('. report_data %s' % (uploadOps.get_attachment_metadata(report_data) if report_data else report_data))
 
     SHOTGUN_CONFIG_PATH = os.path.join(os.environ.get('PIPELINE_ROOT'), 'Python/shotgun/shotgun_config.json')
 
     with open(SHOTGUN_CONFIG_PATH) as f:
         config = json.load(f)
 
-    sg = shotgun_api3.Shotgun(
-        config["SHOTGUN_SITE"],
-        'upload_pipeline_config_archive',
-        'qInx7cbtvdxrhufmu~ezzszlb'
-    )
+    sg = connection.get_connection('upload_pipeline_config_archive',
+                                   'qInx7cbtvdxrhufmu~ezzszlb',
+                                   site=config["SHOTGUN_SITE"])
 
-    # get pipeline configuration
-    pipeline_config = sg.find_one('PipelineConfiguration', [['id','is',pipeline_configuration_id]])
+    # get pipeline configuration, with the package and descriptor it currently holds
+    pipeline_config = sg.find_one('PipelineConfiguration', [['id','is',pipeline_configuration_id]], ['uploaded_config', 'descriptor'])
 
     if pipeline_config:
         logger.info('. Pipeline configuration valid. Processing upload now...')
 
-        # upload archive
-        uploaded_file_id = sg.upload('PipelineConfiguration',
+        # upload archive, unless this package is already uploaded. Failed uploads are retried.
+        upload_result = uploadOps.upload(sg, 'PipelineConfiguration',
                   pipeline_configuration_id,
                   pipeline_configuration_archive,
                   field_name="uploaded_config",
-                  display_name=os.path.basename(pipeline_configuration_archive))
+                  archive_digest=(report_data or {}).get('archive_digest'),
+                  current=pipeline_config.get('uploaded_config'),
+                  retries=retries,
+                  progress=functools.partial(uploadOps.log_upload_progress, log=logger))
+        uploaded_file_id = upload_result.attachment_id
 
         logger.info('. pipeline_configuration_version : %s' % uploaded_file_id)
 
-        # update descriptor
-
         # form the descriptor string
         descriptor_str = 'sgtk:descriptor:shotgun?entity_type=PipelineConfiguration&id=%s&field=uploaded_config&version=%s' % (pipeline_configuration_id, uploaded_file_id)
         logger.info('. descriptor_str : %s' % descriptor_str)
-        logger.info('. Updating descriptor field')
-
-        # prepare the update data
-        data = {'descriptor' : descriptor_str,}
-
-        # udate the entity
-        update_pc_descriptor = sg.update('PipelineConfiguration',
-                  pipeline_configuration_id,
-                  data)
-
-        logger.info('. PipelineConfiguration descriptor updated : %s' % update_pc_descriptor)
 
+        if upload_result.skipped and pipeline_config.get('descriptor') == descriptor_str:
+            # A previous release already uploaded this package and updated SG
+            logger.info('. PipelineConfiguration descriptor is up to date.')
+            return
 
         # Add report/metadata to uploaded file(the SG 'Attachment') and set type
 
@@ -303,7 +288,8 @@ def upload_pc_to_sg(pipeline_configuration_archive, pipeline_configuration_id, r
         if report_data:
 
             # Add the report dict to the metadata field of the attachment
-            data['metadata'] = str(report_data)
+            # The per file digests stay in the package's report, they can run to hundreds of KB
+            data['metadata'] = str(uploadOps.get_attachment_metadata(report_data))
             data['description'] = str(report_data.get('commit_comment',''))
             # This section is commented out as to implement this would require checking if the tags
             # already exist on SG and if not, creating them.
@@ -312,11 +298,14 @@ def upload_pc_to_sg(pipeline_configuration_archive, pipeline_configuration_id, r
             # if len(report_data['tags'])>0:
             #     data['tags'] = report_data['tags']
 
-        # udate the entity
-        update_file_metadata_result = sg.update('Attachment',
-                  uploaded_file_id,
-                  data)
+        # update the descriptor and the uploaded file in a single request
+        logger.info('. Updating descriptor field')
+        update_pc_descriptor, update_file_metadata_result = sg.batch([
+            {'request_type': 'update', 'entity_type': 'PipelineConfiguration', 'entity_id': pipeline_configuration_id,
+             'data': {'descriptor': descriptor_str}},
+            {'request_type': 'update', 'entity_type': 'Attachment', 'entity_id': uploaded_file_id, 'data': data}])
 
+        logger.info('. PipelineConfiguration descriptor updated : %s' % update_pc_descriptor)
         logger.info('. Uploaded file metadata updated : %s' % update_file_metadata_result)
 
 
@@ -374,12 +363,12 @@ if __name__ == "__main__":
 
     # Create the config archive
     logger.info('. Starting zipfile creation of %s' % project_file_path)
-    pipeline_configuration_archive, report = zip_branch(project_file_path)
+    pipeline_configuration_archive, report = zip_branch(project_file_path, compression=args.compression)
 
     if pipeline_configuration_archive:
         logger.info('. Zipfile successfully created : %s' % pipeline_configuration_archive)
 
-        upload_pc_to_sg(pipeline_configuration_archive, args.pc_id, report_data = report['data'])
+        upload_pc_to_sg(pipeline_configuration_archive, args.pc_id, report_data = report['data'], retries=args.retries)
 
 
 
@@ -1,8 +1,14 @@
+import os
+
 import sgtk
-import env
+from . import env
 logger = sgtk.LogManager.get_logger(__name__)
 
 def get_env(engine_name, context): #(engine_name=sgtk.platform.current_engine().name, context=sgtk.platform.current_engine().context):
     logger.debug(". get_env()")
-    reload(env)
+
+    # Reloading throws away the env module's caches, so only do it while developing.
+    if os.environ.get('BL_DEVMODE'):
+        reload(env)
+
     return env.Env(engine_name, context)
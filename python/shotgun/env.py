@@ -1,23 +1,241 @@
 import os
 import sys
 import ast
+import copy
+import json
+import hashlib
 import pprint
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
-import shotgun_api3
 import sgtk
 import tank
 import blPython
 import blPython.core._sys
-reload(blPython.core._sys)
+from blPython.core import config
+from blPython.core import connection
+from blPython.core.cache import LRUCache
+from blPython.shotgun import env_cache
 
 logger = sgtk.LogManager.get_logger(__name__)
 
-class Env:
-    def __init__(self, engine_name, context):
+# The SG entity holding the environment definitions.
+ENVIRONMENT_ENTITY_TYPE = config.CUSTOM_ENTITIES['Environment']
+
+# The fields needed to resolve an environment entity and its parents.
+ENVIRONMENT_FIELDS = ['sg_json', 'sg_parent', 'code', 'updated_at']
+
+# Threads looking up the project, engine and user layers concurrently, see get_env_layers_concurrently.
+LAYER_WORKERS = 3
+
+_layer_pool = None
+_layer_pool_lock = threading.Lock()
+
+# Process wide memo of the merged env of an environment entity and its ancestors, see
+# EnvironmentResolver.get_ancestry. Entries are keyed on the id and updated_at of every environment in the chain.
+ANCESTRY_CACHE = LRUCache(maxsize=int(os.environ.get('BLK_ENV_ANCESTRY_CACHE_SIZE', 1024)))
+
+# Process wide memo of parsed sg_json payloads, see parse_sg_json.
+PARSE_CACHE = LRUCache(maxsize=int(os.environ.get('BLK_ENV_PARSE_CACHE_SIZE', 1024)))
+
+
+class EnvironmentResolver(object):
+    """
+    Resolves environment entities and their sg_parent chains from memory.
+
+    Rather than one find_one per parent hop, the environment graph is pulled in with one
+    sg.find per generation (['id', 'in', ids]). Every chain is then walked from the fetched nodes.
+
+    The merged env of each chain is memoized in ANCESTRY_CACHE, so the ancestors shared by most chains,
+    eg. the studio env, are parsed and merged once per process rather than once per chain.
+    """
+
+    def __init__(self, sg):
+        self.sg = sg
+        self.nodes = {}
+
+    def add(self, env_entities):
+        """
+        Adds environment entities that have already been fetched with ENVIRONMENT_FIELDS to the graph.
+
+        :param env_entities: list of environment entity dicts
+        """
+        for env_entity in env_entities:
+            if all(field in env_entity for field in ENVIRONMENT_FIELDS):
+                self.nodes[env_entity['id']] = env_entity
+
+    def fetch(self, ids):
+        """
+        Fetches the given environment entities and all of their ancestors, one generation per query.
+
+        :param ids: list of environment entity ids
+        """
+        pending = set(i for i in ids if i not in self.nodes)
+
+        # Parents of nodes added with add() may not have been fetched yet.
+        for node in list(self.nodes.values()):
+            if node and node['sg_parent'] and node['sg_parent']['id'] not in self.nodes:
+                pending.add(node['sg_parent']['id'])
+
+        while pending:
+            results = self.sg.find(ENVIRONMENT_ENTITY_TYPE, [['id', 'in', sorted(pending)]], ENVIRONMENT_FIELDS)
+
+            for result in results:
+                self.nodes[result['id']] = result
+
+            # Remember missing entities so they aren't queried again.
+            for i in pending:
+                self.nodes.setdefault(i, None)
+
+            pending = set(result['sg_parent']['id'] for result in results
+                          if result['sg_parent'] and result['sg_parent']['id'] not in self.nodes)
+
+    def get_ancestors(self, id):
+        """
+        Returns the fetched environment entity and its ancestors, child first. The chain is walked iteratively
+        and stops at the first environment seen twice, so a mis-parented entity can't loop forever.
+
+        :param id: The environment entity id
+        :return: list of environment entity dicts
+        """
+        nodes = []
+        visited = set()
+        while id is not None:
+            if id in visited:
+                logger.warning("The parents of environment %s loop back to %s, ignoring the loop." % (nodes[0]['id'], id))
+                break
+            visited.add(id)
+
+            node = self.nodes.get(id)
+            if not node:
+                break
+
+            nodes.append(node)
+            id = node['sg_parent']['id'] if node['sg_parent'] else None
+
+        return nodes
+
+    def get_chain(self, id):
+        """
+        Returns the environment entity and its ancestors that define sg_json, child first.
+
+        :param id: The environment entity id
+        :return: list of environment entity dicts
+        """
+        self.fetch([id])
+        return [node for node in self.get_ancestors(id) if node['sg_json']]
+
+    def get_ancestry(self, id):
+        """
+        Returns the merged env of an environment entity and its ancestors, children overriding their parents.
+
+        The merged env of every environment in the chain is memoized in ANCESTRY_CACHE, keyed on the
+        (id, updated_at) of the environment and each of its ancestors, so an entry is only used while none of
+        them has been updated. Resolving an environment whose parent was resolved before costs a lookup and
+        the parse of its own sg_json.
+
+        The returned dict is shared with the memo and must not be modified.
+
+        :param id: The environment entity id
+        :return: The merged env dict
+        """
+        self.fetch([id])
+        nodes = self.get_ancestors(id)
+        nodes.reverse()
+
+        # The memo keys of the chain, root first
+        keys = []
+        key = ()
+        for node in nodes:
+            key += ((node['id'], node['updated_at']),)
+            keys.append(key)
+
+        # Start from the deepest environment already merged
+        env = {}
+        start = 0
+        for i in range(len(keys) - 1, -1, -1):
+            cached = ANCESTRY_CACHE.get(keys[i])
+            if cached is not None:
+                env = cached
+                start = i + 1
+                break
+
+        for node, key in zip(nodes[start:], keys[start:]):
+            if node['sg_json']:
+                env = dict(env)
+                env.update(parse_sg_json(node['id'], node['sg_json']))
+            ANCESTRY_CACHE.set(key, env)
+
+        return env
+
+    def get_updated_at(self, ids=None):
+        """
+        Returns the 'updated_at' of every environment entity fetched so far.
+
+        :param ids: Only return the given environment entities and their ancestors
+        :return: dict of {environment entity id: updated_at}
+        """
+        if ids is None:
+            return dict((id, node['updated_at']) for id, node in self.nodes.items() if node)
+
+        self.fetch(ids)
+        return dict((node['id'], node['updated_at']) for id in ids for node in self.get_ancestors(id))
+
+    def resolve(self, env_entities):
+        """
+        Merges the environments of the given entities, parents first so children override them.
+
+        :param env_entities: list of environment entity dicts
+        :return: The merged env dict
+        """
+        self.fetch([env_entity['id'] for env_entity in env_entities])
+
+        env = {}
+        for env_entity in env_entities:
+            env.update(self.get_ancestry(env_entity['id']))
+
+        # The memoized values are shared, give the caller its own copies
+        return dict((key, copy.copy(value)) for key, value in env.items())
+
+
+def parse_sg_json(id, sg_json):
+    """
+    Parses the sg_json payload of an environment entity. JSON is parsed with json.loads, legacy payloads
+    written as Python literals fall back to ast.literal_eval, which is several times slower. Under Python 2
+    the strings json returns are converted to str, as os.environ only takes str.
+
+    Results are memoized in PARSE_CACHE, keyed on the entity id and a hash of the payload, so an unchanged
+    payload is parsed once per process. The returned dict is shared with the memo and must not be modified.
+
+    :param id: The environment entity id
+    :param sg_json: The payload text
+    :return: The env dict
+    """
+    data = sg_json if isinstance(sg_json, bytes) else sg_json.encode('utf-8')
+    key = (id, hashlib.sha1(data).hexdigest())
+
+    env = PARSE_CACHE.get(key)
+    if env is None:
+        try:
+            env = blPython.core._sys.to_native_str(json.loads(sg_json))
+        except ValueError:
+            env = ast.literal_eval(sg_json)
+        PARSE_CACHE.set(key, env)
+
+    return env
+
+
+class Env(object):
+    def __init__(self, engine_name, context, cache=None, concurrent=False):
         """
 
         :param engine: The engine-name
         :param context:  The SG context entity
+        :param cache: The EnvCache to serve the env from. Defaults to the process wide cache, which is off
+            unless BL_ENV_CACHE_TTL is set, see env_cache. Set to False to always resolve the env from SG.
+        :param concurrent: Look up the project, engine and user layers at the same time, each on its own
+            pooled SG connection, see get_env_layers_concurrently.
         """
         logger.debug("Initialising SG Environment")
 
@@ -28,47 +246,60 @@ class Env:
         if not isinstance(context, tank.context.Context):
             raise ValueError("Supplied context is not a valid SG context : %s" % context)
 
-        self.sg = self.get_sg()
-        self.project = self.get_project(context.project)
+        # The SG connection and project are only created when needed, so a cached env
+        # can be served without any network access.
+        self._sg = None
+        self._project = None
+        self._resolver = None
 
-        # Get Studio env
-        studio_env_id = 3
-        logger.debug(". Getting Studio env...")
-        self.env.update( self.parse_env( [ {'type':blPython.custom_entities['Environment'], 'id': studio_env_id} ] ) )
-        #logger.debug("\nenv : {}".format(self.env))
+        if cache is None:
+            cache = env_cache.get_cache()
+        self.cache = cache
 
-        # Get Engine Env
-        logger.debug(". Getting Engine env...{}".format(self.engine_name))
-        engine_env = self.get_engine_env()
-        self.env.update( engine_env  )
-        #logger.debug("\nenv : {}".format(self.env))
+        user_id = self.context.user['id'] if self.context.user else None
 
-        # Get Project Env
-        logger.debug(". Getting Project env...")
-        project_env = self.get_project_env()
-        #logger.debug("# project_env : {}".format(project_env))
-        self.env.update( project_env )
-        # logger.debug("\nenv : {}".format(self.env))
+        cached_env = None
+        if self.cache:
+            cached_env = self.cache.get(self.engine_name, context.project['id'], user_id, sg=lambda: self.sg)
 
-        # Get User Env
-        logger.debug(". Getting User env...")
+        if cached_env is not None:
+            self.env = cached_env
+        elif concurrent:
+            self._project, layers = get_env_layers_concurrently(self.get_sg, self.engine_name, context.project,
+                                                                self.context.user)
+            self.env = resolve_layers(self.resolver, layers)
+        else:
+            self.env = resolve_env(self.sg, self.engine_name, self.project, self.context.user, resolver=self.resolver)
 
-        user_env = self.get_user_env()
-        # logger.debug("# user_env : {}".format(user_env))
-        self.env.update( user_env )
+        if cached_env is None and self.cache:
+            self.cache.put(self.engine_name, context.project['id'], user_id, self.env, self.resolver.get_updated_at())
 
         logger.debug("\n. Final env : {}".format(pprint.pformat(self.env)))
 
-        # self.env.update(ast.literal_eval())
+    @property
+    def sg(self):
+        if self._sg is None:
+            self._sg = self.get_sg()
+        return self._sg
 
-    def get_user_env(self):
-        user = self.sg.find_one('HumanUser', [['id', 'is', self.context.user['id']]], ['sg_env'])
+    @sg.setter
+    def sg(self, value):
+        self._sg = value
 
-        user_env_entities = self.sg.find(blPython.custom_entities['Environment'],[['human_user_sg_env_human_users','in',user]],['sg_json','sg_parent','code'])
-        if user_env_entities:
-            return self.parse_env(user_env_entities)
-        else:
-            return {}
+    @property
+    def project(self):
+        if self._project is None:
+            self._project = self.get_project(self.context.project)
+        return self._project
+
+    @property
+    def resolver(self):
+        if self._resolver is None:
+            self._resolver = EnvironmentResolver(self.sg)
+        return self._resolver
+
+    def get_user_env(self):
+        return self.parse_env(get_user_env_entities(self.sg, self.context.user))
 
     def get_project_env(self):
         if self.project['sg_env']:
@@ -77,41 +308,13 @@ class Env:
             return {}
 
     def get_engine_env(self):
-        engine_software = self.sg.find_one("Software", [['project_sg_software_projects', 'in', self.context.project], ['engine','is',self.engine_name]], ['code', 'sg_env'])
-
-        print("engine_software : {}".format(engine_software))
-        if engine_software:
-            if engine_software.get('sg_env'):
-                return self.parse_env( [ engine_software.get('sg_env') ])
-
-        return {}
+        return self.parse_env(get_engine_env_entities(self.sg, self.engine_name, self.project))
 
     def get_environment_recursive(self, id):
-        envs = []
-
-        result = self.sg.find_one(blPython.custom_entities['Environment'],[['id','is',id]],['sg_json','sg_parent','code'])
-        if result:
-            if result['sg_json']:
-                envs.append(result)
-
-            if result['sg_parent']:
-                parent = self.get_environment_recursive(result['sg_parent']['id'])
-                envs += parent
-
-        return envs
+        return self.resolver.get_chain(id)
 
     def parse_env(self, env_entities):
-        env = {}
-        # logger.debug(env_entities)
-        for env_entity in env_entities:
-            envs = self.get_environment_recursive(env_entity['id'])
-            envs.reverse()
-
-            for i in envs:
-                env_data = ast.literal_eval(i['sg_json'])
-                env.update(env_data)
-
-        return env
+        return self.resolver.resolve(env_entities)
 
     def set_env(self):
         logger.debug("Updating environment...")
@@ -144,7 +347,7 @@ class Env:
             logger.debug(". . {}".format(path))
 
     def get_studio_env(self):
-        env_global = self.sg.find_one(blPython.custom_entities['Environment'],[['code','is','Global']],['sg_json', 'sg_parent'])
+        return self.parse_env(get_studio_env_entities())
 
     def get_project(self, project):
         # logger.debug("get_project({})".format(project['id']))
@@ -169,13 +372,135 @@ class Env:
 
 
 
+def get_studio_env_entities():
+    return [{'type': ENVIRONMENT_ENTITY_TYPE, 'id': config.GLOBAL_ENVIRONMENT_ID}]
+
+
+def get_engine_env_entities(sg, engine_name, project):
+    engine_software = sg.find_one("Software",
+                                  [['project_sg_software_projects', 'in', {'type': project['type'], 'id': project['id']}],
+                                   ['engine', 'is', engine_name]],
+                                  ['code', 'sg_env'])
+
+    logger.debug("engine_software : {}".format(engine_software))
+    if engine_software and engine_software.get('sg_env'):
+        return [engine_software['sg_env']]
+
+    return []
+
+
+def get_user_env_entities(sg, user):
+    if not user:
+        return []
+
+    return sg.find(ENVIRONMENT_ENTITY_TYPE,
+                   [['human_user_sg_env_human_users', 'in', {'type': user['type'], 'id': user['id']}]],
+                   ENVIRONMENT_FIELDS)
+
+
+def get_env_layers(sg, engine_name, project, user):
+    """
+    Returns the environment entities of every layer, keyed by layer name in merge order.
+
+    :param sg: SG connection
+    :param engine_name: The engine name, eg. 'tk-nuke'
+    :param project: Project entity dict including its 'sg_env' field
+    :param user: HumanUser entity dict, or None
+    :return: OrderedDict of {layer name: list of environment entities}
+    """
+    layers = OrderedDict()
+    layers['studio'] = get_studio_env_entities()
+    layers['engine'] = get_engine_env_entities(sg, engine_name, project)
+    layers['project'] = [project['sg_env']] if project.get('sg_env') else []
+    layers['user'] = get_user_env_entities(sg, user)
+    return layers
+
+
+def get_layer_pool():
+    """
+    Returns the process wide pool the layers are looked up on, created on first use and kept for the life of
+    the process so its threads, and their pooled SG connections, are reused by every Env.
+    """
+    global _layer_pool
+    with _layer_pool_lock:
+        if _layer_pool is None:
+            _layer_pool = ThreadPool(LAYER_WORKERS)
+        return _layer_pool
+
+
+def get_env_layers_concurrently(get_sg, engine_name, project, user):
+    """
+    Returns the environment entities of every layer like get_env_layers, looking up the project, its engine
+    software and the user's environments at the same time rather than one after the other.
+
+    shotgun_api3 connections can't be shared between threads, so each lookup uses the connection get_sg
+    returns on its thread, eg. blPython.core.connection.get_connection.
+
+    :param get_sg: callable returning the calling thread's SG connection
+    :param engine_name: The engine name, eg. 'tk-nuke'
+    :param project: Project entity dict, its 'sg_env' and 'sg_software' are looked up with the layers
+    :param user: HumanUser entity dict, or None
+    :return: (Project entity dict, OrderedDict of {layer name: list of environment entities})
+    """
+    pool = get_layer_pool()
+    project_result = pool.apply_async(
+        lambda: get_sg().find_one('Project', [['id', 'is', project['id']]], ['sg_env', 'sg_software']))
+    engine_result = pool.apply_async(lambda: get_engine_env_entities(get_sg(), engine_name, project))
+    user_result = pool.apply_async(lambda: get_user_env_entities(get_sg(), user))
+
+    project = project_result.get()
+
+    layers = OrderedDict()
+    layers['studio'] = get_studio_env_entities()
+    layers['engine'] = engine_result.get()
+    layers['project'] = [project['sg_env']] if project and project.get('sg_env') else []
+    layers['user'] = user_result.get()
+    return project, layers
+
+
+def resolve_layers(resolver, layers):
+    """
+    Merges the environment layers in order, so each layer overrides the ones before it.
+
+    The environment entities of all layers are collected first so the whole environment graph
+    can be fetched in one batched walk before any chain is resolved.
+
+    :param resolver: EnvironmentResolver to fetch the environment graph with
+    :param layers: OrderedDict of {layer name: list of environment entities}, see get_env_layers
+    :return: The merged env dict
+    """
+    # The user environments were fetched with all the fields we need.
+    resolver.add(layers['user'])
+    resolver.fetch([env_entity['id'] for env_entities in layers.values() for env_entity in env_entities])
+
+    env = {}
+    for layer, env_entities in layers.items():
+        logger.debug(". Getting {} env...".format(layer))
+        env.update(resolver.resolve(env_entities))
+
+    return env
+
+
+def resolve_env(sg, engine_name, project, user, resolver=None):
+    """
+    Resolves the merged studio -> engine -> project -> user environment.
+
+    :param sg: SG connection
+    :param engine_name: The engine name, eg. 'tk-nuke'
+    :param project: Project entity dict including its 'sg_env' field
+    :param user: HumanUser entity dict, or None
+    :param resolver: Optional EnvironmentResolver to share its fetched graph.
+    :return: The merged env dict
+    """
+    resolver = resolver or EnvironmentResolver(sg)
+    return resolve_layers(resolver, get_env_layers(sg, engine_name, project, user))
+
+
 def get_engine():
     sgtk.platform.current_engine()
 
 def get_sg():
-    sg = shotgun_api3.Shotgun("https://blacksmith.shotgunstudio.com",
-                          script_name="blPython",
-                          api_key="p7s&cwqohkxaNiwujgeombrsx")
+    sg = connection.get_connection()
     if not sg:
         raise RuntimeError("Unable to authenticate Script User for blPython")
     else:
@@ -0,0 +1,341 @@
+"""
+Precomputed env activation bundles, so farm tasks can set up their env without any network access.
+
+A bundle is a folder holding the resolved Env.env of every (engine name, project id, user id) combination,
+built by scripts/tools/env_bundler.py :
+
+- index.json, a compact index of the combinations, with the payload files of each and the ids and 'updated_at'
+  values of every environment entity it was resolved from.
+- <engine>_<project>_<user>.json, the env dict of a combination, plus .sh and .bat scripts applying it
+  for tasks that aren't launched from Python. Combinations without a user are named <engine>_<project>_default.
+
+A task looks its env up in the bundle with EnvBundle.get, falling back to the combination without a user when
+the user doesn't have environments of their own, and applies it with activate, get_environ or launch.
+None of these talk to SG, only check_freshness does. The env is applied like Env.set_env applies it, see
+apply_env and the activation scripts for where they differ.
+
+Rebuilding a bundle only rewrites the combinations whose environment entities have a new 'updated_at'.
+"""
+import os, sys
+import json
+import time
+import logging
+import subprocess
+
+from blPython.core import config
+from blPython.core._sys import to_native_str
+from blPython.shotgun.env_cache import _atomic_write
+
+logger = logging.getLogger(__name__)
+
+ENVIRONMENT_ENTITY_TYPE = config.CUSTOM_ENTITIES['Environment']
+
+BUNDLE_VERSION = 1
+
+INDEX_FILE = 'index.json'
+
+# The payload files written for every combination.
+PAYLOAD_EXTENSIONS = ['.json', '.sh', '.bat']
+
+# The separators the activation scripts append with, apply_env uses os.pathsep.
+SHELL_PATHSEP = ':'
+BATCH_PATHSEP = ';'
+
+
+def make_key(engine_name, project_id, user_id=None):
+    return '%s/%s/%s' % (engine_name, project_id, user_id if user_id is not None else '-')
+
+
+def get_payload_name(engine_name, project_id, user_id=None):
+    return '%s_%s_%s' % (engine_name, project_id, user_id if user_id is not None else 'default')
+
+
+def normalize_path(path):
+    """
+    Makes a path absolute, and lower case on Windows, like blPython.core._sys does before adding it.
+    """
+    path = os.path.abspath(path)
+    if sys.platform == 'win32':
+        path = path.lower()
+    return path
+
+
+def has_path(paths, path):
+    """
+    Checks whether a normalized path is in a list of paths, compared like blPython.core._sys does.
+    """
+    for x in paths:
+        x = normalize_path(x)
+        if path in (x, x + os.sep):
+            return True
+    return False
+
+
+def apply_env(env, environ, sys_path=None):
+    """
+    Applies an env dict to environ like Env.set_env does :
+
+    - 'set' replaces the variable.
+    - 'append' skips paths that don't exist. Other paths are made absolute, and lower case on Windows, and added
+      unless the variable already holds them, compared the same way.
+    - PYTHONPATH appends are added to the front of sys_path, like set_env adds them to sys.path, and not to environ.
+
+    Where it differs from Env.set_env :
+
+    - Without sys_path, eg. for the environ of a new process, PYTHONPATH appends are added to environ instead,
+      as the new process has no other way of getting them.
+    - Appending to an unset variable sets it, where set_env raises a KeyError.
+    - Paths appended to other variables aren't also added to sys.path.
+
+    :param env: The env dict, see Env.env
+    :param environ: The environment dict to update, eg. os.environ
+    :param sys_path: Optional list the PYTHONPATH appends are added to instead of environ, eg. sys.path
+    """
+    for key in sorted(env):
+        item = env[key]
+        value = item['value']
+
+        if item['action'] == 'set':
+            environ[key] = value
+
+        elif item['action'] == 'append':
+            if not os.path.exists(value):
+                logger.debug('. Not adding missing path to %s : %s' % (key, value))
+                continue
+            path = normalize_path(value)
+
+            if key == 'PYTHONPATH' and sys_path is not None:
+                if not has_path(sys_path, path):
+                    sys_path.insert(0, path)
+                continue
+
+            current = environ.get(key)
+            if not current:
+                environ[key] = path
+            elif not has_path(current.split(os.pathsep), path):
+                environ[key] = current + os.pathsep + path
+
+
+def _shell_quote(value):
+    return "'%s'" % value.replace("'", "'\"'\"'")
+
+
+def make_shell_script(env):
+    """
+    Returns a sh script applying env like apply_env does for a new process, except that the appended paths
+    are neither made absolute nor compared case insensitively.
+
+    :return: The text of a sh script applying env, to be sourced.
+    """
+    lines = ['# Generated by env_bundler.py, source this file to activate the env.']
+    for key in sorted(env):
+        item = env[key]
+        value = _shell_quote(item['value'])
+        if item['action'] == 'set':
+            lines.append('export %s=%s' % (key, value))
+        elif item['action'] == 'append':
+            lines.append('if [ -e %s ]; then case "%s${%s}%s" in *%s%s%s*) ;; *) export %s="${%s:+${%s}%s}"%s ;; esac; fi'
+                         % (value, SHELL_PATHSEP, key, SHELL_PATHSEP, SHELL_PATHSEP, value, SHELL_PATHSEP,
+                            key, key, key, SHELL_PATHSEP, value))
+    return '\n'.join(lines) + '\n'
+
+
+def make_batch_script(env):
+    """
+    Returns a batch script applying env like apply_env does for a new process, except that the appended paths
+    aren't made absolute. Paths are compared case insensitively, like on Windows.
+
+    :return: The text of a batch script applying env, to be called.
+    """
+    lines = ['@echo off', 'rem Generated by env_bundler.py, call this file to activate the env.']
+    for key in sorted(env):
+        item = env[key]
+        value = item['value'].replace('%', '%%')
+        if item['action'] == 'set':
+            lines.append('set "%s=%s"' % (key, value))
+        elif item['action'] == 'append':
+            lines.extend(['if exist "%s" (' % value,
+                          '  if defined %s (' % key,
+                          '    echo "%s%%%s%%%s" | find /i "%s%s%s" >nul || set "%s=%%%s%%%s%s"'
+                          % (BATCH_PATHSEP, key, BATCH_PATHSEP, BATCH_PATHSEP, value, BATCH_PATHSEP,
+                             key, key, BATCH_PATHSEP, value),
+                          '  ) else (',
+                          '    set "%s=%s"' % (key, value),
+                          '  )',
+                          ')'])
+    return '\r\n'.join(lines) + '\r\n'
+
+
+class EnvBundle(object):
+    """
+    A folder of precomputed envs, see the module docstring.
+
+    :param path: The bundle folder
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._index = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = self.load_index()
+        return self._index
+
+    def load_index(self):
+        """
+        :return: The index dict, an empty index if the bundle hasn't been built yet or was built by another version.
+        """
+        try:
+            with open(os.path.join(self.path, INDEX_FILE)) as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            index = None
+
+        if not index or index.get('version') != BUNDLE_VERSION:
+            index = {'version': BUNDLE_VERSION, 'built_at': None, 'combinations': {}}
+        return index
+
+    def write_index(self):
+        self.index['built_at'] = time.time()
+        _atomic_write(os.path.join(self.path, INDEX_FILE), self.index)
+
+    def get_entry(self, engine_name, project_id, user_id=None):
+        """
+        Returns the index entry of a combination, the user's own if they have one, otherwise the project's.
+
+        :return: The index entry dict, or None
+        """
+        combinations = self.index['combinations']
+        if user_id is not None and make_key(engine_name, project_id, user_id) in combinations:
+            return combinations[make_key(engine_name, project_id, user_id)]
+        return combinations.get(make_key(engine_name, project_id))
+
+    def get(self, engine_name, project_id, user_id=None):
+        """
+        Returns the env dict of a combination, without any network access.
+
+        :return: The env dict, or None if the bundle doesn't hold the combination
+        """
+        entry = self.get_entry(engine_name, project_id, user_id)
+        if entry is None:
+            logger.debug('. Env bundle miss : %s' % make_key(engine_name, project_id, user_id))
+            return None
+
+        with open(os.path.join(self.path, entry['name'] + '.json')) as f:
+            return to_native_str(json.load(f)['env'])
+
+    def get_environ(self, engine_name, project_id, user_id=None, environ=None):
+        """
+        Returns a copy of environ, os.environ by default, with a combination's env applied, eg. for subprocess.
+
+        :raises: KeyError if the bundle doesn't hold the combination
+        """
+        env = self.get(engine_name, project_id, user_id)
+        if env is None:
+            raise KeyError('The env bundle %s has no env for %s' % (self.path, make_key(engine_name, project_id, user_id)))
+
+        environ = dict(os.environ if environ is None else environ)
+        apply_env(env, environ)
+        return environ
+
+    def activate(self, engine_name, project_id, user_id=None):
+        """
+        Applies a combination's env to os.environ and sys.path, like Env.set_env.
+
+        :raises: KeyError if the bundle doesn't hold the combination
+        """
+        env = self.get(engine_name, project_id, user_id)
+        if env is None:
+            raise KeyError('The env bundle %s has no env for %s' % (self.path, make_key(engine_name, project_id, user_id)))
+
+        apply_env(env, os.environ, sys.path)
+        return env
+
+    def launch(self, args, engine_name, project_id, user_id=None, **kwargs):
+        """
+        Runs a command with a combination's env.
+
+        :param args: The command, see subprocess.call
+        :param kwargs: subprocess.call keyword arguments
+        :return: The command's return code
+        """
+        kwargs['env'] = self.get_environ(engine_name, project_id, user_id, environ=kwargs.get('env'))
+        return subprocess.call(args, **kwargs)
+
+    def write(self, engine_name, project_id, user_id, env, environments):
+        """
+        Writes the payloads of a combination and adds it to the index, see write_index.
+
+        :param env: The merged env dict
+        :param environments: dict of {environment entity id: updated_at} of every environment entity
+            the env was resolved from.
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        name = get_payload_name(engine_name, project_id, user_id)
+        _atomic_write(os.path.join(self.path, name + '.json'),
+                      {'key': [engine_name, project_id, user_id], 'env': env})
+        for extension, text in [('.sh', make_shell_script(env)), ('.bat', make_batch_script(env))]:
+            with open(os.path.join(self.path, name + extension), 'wb') as f:
+                f.write(text.encode('utf-8'))
+
+        self.index['combinations'][make_key(engine_name, project_id, user_id)] = {
+            'key': [engine_name, project_id, user_id],
+            'name': name,
+            'environments': dict((str(i), str(updated_at)) for i, updated_at in environments.items())}
+
+    def remove(self, key):
+        """
+        Removes a combination's payloads and index entry.
+
+        :param key: The combination key, see make_key
+        """
+        entry = self.index['combinations'].pop(key, None)
+        if entry is None:
+            return
+
+        for extension in PAYLOAD_EXTENSIONS:
+            try:
+                os.remove(os.path.join(self.path, entry['name'] + extension))
+            except OSError:
+                pass
+
+    def is_current(self, key, environments):
+        """
+        Checks a combination is in the bundle and was resolved from the given environment entities.
+
+        :param environments: dict of {environment entity id: updated_at}
+        """
+        entry = self.index['combinations'].get(key)
+        if entry is None:
+            return False
+
+        if not all(os.path.exists(os.path.join(self.path, entry['name'] + extension))
+                   for extension in PAYLOAD_EXTENSIONS):
+            return False
+
+        return entry['environments'] == dict((str(i), str(updated_at)) for i, updated_at in environments.items())
+
+    def check_freshness(self, sg):
+        """
+        Checks the environment entities of every combination in a single query.
+
+        Changes to which environments a Project, Software or HumanUser links to aren't seen here, only a
+        rebuild picks those up.
+
+        :param sg: SG connection
+        :return: list of the keys of the combinations with an updated or deleted environment entity
+        """
+        combinations = self.index['combinations']
+        ids = set(int(i) for entry in combinations.values() for i in entry['environments'])
+        if not ids:
+            return []
+
+        results = sg.find(ENVIRONMENT_ENTITY_TYPE, [['id', 'in', sorted(ids)]], ['updated_at'])
+        current = dict((str(result['id']), str(result['updated_at'])) for result in results)
+
+        return sorted(key for key, entry in combinations.items()
+                      if any(current.get(i) != updated_at for i, updated_at in entry['environments'].items()))
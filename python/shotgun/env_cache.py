@@ -0,0 +1,278 @@
+"""
+Persistent on-disk cache of resolved Env dictionaries.
+
+Each entry holds the merged Env.env dict for an (engine name, project id, user id) combination, along
+with the ids and 'updated_at' values of every environment entity that went into it.
+
+- Entries younger than the TTL are served without any network access.
+- Once the TTL has expired, an entry is revalidated with one batched 'updated_at' query for all of its
+  environment entities. If none of them have changed the entry is renewed, otherwise it is discarded.
+- Entries can be invalidated explicitly, or from a SG event (eg. from an event daemon plugin).
+
+The revalidation only sees updates to the environment entities an entry was resolved from. Changes to which
+environments apply, eg. a Project's sg_env being repointed, a Software's env changing or a user gaining or
+losing an environment, aren't seen until the entry is invalidated, see invalidate_from_event.
+
+The cache is off unless BL_ENV_CACHE_TTL is set to a number of seconds above 0. Its location can be set
+with the BL_ENV_CACHE_DIR env var.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+from blPython.core import config
+from blPython.core._sys import to_native_str
+
+logger = logging.getLogger(__name__)
+
+ENVIRONMENT_ENTITY_TYPE = config.CUSTOM_ENTITIES['Environment']
+
+# Default location and time to live (in seconds) of the cache.
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.blPython', 'env_cache')
+DEFAULT_TTL = 3600
+
+CACHE_VERSION = 1
+
+
+def _atomic_write(path, data):
+    """
+    Writes data as json to path so readers never see a partially written file.
+    """
+    tmp_path = '%s.%s.%s.tmp' % (path, os.getpid(), threading.current_thread().ident)
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+
+    replace = getattr(os, 'replace', None)
+    if replace:
+        replace(tmp_path, path)
+    else:
+        # Python 2 on Windows can't rename over an existing file.
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+
+
+class EnvCache(object):
+    """
+    On-disk cache of resolved env dicts.
+
+    :param path: The folder to store the cache entries in.
+    :param ttl: Seconds an entry is served without revalidation.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+
+    @staticmethod
+    def make_key(engine_name, project_id, user_id):
+        return [engine_name, project_id, user_id]
+
+    def get_entry_path(self, engine_name, project_id, user_id):
+        key = json.dumps(self.make_key(engine_name, project_id, user_id))
+        return os.path.join(self.path, '%s.json' % hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def load(self, engine_name, project_id, user_id):
+        """
+        Returns the raw cache entry, or None if there is no valid entry.
+        """
+        entry_path = self.get_entry_path(engine_name, project_id, user_id)
+        try:
+            with open(entry_path) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if entry.get('version') != CACHE_VERSION or entry.get('key') != self.make_key(engine_name, project_id, user_id):
+            return None
+
+        return entry
+
+    def is_expired(self, entry):
+        return time.time() - entry['validated_at'] > self.ttl
+
+    def check_freshness(self, entry, sg):
+        """
+        Checks that none of the environment entities of an entry have changed, in a single query.
+
+        Changes to which environments a Project, Software or HumanUser links to aren't seen here, see the
+        module docstring. An entry without environment entities is never fresh.
+
+        :param entry: A cache entry
+        :param sg: SG connection
+        :return: True if the entry is still fresh
+        """
+        environments = entry['environments']
+        if not environments:
+            # Nothing to revalidate against, resolve it again
+            return False
+
+        results = sg.find(ENVIRONMENT_ENTITY_TYPE,
+                          [['id', 'in', sorted(int(i) for i in environments)]],
+                          ['updated_at'])
+
+        current = dict((str(result['id']), str(result['updated_at'])) for result in results)
+        return current == environments
+
+    def get(self, engine_name, project_id, user_id, sg=None):
+        """
+        Returns the cached env dict or None.
+
+        :param sg: SG connection, or a callable returning one, used to revalidate an entry whose TTL has
+            expired. Without it, expired entries are treated as misses.
+        :return: The env dict or None
+        """
+        entry = self.load(engine_name, project_id, user_id)
+        if entry is None:
+            logger.debug('. Env cache miss : %s' % self.make_key(engine_name, project_id, user_id))
+            return None
+
+        if self.is_expired(entry):
+            if sg is None:
+                return None
+
+            if callable(sg):
+                sg = sg()
+
+            if not self.check_freshness(entry, sg):
+                logger.debug('. Env cache entry is stale : %s' % entry['key'])
+                self.remove(engine_name, project_id, user_id)
+                return None
+
+            # Nothing changed, so the entry is good for another TTL.
+            entry['validated_at'] = time.time()
+            self.write(entry)
+
+        logger.debug('. Env cache hit : %s' % entry['key'])
+        return to_native_str(entry['env'])
+
+    def put(self, engine_name, project_id, user_id, env, environments):
+        """
+        Stores a resolved env dict.
+
+        :param env: The merged env dict
+        :param environments: dict of {environment entity id: updated_at} of every environment entity
+            the env was resolved from.
+        """
+        entry = {'version': CACHE_VERSION,
+                 'key': self.make_key(engine_name, project_id, user_id),
+                 'environments': dict((str(i), str(updated_at)) for i, updated_at in environments.items()),
+                 'validated_at': time.time(),
+                 'env': env}
+        self.write(entry)
+
+    def write(self, entry):
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                # Another process may have created it in the meantime.
+                if not os.path.isdir(self.path):
+                    raise
+
+        try:
+            _atomic_write(self.get_entry_path(*entry['key']), entry)
+        except (IOError, OSError) as e:
+            logger.warning('. Unable to write env cache entry %s : %s' % (entry['key'], e))
+
+    def remove(self, engine_name, project_id, user_id):
+        try:
+            os.remove(self.get_entry_path(engine_name, project_id, user_id))
+        except OSError:
+            pass
+
+    def entries(self):
+        """
+        Yields every entry in the cache.
+        """
+        if not os.path.isdir(self.path):
+            return
+
+        for file_name in os.listdir(self.path):
+            if not file_name.endswith('.json'):
+                continue
+
+            try:
+                with open(os.path.join(self.path, file_name)) as f:
+                    entry = json.load(f)
+            except (IOError, OSError, ValueError):
+                continue
+
+            if entry.get('version') == CACHE_VERSION:
+                yield entry
+
+    def invalidate(self, engine_name=None, project_id=None, user_id=None, env_id=None):
+        """
+        Removes every entry matching all of the given arguments. Without arguments the cache is cleared.
+
+        :param env_id: Removes the entries resolved from this environment entity.
+        :return: The number of entries removed
+        """
+        removed = 0
+        for entry in list(self.entries()):
+            entry_engine_name, entry_project_id, entry_user_id = entry['key']
+
+            if engine_name is not None and entry_engine_name != engine_name:
+                continue
+            if project_id is not None and entry_project_id != project_id:
+                continue
+            if user_id is not None and entry_user_id != user_id:
+                continue
+            if env_id is not None and str(env_id) not in entry['environments']:
+                continue
+
+            self.remove(*entry['key'])
+            removed += 1
+
+        logger.debug('. Removed %s env cache entries' % removed)
+        return removed
+
+    def invalidate_from_event(self, event):
+        """
+        Invalidates the entries affected by a SG event, eg. from an event daemon plugin.
+
+        - A change to an environment entity removes every entry that was resolved from it.
+        - A change to a Project's or Software's environment removes the affected entries.
+
+        :param event: SG EventLogEntry dict
+        :return: The number of entries removed
+        """
+        meta = event.get('meta') or {}
+        entity_type = meta.get('entity_type')
+        entity_id = meta.get('entity_id')
+
+        if entity_type == ENVIRONMENT_ENTITY_TYPE:
+            return self.invalidate(env_id=entity_id)
+
+        if meta.get('attribute_name') == 'sg_env':
+            if entity_type == 'Project':
+                return self.invalidate(project_id=entity_id)
+            elif entity_type in ('Software', 'HumanUser'):
+                # The engine/user of these entities isn't known from the event alone.
+                return self.invalidate()
+
+        return 0
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    Returns the process wide EnvCache configured from the environment, or None if caching is disabled,
+    which it is unless BL_ENV_CACHE_TTL is set.
+    """
+    global _cache
+
+    ttl = int(os.environ.get('BL_ENV_CACHE_TTL', 0))
+    if ttl <= 0:
+        return None
+
+    path = os.environ.get('BL_ENV_CACHE_DIR', DEFAULT_CACHE_DIR)
+    if _cache is None or _cache.path != path or _cache.ttl != ttl:
+        _cache = EnvCache(path, ttl)
+
+    return _cache
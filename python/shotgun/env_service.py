@@ -0,0 +1,358 @@
+"""
+Node-local env resolution service, so the DCCs, farm tasks and tools running on a workstation or render node
+share one resolution of each env rather than each resolving its own.
+
+The service, see scripts/tools/env_server.py, listens on localhost and resolves Env.env dicts from SG,
+caching them for BL_ENV_SERVICE_TTL seconds :
+
+- Concurrent requests for the same (engine name, project id, user id) are coalesced in to one resolution,
+  the other requests wait for it and share its result.
+- Every resolution shares the process wide ancestry and parse memos of blPython.shotgun.env.
+- Resolutions run on a fixed pool of worker threads, which keep their pooled SG connections, see
+  blPython.core.connection. The server's threads only live for one client connection.
+- The counters of the service are returned by the 'stats' request.
+- 'invalidate' requests are only accepted from this node's loopback address.
+
+Requests and responses are single lines of JSON :
+
+    {"op": "get_env", "engine_name": "tk-nuke", "project_id": 314, "user_id": 42}
+    {"ok": true, "env": {...}}
+
+get_env is a drop-in alternative to blPython.shotgun.get_env, serving the Env from the service and falling
+back to resolving it locally when the service can't be reached. The service host and port are set with the
+BL_ENV_SERVICE_HOST and BL_ENV_SERVICE_PORT env vars.
+"""
+import os
+import json
+import time
+import socket
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from blPython.core.cache import LRUCache
+from blPython.core._sys import to_native_str
+from blPython.shotgun import env
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 47317
+
+# Seconds a resolved env is served before being resolved again.
+DEFAULT_TTL = 300
+
+# Threads resolving envs from SG.
+DEFAULT_WORKERS = 4
+
+# Seconds a client waits for the service before resolving the env itself.
+DEFAULT_TIMEOUT = 30.0
+
+
+def is_loopback(host):
+    """
+    :return: True if host is a loopback address, ie. the client runs on this node.
+    """
+    return host == '::1' or host.startswith('127.') or host.startswith('::ffff:127.')
+
+
+def get_address():
+    """
+    :return: The (host, port) of the service, see the module docstring.
+    """
+    return (os.environ.get('BL_ENV_SERVICE_HOST', DEFAULT_HOST),
+            int(os.environ.get('BL_ENV_SERVICE_PORT', DEFAULT_PORT)))
+
+
+class _Resolution(object):
+    """
+    An in-flight resolution, waited on by the requests coalesced in to it.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.env = None
+        self.error = None
+
+
+class EnvService(object):
+    """
+    Resolves and caches env dicts, coalescing concurrent identical requests.
+
+    :param get_sg: callable returning the calling thread's SG connection, eg. a mockgun stand-in in tests.
+    :param ttl: Seconds a resolved env is served before being resolved again.
+    :param maxsize: The maximum number of envs cached.
+    :param workers: The number of threads resolving envs, each keeps its own SG connection.
+    """
+
+    def __init__(self, get_sg=env.get_sg, ttl=DEFAULT_TTL, maxsize=1024, workers=DEFAULT_WORKERS):
+        self.get_sg = get_sg
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._pool = ThreadPool(workers)
+        self.started_at = time.time()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.coalesced = 0
+        self.resolutions = 0
+        self.errors = 0
+        self.resolve_seconds = 0.0
+
+    def resolve(self, engine_name, project_id, user_id):
+        """
+        Resolves an env from SG, like Env does without a cache.
+
+        :return: The env dict
+        """
+        sg = self.get_sg()
+        project = sg.find_one('Project', [['id', 'is', project_id]], ['sg_env', 'sg_software'])
+        if project is None:
+            raise ValueError('Project %s not found' % project_id)
+
+        user = {'type': 'HumanUser', 'id': user_id} if user_id is not None else None
+        return env.resolve_env(sg, engine_name, project, user)
+
+    def get(self, engine_name, project_id, user_id=None):
+        """
+        Returns the cached env, resolving it if needed. A request arriving while the same env is being resolved
+        waits for that resolution rather than starting its own.
+
+        :return: The env dict
+        :raises: The resolution's error
+        """
+        key = (engine_name, project_id, user_id)
+        with self._lock:
+            self.requests += 1
+
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+
+        with self._lock:
+            resolution = self._pending.get(key)
+            owner = resolution is None
+            if owner:
+                # Another request may have finished resolving it since the lookup above, which already
+                # counted the miss
+                data = self.cache.peek(key)
+                if data is not None:
+                    return data
+
+                resolution = self._pending[key] = _Resolution()
+            else:
+                self.coalesced += 1
+
+        if owner:
+            start = time.time()
+            try:
+                # On a worker thread, so the SG connection outlives the client connection
+                resolution.env = self._pool.apply(self.resolve, (engine_name, project_id, user_id))
+                self.cache.set(key, resolution.env)
+            except Exception as e:
+                logger.warning('. Unable to resolve the env of %s : %s' % (key, e))
+                resolution.error = e
+            finally:
+                with self._lock:
+                    del self._pending[key]
+                    self.resolutions += 1
+                    self.resolve_seconds += time.time() - start
+                    if resolution.error is not None:
+                        self.errors += 1
+                resolution.done.set()
+        else:
+            resolution.done.wait()
+
+        if resolution.error is not None:
+            raise resolution.error
+        return resolution.env
+
+    def invalidate(self, engine_name=None, project_id=None, user_id=None):
+        """
+        Removes every cached env matching all of the given arguments. Without arguments the cache is cleared.
+
+        :return: The number of envs removed
+        """
+        if engine_name is None and project_id is None and user_id is None:
+            removed = len(self.cache)
+            self.cache.clear()
+            return removed
+
+        removed = 0
+        for key in self.cache.keys():
+            if engine_name is not None and key[0] != engine_name:
+                continue
+            if project_id is not None and key[1] != project_id:
+                continue
+            if user_id is not None and key[2] != user_id:
+                continue
+            removed += int(self.cache.invalidate(key))
+        return removed
+
+    def close(self):
+        """
+        Stops the worker threads.
+        """
+        self._pool.close()
+        self._pool.join()
+
+    def stats(self):
+        """
+        :return: dict of the service counters and its cache stats.
+        """
+        with self._lock:
+            return {'requests': self.requests,
+                    'coalesced': self.coalesced,
+                    'resolutions': self.resolutions,
+                    'errors': self.errors,
+                    'in_flight': len(self._pending),
+                    'resolve_seconds': round(self.resolve_seconds, 3),
+                    'uptime': round(time.time() - self.started_at, 3),
+                    'cache': self.cache.stats()}
+
+    def handle(self, request, local=True):
+        """
+        Answers a request, see the module docstring.
+
+        :param request: The request dict
+        :param local: Whether the client runs on this node, only local clients may invalidate the cache
+        :return: The response dict
+        """
+        op = request.get('op')
+        if op == 'invalidate' and not local:
+            return {'ok': False, 'error': 'invalidate is only accepted from this node'}
+
+        try:
+            if op == 'get_env':
+                return {'ok': True, 'env': self.get(request['engine_name'], request['project_id'],
+                                                    request.get('user_id'))}
+            elif op == 'stats':
+                return {'ok': True, 'stats': self.stats()}
+            elif op == 'invalidate':
+                return {'ok': True, 'removed': self.invalidate(request.get('engine_name'), request.get('project_id'),
+                                                               request.get('user_id'))}
+            return {'ok': False, 'error': 'Unknown op : %s' % op}
+        except Exception as e:
+            return {'ok': False, 'error': '%s: %s' % (type(e).__name__, e)}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        local = is_loopback(self.client_address[0])
+
+        # A client may send several requests over one connection, one line each
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError:
+                response = {'ok': False, 'error': 'Invalid request'}
+            else:
+                response = self.server.service.handle(request, local=local)
+            self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class EnvServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    Serves an EnvService on localhost, one thread per connection.
+
+    :param service: The EnvService
+    :param address: The (host, port) to listen on, port 0 picks a free port, see server_address.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, service, address=None):
+        self.service = service
+        socketserver.TCPServer.__init__(self, address or get_address(), _RequestHandler)
+
+    def server_close(self):
+        socketserver.TCPServer.server_close(self)
+        self.service.close()
+
+    def start(self):
+        """
+        Serves on a daemon thread, eg. for tests. Stop with shutdown then server_close.
+        """
+        thread = threading.Thread(target=self.serve_forever, name='EnvServer')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+class EnvServiceClient(object):
+    """
+    Client of the env service. It implements the EnvCache get and put interface, so an Env given it as its cache
+    is served by the service, and resolves itself if the service can't be reached.
+
+    :param address: The (host, port) of the service, see get_address.
+    :param timeout: Seconds to wait for the service.
+    """
+
+    def __init__(self, address=None, timeout=DEFAULT_TIMEOUT):
+        self.address = address or get_address()
+        self.timeout = timeout
+
+    def request(self, request):
+        """
+        Sends a request to the service.
+
+        :return: The response dict
+        :raises: socket.error if the service can't be reached
+        """
+        sock = socket.create_connection(self.address, timeout=self.timeout)
+        try:
+            sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+            f = sock.makefile('rb')
+            try:
+                line = f.readline()
+            finally:
+                f.close()
+        finally:
+            sock.close()
+
+        if not line:
+            raise socket.error('The env service at %s:%s closed the connection' % self.address)
+        return json.loads(line.decode('utf-8'))
+
+    def get(self, engine_name, project_id, user_id, sg=None):
+        """
+        Returns the env dict from the service, or None if the service can't be reached or failed to resolve it.
+        """
+        try:
+            response = self.request({'op': 'get_env', 'engine_name': engine_name, 'project_id': project_id,
+                                     'user_id': user_id})
+        except (socket.error, ValueError) as e:
+            logger.debug('. Env service unavailable at %s:%s : %s' % (self.address[0], self.address[1], e))
+            return None
+
+        if not response.get('ok'):
+            logger.warning('. Env service error : %s' % response.get('error'))
+            return None
+        return to_native_str(response['env'])
+
+    def put(self, engine_name, project_id, user_id, env, environments):
+        # The service caches the envs it resolves, an env resolved locally is not sent to it
+        pass
+
+    def stats(self):
+        return self.request({'op': 'stats'})['stats']
+
+    def invalidate(self, engine_name=None, project_id=None, user_id=None):
+        return self.request({'op': 'invalidate', 'engine_name': engine_name, 'project_id': project_id,
+                             'user_id': user_id})['removed']
+
+
+def get_env(engine_name, context):
+    """
+    A drop-in alternative to blPython.shotgun.get_env, serving the Env from the node's env service.
+
+    :param engine_name: The engine name, eg. 'tk-nuke'
+    :param context: The SG context
+    :return: Env
+    """
+    return env.Env(engine_name, context, cache=EnvServiceClient())
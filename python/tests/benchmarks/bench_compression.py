@@ -0,0 +1,87 @@
+"""
+Compares the release zip compressions, see zipOps.parse_compression, on a fixture tree of compressible
+python/yaml-like files plus already compressed binaries standing in for png, exr and zip resources.
+
+Each compression is timed and reported with the resulting archive size, the time is the zipping time
+only. bzip2 and lzma need Python 3 and are skipped under Python 2.
+
+Usage : python bench_compression.py [--files 1000] [--size 65536] [--binary 0.3] [--workers 4]
+        [--compressions store deflate:1 deflate deflate:9 bzip2 lzma auto]
+"""
+import os, sys
+import argparse
+import random
+import shutil
+import tempfile
+import time
+import zipfile
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(myPath, '..', '..', '..'))
+
+from blPython.release import zipOps
+
+from bench_zip import WORDS
+
+COMPRESSIONS = ['store', 'deflate:1', 'deflate', 'deflate:9', 'bzip2', 'lzma', 'auto']
+BINARY_EXTENSIONS = ['.png', '.exr', '.zip', '.ico']
+
+
+def make_tree(root, file_count, size, binary):
+    rng = random.Random(0)
+    for i in range(file_count):
+        folder = os.path.join(root, 'hooks%02d' % (i % 16))
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        if rng.random() < binary:
+            file_name = 'resource%05d%s' % (i, BINARY_EXTENSIONS[i % len(BINARY_EXTENSIONS)])
+            data = os.urandom(size)
+        else:
+            file_name = 'file%05d.py' % i
+            data = ' '.join(rng.choice(WORDS) for _ in range(size // 5)).encode('ascii')[:size]
+
+        with open(os.path.join(folder, file_name), 'wb') as f:
+            f.write(data)
+
+
+def run(file_count=1000, size=65536, binary=0.3, workers=4, compressions=COMPRESSIONS):
+    root = tempfile.mkdtemp(prefix='bench_compression_')
+    try:
+        tree = os.path.join(root, 'tree')
+        zip_path = os.path.join(root, 'release.zip')
+        make_tree(tree, file_count, size, binary)
+        total_mb = sum(member.size for member in zipOps.list_files(tree)) / (1024.0 * 1024.0)
+
+        print('%-12s %10s %10s %10s %10s' % ('compression', 'seconds', 'MB/s', 'zip MB', 'ratio'))
+        results = {}
+        for value in compressions:
+            try:
+                compression = zipOps.parse_compression(value)
+            except ValueError as e:
+                print('%-12s %s' % (value, e))
+                continue
+
+            start = time.time()
+            with zipfile.ZipFile(zip_path, 'w', compression.compress_type) as ziph:
+                stats = zipOps.zipdir(tree, ziph, workers=workers, compression=compression)
+            elapsed = time.time() - start
+
+            zip_mb = os.path.getsize(zip_path) / (1024.0 * 1024.0)
+            results[value] = (elapsed, zip_mb)
+            print('%-12s %10.2f %10.1f %10.1f %10.2f' % (value, elapsed, total_mb / elapsed, zip_mb, stats.ratio))
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time and size of the release zip compressions.')
+    parser.add_argument('--files', type=int, default=1000, help='Number of files in the fixture tree.')
+    parser.add_argument('--size', type=int, default=65536, help='Size of each file in bytes.')
+    parser.add_argument('--binary', type=float, default=0.3, help='Fraction of already compressed binary files.')
+    parser.add_argument('--workers', type=int, default=4, help='Number of compression threads.')
+    parser.add_argument('--compressions', nargs='+', default=COMPRESSIONS, help='Compressions to time.')
+    args = parser.parse_args()
+
+    run(args.files, args.size, args.binary, args.workers, args.compressions)
@@ -0,0 +1,58 @@
+"""
+Times resolving an Env against the in-memory SG stand-in with an injected per-call delay, looking up the
+project, engine and user layers one after the other and concurrently.
+
+Both modes then fetch the environment graph in the same batched walk, so the difference is the lookups
+that overlap.
+
+Usage : python bench_env_layers.py [--delay 0.05] [--iterations 10]
+"""
+import os, sys
+import argparse
+import time
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(myPath, '..', '..', '..'))
+sys.path.insert(0, os.path.join(myPath, '..'))
+
+from blPython.shotgun import env
+from fake_shotgun import FakeShotgun
+import env_fixtures
+
+
+def resolve_serial(sg):
+    # The Project lookup Env.__init__ does before resolving the layers
+    project = sg.find_one('Project', [['id', 'is', env_fixtures.PROJECT['id']]], ['sg_env', 'sg_software'])
+    return env.resolve_env(sg, env_fixtures.ENGINE_NAME, project, env_fixtures.USER)
+
+
+def resolve_concurrent(sg):
+    project, layers = env.get_env_layers_concurrently(lambda: sg, env_fixtures.ENGINE_NAME, env_fixtures.PROJECT,
+                                                      env_fixtures.USER)
+    return env.resolve_layers(env.EnvironmentResolver(sg), layers)
+
+
+def run(delay=0.05, iterations=10):
+    print('%-12s %12s %12s %10s' % ('mode', 'ms per Env', 'round trips', 'speedup'))
+    results = {}
+    for label, resolve in [('serial', resolve_serial), ('concurrent', resolve_concurrent)]:
+        sg = FakeShotgun(env_fixtures.sg_data(), delay=delay)
+
+        start = time.time()
+        for i in range(iterations):
+            resolve(sg)
+        elapsed = (time.time() - start) / iterations
+
+        results[label] = elapsed
+        print('%-12s %12.1f %12s %10.2f' % (label, elapsed * 1000, sg.call_count() // iterations,
+                                           results['serial'] / elapsed))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serial vs concurrent Env layer resolution latency.')
+    parser.add_argument('--delay', type=float, default=0.05, help='Seconds of latency injected in every SG call.')
+    parser.add_argument('--iterations', type=int, default=10, help='Number of Envs resolved per mode.')
+    args = parser.parse_args()
+
+    run(args.delay, args.iterations)
@@ -0,0 +1,73 @@
+"""
+Times parsing sg_json payloads of several sizes, written as JSON with json.loads and as legacy Python
+literals with ast.literal_eval, against env.parse_sg_json cold (empty memo) and warm.
+
+Usage : python bench_env_parse.py [--iterations 200]
+"""
+import os, sys
+import argparse
+import json
+import time
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(myPath, '..', '..', '..'))
+sys.path.insert(0, os.path.join(myPath, '..'))
+
+from blPython.shotgun import env
+
+# Variable counts of the payloads, a large one looks like a show env with long path and plugin lists.
+SIZES = [('small', 5), ('medium', 50), ('large', 400)]
+
+
+def make_env(count):
+    data = {}
+    for i in range(count):
+        if i % 4 == 0:
+            value = os.pathsep.join('/pipeline/software/package_%s/%s/python' % (i, j) for j in range(20))
+            data['PYTHONPATH_%s' % i] = {'action': 'prepend', 'value': value}
+        elif i % 4 == 1:
+            value = ';'.join('plugin_%s_%s.so' % (i, j) for j in range(10))
+            data['PLUGINS_%s' % i] = {'action': 'append', 'value': value}
+        elif i % 4 == 2:
+            data['FLAG_%s' % i] = {'action': 'set', 'value': None}
+        else:
+            data['ROOT_%s' % i] = {'action': 'set', 'value': '/jobs/show/seq/shot_%04d' % i}
+    return data
+
+
+def time_parse(parse, payload, iterations, setup=None):
+    elapsed = 0.0
+    for i in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.time()
+        parse(payload)
+        elapsed += time.time() - start
+    return elapsed / iterations
+
+
+def run(iterations=200):
+    print('%-8s %-8s %-14s %10s' % ('size', 'format', 'parser', 'us'))
+    results = {}
+    for size, count in SIZES:
+        data = make_env(count)
+        for fmt, payload in [('json', json.dumps(data)), ('literal', repr(data))]:
+            # literal_eval can't parse JSON's null, json.loads can't parse Python's None
+            parsers = [('json.loads', json.loads, None)] if fmt == 'json' else \
+                [('literal_eval', env.ast.literal_eval, None)]
+            parsers += [('parse cold', lambda p: env.parse_sg_json(1, p), env.PARSE_CACHE.clear),
+                        ('parse warm', lambda p: env.parse_sg_json(1, p), None)]
+
+            for label, parse, setup in parsers:
+                elapsed = time_parse(parse, payload, iterations, setup)
+                results[(size, fmt, label)] = elapsed
+                print('%-8s %-8s %-14s %10.1f' % (size, fmt, label, elapsed * 1000000))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='sg_json payload parse time.')
+    parser.add_argument('--iterations', type=int, default=200, help='Number of parses per payload and parser.')
+    args = parser.parse_args()
+
+    run(args.iterations)
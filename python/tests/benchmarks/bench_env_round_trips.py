@@ -0,0 +1,73 @@
+"""
+Counts the SG round trips needed to resolve an Env against the in-memory SG stand-in.
+
+The resolution is run once with the legacy one find_one per sg_parent hop and once with the batched
+EnvironmentResolver, so the number of round trips per Env(...) can be tracked over time.
+
+Usage : python bench_env_round_trips.py
+"""
+import os, sys
+import ast
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(myPath, '..', '..', '..'))
+sys.path.insert(0, os.path.join(myPath, '..'))
+
+from blPython.shotgun import env
+from fake_shotgun import FakeShotgun
+import env_fixtures
+
+
+def legacy_resolve_env(sg, engine_name, project, user):
+    """
+    The previous resolution, one find_one per parent hop and per layer.
+    """
+    def get_environment_recursive(id):
+        envs = []
+        result = sg.find_one(env.ENVIRONMENT_ENTITY_TYPE, [['id', 'is', id]], env.ENVIRONMENT_FIELDS)
+        if result:
+            if result['sg_json']:
+                envs.append(result)
+            if result['sg_parent']:
+                envs += get_environment_recursive(result['sg_parent']['id'])
+        return envs
+
+    def parse_env(env_entities):
+        data = {}
+        for env_entity in env_entities:
+            envs = get_environment_recursive(env_entity['id'])
+            envs.reverse()
+            for i in envs:
+                data.update(ast.literal_eval(i['sg_json']))
+        return data
+
+    data = {}
+    data.update(parse_env(env.get_studio_env_entities()))
+    data.update(parse_env(env.get_engine_env_entities(sg, engine_name, project)))
+    data.update(parse_env([project['sg_env']]))
+    user = sg.find_one('HumanUser', [['id', 'is', user['id']]], ['sg_env'])
+    data.update(parse_env(env.get_user_env_entities(sg, user)))
+    return data
+
+
+def run():
+    results = []
+    for label, resolve in [('legacy', legacy_resolve_env), ('batched', env.resolve_env)]:
+        sg = FakeShotgun(env_fixtures.sg_data())
+        project = sg.find_one('Project', [['id', 'is', env_fixtures.PROJECT['id']]], ['sg_env', 'sg_software'])
+        sg.reset_calls()
+
+        resolve(sg, env_fixtures.ENGINE_NAME, project, env_fixtures.USER)
+
+        # +1 for the Project lookup done by Env.__init__
+        results.append((label, sg.call_count() + 1))
+
+    print('%-10s %s' % ('mode', 'round trips per Env'))
+    for label, calls in results:
+        print('%-10s %s' % (label, calls))
+
+    return results
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,109 @@
+"""
+Measures the per-event logging overhead of eventOps.is_valid_for_project.
+
+The previous implementation, which %-formatted the full event dict at INFO, is compared with the
+current compact record, at INFO and at WARNING level. Log output goes to a discarding stream so the
+numbers include formatting but not terminal I/O.
+
+Usage : python bench_event_logging.py [--events 20000] [--payload 200]
+"""
+import os, sys
+import argparse
+import logging
+import timeit
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(myPath, '..', '..', '..'))
+
+from blPython.events import eventOps
+
+
+class NullStream(object):
+    def write(self, data):
+        pass
+
+    def flush(self):
+        pass
+
+
+def legacy_is_valid_for_project(IS_DEV_SCRIPT, event, project_entity, logger):
+    """
+    The logging of is_valid_event before the compact records.
+    """
+    if not project_entity:
+        return False
+
+    logger.info('event : %s' % event)
+    logger.info('project : %s' % project_entity)
+
+    is_dev_mode = os.environ.get('BLK_EVENTS_DEV', False)
+    is_dev_project = project_entity.get('sg_type') == 'Dev'
+    event_is_valid = (is_dev_mode and is_dev_project and IS_DEV_SCRIPT) or (not is_dev_mode and not IS_DEV_SCRIPT)
+
+    if event_is_valid:
+        logger.info('This event is valid')
+    else:
+        logger.info('This event is invalid.\nThis is because :')
+        logger.info('. BLK_EVENTS_DEV(%s) AND project type(%s) AND script type(%s) is not True' % (
+            is_dev_mode, is_dev_project, IS_DEV_SCRIPT))
+        logger.info(
+            '. OR we are not in devmode(is_dev_mode:%s) AND this script is not in the live folder(IS_DEV_SCRIPT:%s).' % (
+            is_dev_mode, IS_DEV_SCRIPT))
+
+    return event_is_valid
+
+
+def make_event(id, payload):
+    return {'id': id,
+            'event_type': 'Shotgun_Shot_Change',
+            'project': {'type': 'Project', 'id': 1, 'name': 'bench'},
+            'entity': {'type': 'Shot', 'id': id, 'name': 'sh%04d' % id},
+            'meta': {'entity_type': 'Shot',
+                     'entity_id': id,
+                     'attribute_name': 'sg_versions',
+                     'added': [{'type': 'Version', 'id': i, 'name': 'v%03d' % i} for i in range(payload)],
+                     'removed': []}}
+
+
+def get_logger(level):
+    logger = logging.getLogger('bench_event_logging.%s' % level)
+    logger.propagate = False
+    logger.handlers = []
+    handler = logging.StreamHandler(NullStream())
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    return logger
+
+
+def run(event_count=20000, payload=200):
+    events = [make_event(i, payload) for i in range(100)]
+    project_entity = {'type': 'Project', 'id': 1, 'sg_type': 'Production'}
+
+    print('%-10s %-10s %16s' % ('mode', 'level', 'us per event'))
+    results = {}
+    for label, function in [('legacy', legacy_is_valid_for_project), ('compact', eventOps.is_valid_for_project)]:
+        for level in (logging.INFO, logging.WARNING):
+            logger = get_logger(level)
+
+            def validate():
+                for event in events:
+                    function(False, event, project_entity, logger)
+
+            runs = max(1, event_count // len(events))
+            elapsed = min(timeit.repeat(validate, number=runs, repeat=3))
+            per_event = elapsed / (runs * len(events)) * 1e6
+
+            results[(label, logging.getLevelName(level))] = per_event
+            print('%-10s %-10s %16.2f' % (label, logging.getLevelName(level), per_event))
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Per-event logging overhead of eventOps.')
+    parser.add_argument('--events', type=int, default=20000, help='Number of events to validate per sample.')
+    parser.add_argument('--payload', type=int, default=200, help='Number of entities in each event payload.')
+    args = parser.parse_args()
+
+    run(args.events, args.payload)
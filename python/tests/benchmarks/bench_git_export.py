@@ -0,0 +1,79 @@
+"""
+Compares zipping a repo checkout by walking the working copy, zipOps.zipdir, with exporting its
+committed files, zipOps.zipgit.
+
+A fixture repo of committed python files is generated, then filled with untracked build output
+(.pyc files and a scratch folder) like a working copy on the pipeline share. The walk zips everything
+it finds while the export only zips what is committed.
+
+Usage : python bench_git_export.py [--files 2000] [--size 16384] [--untracked 2000] [--workers 4]
+"""
+import os, sys
+import argparse
+import random
+import shutil
+import tempfile
+import time
+import zipfile
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(myPath, '..', '..', '..'))
+sys.path.insert(0, os.path.join(myPath, '..'))
+
+from blPython.release import zipOps
+import git_fixtures
+
+from bench_zip import WORDS
+
+
+def make_repo(root, file_count, size, untracked_count):
+    rng = random.Random(0)
+    files = {}
+    for i in range(file_count):
+        path = 'hooks%02d/pkg%02d/file%05d.py' % (i % 16, i % 7, i)
+        files[path] = ' '.join(rng.choice(WORDS) for _ in range(size // 5))[:size]
+    repo = git_fixtures.make_repo(root, files=files)
+
+    for i in range(untracked_count):
+        folder = os.path.join(repo, 'scratch' if i % 2 else 'hooks%02d' % (i % 16))
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        with open(os.path.join(folder, 'build%05d.pyc' % i), 'wb') as f:
+            f.write(os.urandom(size))
+    return repo
+
+
+def time_zip(function, repo, zip_path):
+    start = time.time()
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as ziph:
+        stats = function(repo, ziph)
+    return time.time() - start, stats
+
+
+def run(file_count=2000, size=16384, untracked_count=2000, workers=4):
+    root = tempfile.mkdtemp(prefix='bench_git_export_')
+    try:
+        repo = make_repo(os.path.join(root, 'repo'), file_count, size, untracked_count)
+        zip_path = os.path.join(root, 'release.zip')
+
+        print('%-8s %10s %10s %10s' % ('mode', 'seconds', 'members', 'zip MB'))
+        results = {}
+        for label, function in (('walk', zipOps.zipdir), ('export', zipOps.zipgit)):
+            elapsed, stats = time_zip(lambda path, ziph: function(path, ziph, workers=workers), repo, zip_path)
+            results[label] = elapsed
+            print('%-8s %10.2f %10s %10.1f' % (label, elapsed, stats.files,
+                                              os.path.getsize(zip_path) / (1024.0 * 1024.0)))
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Working copy walk vs git archive export release zips.')
+    parser.add_argument('--files', type=int, default=2000, help='Number of committed files in the fixture repo.')
+    parser.add_argument('--size', type=int, default=16384, help='Size of each file in bytes.')
+    parser.add_argument('--untracked', type=int, default=2000, help='Number of untracked files in the working copy.')
+    parser.add_argument('--workers', type=int, default=4, help='Number of compression threads.')
+    args = parser.parse_args()
+
+    run(args.files, args.size, args.untracked, args.workers)
@@ -0,0 +1,111 @@
+"""
+Reports how long it takes to import blPython and each of its submodules.
+
+Every target is imported in a fresh interpreter. On Python 3.7+ the breakdown comes from
+'python -X importtime' and the slowest modules are listed, on older interpreters only the
+total wall time of the import is reported.
+
+Usage : python bench_import_time.py [--runs 5] [--top 10] [target ...]
+"""
+import os, sys
+import argparse
+import subprocess
+import time
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+BL_PYTHON_PARENT = os.path.abspath(os.path.join(myPath, '..', '..', '..'))
+
+DEFAULT_TARGETS = ['blPython',
+                   'blPython.core.config',
+                   'blPython.git.gitOps',
+                   'blPython.events.eventOps',
+                   'blPython.shotgun']
+
+SUPPORTS_IMPORTTIME = sys.version_info >= (3, 7)
+
+
+def get_env():
+    env = dict(os.environ)
+    paths = [BL_PYTHON_PARENT] + [p for p in sys.path if p]
+    env['PYTHONPATH'] = os.pathsep.join(paths)
+    return env
+
+
+def parse_importtime(output):
+    """
+    Parses the stderr of 'python -X importtime'.
+
+    :return: list of (cumulative us, self us, module name), slowest first.
+    """
+    results = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        results.append((int(cumulative_us), int(self_us), name.strip()))
+
+    return sorted(results, reverse=True)
+
+
+def time_import(target):
+    """
+    Imports target in a fresh interpreter.
+
+    :return: (wall time in ms, list of importtime records or None)
+    """
+    args = [sys.executable]
+    if SUPPORTS_IMPORTTIME:
+        args += ['-X', 'importtime']
+    args += ['-c', 'import %s' % target]
+
+    start = time.time()
+    process = subprocess.Popen(args, env=get_env(), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    stdout, stderr = process.communicate()
+    elapsed = (time.time() - start) * 1000.0
+
+    if process.returncode != 0:
+        raise RuntimeError('Unable to import %s :\n%s' % (target, stderr))
+
+    return elapsed, parse_importtime(stderr) if SUPPORTS_IMPORTTIME else None
+
+
+def run(targets=DEFAULT_TARGETS, runs=5, top=10):
+    # The time to start an interpreter that imports nothing, subtracted from every result.
+    baseline = min(time_import('sys')[0] for i in range(runs))
+
+    print('%-30s %12s %16s' % ('target', 'wall ms', 'cumulative ms'))
+    report = {}
+    for target in targets:
+        try:
+            samples = [time_import(target) for i in range(runs)]
+        except RuntimeError as e:
+            print('%-30s %12s' % (target, 'failed'))
+            report[target] = {'error': str(e)}
+            continue
+
+        wall, records = min(samples, key=lambda sample: sample[0])
+        cumulative = ''
+        if records:
+            own = [r for r in records if r[2] == target]
+            cumulative = '%.2f' % (own[0][0] / 1000.0) if own else ''
+
+        print('%-30s %12.2f %16s' % (target, wall - baseline, cumulative))
+        report[target] = {'wall_ms': wall - baseline, 'records': records}
+
+        if records and top:
+            for cumulative_us, self_us, name in records[:top]:
+                print('    %-40s %10.2f ms' % (name, cumulative_us / 1000.0))
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Import time report for blPython.')
+    parser.add_argument('targets', nargs='*', default=DEFAULT_TARGETS)
+    parser.add_argument('--runs', type=int, default=5, help='Imports per target, the fastest is reported.')
+    parser.add_argument('--top', type=int, default=10, help='Number of slowest modules to list per target.')
+    args = parser.parse_args()
+
+    run(args.targets, runs=args.runs, top=args.top)
@@ -0,0 +1,76 @@
+"""
+Compares the serial shutil.copytree release copy with the manifest-driven parallel copy and the
+content-addressed store, printing the per-phase timings of each.
+
+The store is timed twice: the first release fills it, the second releases the same tree again and
+only links the files.
+
+Usage : python bench_release_copy.py [--files 2000] [--size 65536] [--workers 8] [--dest /mnt/share/tmp]
+"""
+import os, sys
+import argparse
+import shutil
+import tempfile
+import time
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(myPath, '..', '..', '..'))
+
+from blPython.release import copyOps, storeOps
+
+
+def make_tree(root, file_count, size):
+    for i in range(file_count):
+        folder = os.path.join(root, 'hooks%02d' % (i % 16), 'pkg%02d' % (i % 7))
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        with open(os.path.join(folder, 'file%05d.py' % i), 'wb') as f:
+            f.write(os.urandom(size))
+
+
+def print_row(label, seconds, timings):
+    print('%-16s %10.2f   %s' % (label, seconds, ', '.join('%s %.2fs' % item for item in timings.items())))
+
+
+def run(file_count=2000, size=65536, workers=8, dest=None):
+    root = tempfile.mkdtemp(prefix='bench_release_copy_')
+    dest_root = tempfile.mkdtemp(prefix='bench_release_copy_', dir=dest)
+    try:
+        tree = os.path.join(root, 'tree')
+        make_tree(tree, file_count, size)
+
+        print('%-16s %10s   %s' % ('mode', 'seconds', 'phases'))
+        results = {}
+
+        start = time.time()
+        shutil.copytree(tree, os.path.join(dest_root, 'copytree'))
+        results['copytree'] = time.time() - start
+        print_row('copytree', results['copytree'], {})
+
+        start = time.time()
+        manifest = copyOps.copy_tree(tree, os.path.join(dest_root, 'copy'), workers=workers)
+        results['parallel copy'] = time.time() - start
+        print_row('parallel copy', results['parallel copy'], manifest['timings'])
+
+        store = storeOps.ObjectStore(os.path.join(dest_root, '_store'))
+        for label in ('store (new)', 'store (reuse)'):
+            start = time.time()
+            manifest = store.release(tree, os.path.join(dest_root, label.replace(' ', '_')), workers=workers)
+            results[label] = time.time() - start
+            print_row(label, results[label], manifest['timings'])
+
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        shutil.rmtree(dest_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serial vs parallel release copy and the release store.')
+    parser.add_argument('--files', type=int, default=2000, help='Number of files in the fixture tree.')
+    parser.add_argument('--size', type=int, default=65536, help='Size of each file in bytes.')
+    parser.add_argument('--workers', type=int, default=8, help='The maximum number of files copied at once.')
+    parser.add_argument('--dest', default=None, help='Folder to release to, eg. on a network share. Defaults to the temp folder.')
+    args = parser.parse_args()
+
+    run(args.files, args.size, args.workers, args.dest)
@@ -0,0 +1,59 @@
+"""
+Measures how gitScan scales with the number of workers over a generated tree of local repos.
+
+Usage : python bench_repo_scan.py [--repos 64] [--workers 1 2 4 8 16] [--backend cli]
+"""
+import os, sys
+import argparse
+import shutil
+import tempfile
+import time
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(myPath, '..', '..', '..'))
+sys.path.insert(0, os.path.join(myPath, '..'))
+
+from blPython.git import gitOps, gitScan
+import git_fixtures
+
+
+def make_tree(root, repo_count):
+    for i in range(repo_count):
+        git_fixtures.make_repo(os.path.join(root, 'group%02d' % (i % 8), 'repo%03d' % i),
+                               tags=[('v1.0.%d' % i, 'Release %d' % i)])
+    return root
+
+
+def run(repo_count=64, workers=(1, 2, 4, 8, 16), backend='cli'):
+    root = tempfile.mkdtemp(prefix='bench_repo_scan_')
+    previous = gitOps.BACKEND
+    gitOps.set_backend(backend)
+    try:
+        make_tree(root, repo_count)
+        paths = gitScan.find_repos(root)
+
+        print('%-10s %12s %12s %10s' % ('workers', 'seconds', 'repos/s', 'speedup'))
+        results = {}
+        for worker_count in workers:
+            start = time.time()
+            scanned = list(gitScan.scan(paths, workers=worker_count))
+            elapsed = time.time() - start
+            assert len(scanned) == len(paths)
+
+            results[worker_count] = elapsed
+            print('%-10s %12.3f %12.1f %10.2f' % (worker_count, elapsed, len(paths) / elapsed,
+                                                  results[workers[0]] / elapsed))
+        return results
+    finally:
+        gitOps.set_backend(previous)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Scaling of the multi-repo status scanner.')
+    parser.add_argument('--repos', type=int, default=64, help='Number of repos to generate.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='Worker counts to time.')
+    parser.add_argument('--backend', choices=gitOps.BACKENDS, default='cli', help='The gitOps backend to scan with.')
+    args = parser.parse_args()
+
+    run(args.repos, args.workers, args.backend)
@@ -0,0 +1,128 @@
+"""
+Compares the serial ZipFile.write walk the packagers used with the parallel zipOps.zipdir engine.
+
+A fixture tree of compressible python/yaml-like files plus some incompressible binaries is generated,
+then zipped serially and with each worker count. Throughput is reported over the uncompressed size.
+
+With --changed, a fraction of the files is then modified and the tree re-zipped in full and
+incrementally, reusing the unchanged members of the first archive.
+
+Usage : python bench_zip.py [--files 2000] [--size 65536] [--workers 1 2 4 8] [--changed 0.02]
+"""
+import os, sys
+import argparse
+import random
+import shutil
+import tempfile
+import time
+import zipfile
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(myPath, '..', '..', '..'))
+
+from blPython.release import zipOps
+
+WORDS = ['import', 'sgtk', 'def', 'return', 'engine', 'location', 'app_store', 'version', 'hook', 'self',
+         'context', 'publish', 'settings', 'frameworks', 'None', 'path', 'os', '{', '}', ':', '\n']
+
+
+def make_tree(root, file_count, size):
+    rng = random.Random(0)
+    for i in range(file_count):
+        folder = os.path.join(root, 'hooks%02d' % (i % 16), 'pkg%02d' % (i % 7))
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        if i % 10 == 0:
+            data = os.urandom(size)
+        else:
+            data = ' '.join(rng.choice(WORDS) for _ in range(size // 5)).encode('ascii')[:size]
+
+        with open(os.path.join(folder, 'file%05d.py' % i), 'wb') as f:
+            f.write(data)
+
+    # The packagers skip these.
+    os.makedirs(os.path.join(root, '.git', 'objects'))
+    with open(os.path.join(root, '.git', 'objects', 'pack'), 'wb') as f:
+        f.write(os.urandom(size))
+
+
+def serial_zipdir(path, ziph, ignore_dirs=zipOps.DEFAULT_IGNORE_DIRS):
+    """
+    The packagers' zipdir before the parallel engine.
+    """
+    length = len(path)
+    for root, dirs, files in os.walk(path):
+        folder = root[length:]
+        for dir_to_ignore in ignore_dirs:
+            if dir_to_ignore in dirs:
+                dirs.remove(dir_to_ignore)
+        for file in files:
+            ziph.write(os.path.join(root, file), os.path.join(folder, file))
+
+
+def time_zip(function, tree, zip_path):
+    start = time.time()
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as ziph:
+        function(tree, ziph)
+    return time.time() - start
+
+
+def run_incremental(tree, root, changed):
+    previous_path = os.path.join(root, 'previous.zip')
+    zip_path = os.path.join(root, 'release.zip')
+    time_zip(zipOps.zipdir, tree, previous_path)
+
+    members = zipOps.list_files(tree)
+    for member in members[::max(1, int(round(1 / changed)))]:
+        with open(member.path, 'ab') as f:
+            f.write(b'# patched\n')
+
+    full = time_zip(zipOps.zipdir, tree, zip_path)
+    with zipfile.ZipFile(previous_path) as previous:
+        incremental = time_zip(lambda path, ziph: zipOps.zipdir(path, ziph, previous=previous), tree, zip_path)
+
+    print('')
+    print('%-12s %10s %10s' % ('rebuild', 'seconds', 'speedup'))
+    print('%-12s %10.2f %10.2f' % ('full', full, 1.0))
+    print('%-12s %10.2f %10.2f' % ('incremental', incremental, full / incremental))
+    return {'full': full, 'incremental': incremental}
+
+
+def run(file_count=2000, size=65536, workers=(1, 2, 4, 8), changed=None):
+    root = tempfile.mkdtemp(prefix='bench_zip_')
+    try:
+        tree = os.path.join(root, 'tree')
+        zip_path = os.path.join(root, 'release.zip')
+        make_tree(tree, file_count, size)
+        total_mb = sum(member.size for member in zipOps.list_files(tree)) / (1024.0 * 1024.0)
+
+        print('%-12s %10s %10s %10s %10s' % ('mode', 'seconds', 'MB/s', 'speedup', 'zip MB'))
+        results = {}
+        baseline = results['serial'] = time_zip(serial_zipdir, tree, zip_path)
+        print('%-12s %10.2f %10.1f %10.2f %10.1f' % ('serial', baseline, total_mb / baseline, 1.0,
+                                                     os.path.getsize(zip_path) / (1024.0 * 1024.0)))
+
+        for worker_count in workers:
+            label = 'parallel x%s' % worker_count
+            elapsed = results[label] = time_zip(lambda path, ziph: zipOps.zipdir(path, ziph, workers=worker_count),
+                                                tree, zip_path)
+            print('%-12s %10.2f %10.1f %10.2f %10.1f' % (label, elapsed, total_mb / elapsed, baseline / elapsed,
+                                                         os.path.getsize(zip_path) / (1024.0 * 1024.0)))
+
+        if changed:
+            results.update(run_incremental(tree, root, changed))
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serial vs parallel release zip throughput.')
+    parser.add_argument('--files', type=int, default=2000, help='Number of files in the fixture tree.')
+    parser.add_argument('--size', type=int, default=65536, help='Size of each file in bytes.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='Worker counts to time.')
+    parser.add_argument('--changed', type=float, default=None, help='Fraction of files to modify before an incremental rebuild.')
+    args = parser.parse_args()
+
+    run(args.files, args.size, args.workers, args.changed)
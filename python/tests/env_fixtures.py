@@ -0,0 +1,46 @@
+"""
+Shared SG data for the shotgun.env tests and benchmarks.
+
+The environment graph looks like this (children override their parents):
+
+    1 Base
+    +-- 3 Global (studio)
+        +-- 10 Nuke (engine)
+        +-- 20 Project
+            +-- 30 User
+"""
+ENV_TYPE = 'CustomNonProjectEntity02'
+PROJECT = {'type': 'Project', 'id': 314}
+USER = {'type': 'HumanUser', 'id': 42}
+ENGINE_NAME = 'tk-nuke'
+
+
+def _env(id, code, parent, data, updated_at=1):
+    return {'id': id,
+            'code': code,
+            'sg_parent': {'type': ENV_TYPE, 'id': parent} if parent else None,
+            'sg_json': repr(data) if data is not None else None,
+            'updated_at': updated_at,
+            'human_user_sg_env_human_users': []}
+
+
+def sg_data():
+    environments = [
+        _env(1, 'Base', None, {'STUDIO': {'action': 'set', 'value': 'base'},
+                               'LEVEL': {'action': 'set', 'value': 'base'}}),
+        _env(3, 'Global', 1, {'LEVEL': {'action': 'set', 'value': 'studio'}}),
+        _env(10, 'Nuke', 3, {'LEVEL': {'action': 'set', 'value': 'engine'},
+                             'NUKE_PATH': {'action': 'append', 'value': '/nuke'}}),
+        _env(20, 'Project', 3, {'LEVEL': {'action': 'set', 'value': 'project'}}),
+        _env(30, 'User', 20, {'LEVEL': {'action': 'set', 'value': 'user'}}),
+    ]
+    environments[-1]['human_user_sg_env_human_users'] = [USER]
+
+    return {
+        ENV_TYPE: environments,
+        'Project': [{'id': PROJECT['id'], 'sg_type': 'Production', 'sg_software': [],
+                     'sg_env': {'type': ENV_TYPE, 'id': 20}}],
+        'Software': [{'id': 5, 'code': 'Nuke', 'engine': ENGINE_NAME, 'project_sg_software_projects': [PROJECT],
+                      'sg_env': {'type': ENV_TYPE, 'id': 10}}],
+        'HumanUser': [{'id': USER['id'], 'sg_env': None}],
+    }
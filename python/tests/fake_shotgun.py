@@ -0,0 +1,151 @@
+"""
+A small in-memory stand-in for a shotgun_api3.Shotgun connection.
+
+It implements just enough of the API (find, find_one, update, batch, upload) for the blPython tests
+and benchmarks, and records every call so the number of round trips can be asserted on.
+An optional per-call delay simulates the latency of a real site.
+"""
+import copy
+import time
+import threading
+
+
+def _entity_key(value):
+    if isinstance(value, dict):
+        return (value.get('type'), value.get('id'))
+    return value
+
+
+def _matches(record, field, operator, value):
+    field_value = record.get(field)
+
+    # Multi-entity fields are stored as lists of entity dicts.
+    if isinstance(field_value, list):
+        keys = [_entity_key(i) for i in field_value]
+        if operator in ('is', 'in'):
+            values = value if isinstance(value, list) else [value]
+            return any(_entity_key(v) in keys for v in values)
+        raise NotImplementedError('Unsupported operator for multi-entity field : %s' % operator)
+
+    if operator == 'is':
+        return _entity_key(field_value) == _entity_key(value)
+    elif operator == 'is_not':
+        return _entity_key(field_value) != _entity_key(value)
+    elif operator == 'in':
+        values = value if isinstance(value, list) else [value]
+        return _entity_key(field_value) in [_entity_key(v) for v in values]
+    elif operator == 'contains':
+        return field_value is not None and value in field_value
+
+    raise NotImplementedError('Unsupported operator : %s' % operator)
+
+
+class FakeShotgun(object):
+    """
+    In-memory Shotgun stand-in.
+
+    :param data: dict of {entity_type: [records]}. Each record must have an 'id'.
+    :param delay: seconds to sleep on every API call, to simulate network latency.
+    """
+
+    def __init__(self, data=None, delay=0.0):
+        self.data = {}
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+        self._next_id = 10000
+
+        for entity_type, records in (data or {}).items():
+            for record in records:
+                self.add(entity_type, record)
+
+    def add(self, entity_type, record):
+        record = dict(record)
+        record['type'] = entity_type
+        self.data.setdefault(entity_type, {})[record['id']] = record
+        return record
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls = []
+
+    def call_count(self, method=None):
+        if method is None:
+            return len(self.calls)
+        return len([c for c in self.calls if c[0] == method])
+
+    def _record(self, method, *args):
+        with self._lock:
+            self.calls.append((method,) + args)
+        if self.delay:
+            time.sleep(self.delay)
+
+    def _find(self, entity_type, filters, fields):
+        results = []
+        for record in sorted(self.data.get(entity_type, {}).values(), key=lambda r: r['id']):
+            if all(_matches(record, f[0], f[1], f[2]) for f in filters):
+                result = {'type': entity_type, 'id': record['id']}
+                for field in fields or []:
+                    result[field] = copy.deepcopy(record.get(field))
+                results.append(result)
+        return results
+
+    def find(self, entity_type, filters, fields=None, *args, **kwargs):
+        self._record('find', entity_type, filters, fields)
+        return self._find(entity_type, filters, fields)
+
+    def find_one(self, entity_type, filters, fields=None, *args, **kwargs):
+        self._record('find_one', entity_type, filters, fields)
+        results = self._find(entity_type, filters, fields)
+        return results[0] if results else None
+
+    def _update(self, entity_type, entity_id, data):
+        record = self.data.get(entity_type, {}).get(entity_id)
+        if record is None:
+            raise ValueError('%s %s does not exist' % (entity_type, entity_id))
+        record.update(copy.deepcopy(data))
+        result = {'type': entity_type, 'id': entity_id}
+        result.update(data)
+        return result
+
+    def _create(self, entity_type, data):
+        with self._lock:
+            self._next_id += 1
+            entity_id = self._next_id
+        record = dict(data)
+        record['id'] = entity_id
+        self.add(entity_type, record)
+        result = {'type': entity_type, 'id': entity_id}
+        result.update(data)
+        return result
+
+    def update(self, entity_type, entity_id, data, *args, **kwargs):
+        self._record('update', entity_type, entity_id, data)
+        return self._update(entity_type, entity_id, data)
+
+    def create(self, entity_type, data, *args, **kwargs):
+        self._record('create', entity_type, data)
+        return self._create(entity_type, data)
+
+    def batch(self, requests):
+        self._record('batch', requests)
+        results = []
+        for request in requests:
+            if request['request_type'] == 'update':
+                results.append(self._update(request['entity_type'], request['entity_id'], request['data']))
+            elif request['request_type'] == 'create':
+                results.append(self._create(request['entity_type'], request['data']))
+            else:
+                raise NotImplementedError('Unsupported batch request : %s' % request['request_type'])
+        return results
+
+    def upload(self, entity_type, entity_id, path, field_name=None, display_name=None, *args, **kwargs):
+        self._record('upload', entity_type, entity_id, path, field_name)
+        if entity_id not in self.data.get(entity_type, {}):
+            raise ValueError('%s %s does not exist' % (entity_type, entity_id))
+        attachment = self._create('Attachment', {'display_name': display_name or path,
+                                                 'this_file': {'local_path': path}})
+        if field_name:
+            self.data[entity_type][entity_id][field_name] = {'type': 'Attachment', 'id': attachment['id'],
+                                                             'name': display_name or path}
+        return attachment['id']
@@ -0,0 +1,49 @@
+"""
+Helpers building throwaway git repos for the gitOps tests and benchmarks.
+"""
+import os
+import subprocess
+
+
+def git(path, *args):
+    return subprocess.check_output(['git'] + list(args), cwd=path, universal_newlines=True)
+
+
+def make_repo(path, branch='release/v1.0.0', remote='https://github.com/blacksmith/test-repo.git',
+              files=None, message='Initial commit\n\nWith a body.', tags=None):
+    """
+    Creates a git repo with a single commit.
+
+    :param files: dict of {relative path: content}
+    :param tags: list of (tag name, message). A message of None creates a lightweight tag.
+    :return: path
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    git(path, 'init', '-q')
+    git(path, 'symbolic-ref', 'HEAD', 'refs/heads/%s' % branch)
+    git(path, 'config', 'user.email', 'tests@blacksmith')
+    git(path, 'config', 'user.name', 'tests')
+    git(path, 'config', 'commit.gpgsign', 'false')
+    git(path, 'config', 'tag.gpgsign', 'false')
+    if remote:
+        git(path, 'remote', 'add', 'origin', remote)
+
+    for relative_path, content in (files or {'README.md': 'test repo\n'}).items():
+        file_path = os.path.join(path, relative_path)
+        if not os.path.isdir(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path))
+        with open(file_path, 'w') as f:
+            f.write(content)
+
+    git(path, 'add', '-A')
+    git(path, 'commit', '-q', '-m', message)
+
+    for tag, tag_message in tags or []:
+        if tag_message is None:
+            git(path, 'tag', tag)
+        else:
+            git(path, 'tag', '-a', tag, '-m', tag_message)
+
+    return path
@@ -0,0 +1,56 @@
+import pytest
+
+import sys, os
+import threading
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, myPath + '/../../')
+sys.path.insert(0, myPath)
+
+from blPython.core import connection
+from fake_shotgun import FakeShotgun
+
+
+@pytest.fixture()
+def pool():
+    pool = connection.ConnectionPool(factory=lambda site, script_name, api_key: FakeShotgun())
+    previous = connection.set_pool(pool)
+    yield pool
+    connection.set_pool(previous)
+
+
+def test_reuses_connection_per_thread(pool):
+    sg = connection.get_connection()
+    assert connection.get_connection() is sg
+    assert pool.stats() == {'hits': 1, 'misses': 1, 'created': 1, 'hit_rate': 0.5}
+
+
+def test_connections_per_credentials(pool):
+    assert connection.get_connection('a', 'key') is not connection.get_connection('b', 'key')
+    assert pool.created == 2
+
+
+def test_connections_per_thread(pool):
+    main_sg = connection.get_connection()
+    thread_sgs = []
+
+    def worker():
+        thread_sgs.append(connection.get_connection())
+        thread_sgs.append(connection.get_connection())
+
+    threads = [threading.Thread(target=worker) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert main_sg not in thread_sgs
+    assert len(set(id(sg) for sg in thread_sgs)) == 4
+    assert pool.stats()['created'] == 5
+    assert pool.stats()['hits'] == 4
+
+
+def test_release(pool):
+    sg = connection.get_connection()
+    pool.release()
+    assert connection.get_connection() is not sg
@@ -0,0 +1,96 @@
+import pytest
+
+import sys, os
+import stat
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, myPath + '/../../')
+sys.path.insert(0, myPath)
+
+from blPython.release import copyOps
+
+FILES = {'README.md': b'release\n',
+         'hooks/publish.py': b'import os\n',
+         'bin/launch.sh': b'#!/bin/sh\n',
+         'resources/big.bin': os.urandom(100000),
+         '.git/HEAD': b'ref: refs/heads/release/v1.0.0\n'}
+
+
+@pytest.fixture()
+def source(tmpdir):
+    root = str(tmpdir.join('repo'))
+    for relative_path, content in FILES.items():
+        file_path = os.path.join(root, *relative_path.split('/'))
+        if not os.path.isdir(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path))
+        with open(file_path, 'wb') as f:
+            f.write(content)
+
+    os.chmod(os.path.join(root, 'bin', 'launch.sh'), 0o755)
+    os.makedirs(os.path.join(root, 'cache', 'empty'))
+    yield root
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_copy_tree(source, tmpdir, workers):
+    dest = str(tmpdir.join('release', 'v1.0.0'))
+    manifest = copyOps.copy_tree(source, dest, workers=workers, large_file_size=30000, chunk_size=16384)
+
+    for relative_path, content in FILES.items():
+        assert read(os.path.join(dest, *relative_path.split('/'))) == content
+    assert os.path.isdir(os.path.join(dest, 'cache', 'empty'))
+    assert os.stat(os.path.join(dest, 'bin', 'launch.sh')).st_mode & stat.S_IXUSR
+    # Python 2 copystat loses the sub-second precision, compare at zip's two second resolution like zipOps does
+    assert abs(os.path.getmtime(os.path.join(dest, 'README.md')) -
+               os.path.getmtime(os.path.join(source, 'README.md'))) < 2
+
+    assert manifest == copyOps.read_manifest(dest)
+    assert list(manifest['timings']) == ['scan', 'hash', 'copy', 'verify']
+    assert manifest['stats']['files'] == len(FILES)
+    assert manifest['stats']['bytes'] == sum(len(content) for content in FILES.values())
+
+    entries = dict((entry['path'], entry) for entry in manifest['files'])
+    assert sorted(entries) == sorted(FILES)
+    assert entries['README.md']['sha256'] == copyOps.hash_file(os.path.join(source, 'README.md'))
+    assert entries['bin/launch.sh']['executable'] is True
+
+
+def test_copy_tree_ignore_dirs(source, tmpdir):
+    manifest = copyOps.copy_tree(source, str(tmpdir.join('release')), ignore_dirs=['.git'])
+
+    assert '.git/HEAD' not in [entry['path'] for entry in manifest['files']]
+    assert not os.path.exists(str(tmpdir.join('release', '.git')))
+
+
+def test_copy_tree_existing_destination(source, tmpdir):
+    with pytest.raises(RuntimeError):
+        copyOps.copy_tree(source, source)
+
+
+def test_get_copy_tasks():
+    small = copyOps.CopyJob('src', 'dest', 100)
+    assert copyOps.get_copy_tasks(small, large_file_size=100, chunk_size=40) == [copyOps.CopyTask('src', 'dest', 0, None)]
+
+    large = copyOps.CopyJob('src', 'dest', 101)
+    assert [(task.offset, task.length) for task in copyOps.get_copy_tasks(large, large_file_size=100, chunk_size=40)] == [
+        (0, 40), (40, 40), (80, 21)]
+
+
+def test_verify_files(source, tmpdir):
+    directories, files = copyOps.walk(source)
+    entries = copyOps.hash_files(files)
+    copyOps.verify_files(source, entries)
+
+    with open(os.path.join(source, 'hooks', 'publish.py'), 'ab') as f:
+        f.write(b'import sys\n')
+    os.remove(os.path.join(source, 'README.md'))
+
+    with pytest.raises(RuntimeError) as e:
+        copyOps.verify_files(source, entries)
+    assert 'README.md' in str(e.value)
+    assert 'hooks/publish.py' in str(e.value)
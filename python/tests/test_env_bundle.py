@@ -0,0 +1,162 @@
+import pytest
+
+import sys, os
+import subprocess
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, myPath + '/../../')
+sys.path.insert(0, myPath)
+
+from blPython.shotgun import env, env_bundle
+from blPython.scripts.tools import env_bundler
+from fake_shotgun import FakeShotgun
+import env_fixtures
+
+NUKE = env_bundle.make_key(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'])
+NUKE_USER = env_bundle.make_key(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], env_fixtures.USER['id'])
+MAYA = env_bundle.make_key('tk-maya', env_fixtures.PROJECT['id'])
+MAYA_USER = env_bundle.make_key('tk-maya', env_fixtures.PROJECT['id'], env_fixtures.USER['id'])
+
+
+@pytest.fixture()
+def sg():
+    env.ANCESTRY_CACHE.clear()
+    env.PARSE_CACHE.clear()
+
+    data = env_fixtures.sg_data()
+    data['Software'].append({'id': 6, 'code': 'Maya', 'engine': 'tk-maya',
+                             'project_sg_software_projects': [env_fixtures.PROJECT], 'sg_env': None})
+    yield FakeShotgun(data)
+
+
+@pytest.fixture()
+def bundle_path(tmpdir):
+    yield str(tmpdir.join('env_bundle'))
+
+
+def resolve(sg, engine_name, user):
+    project = sg.find_one('Project', [['id', 'is', env_fixtures.PROJECT['id']]], ['sg_env', 'sg_software'])
+    return env.resolve_env(sg, engine_name, project, user)
+
+
+def update_environment(sg, id, data):
+    environment = sg.data[env_fixtures.ENV_TYPE][id]
+    environment.update({'sg_json': repr(data), 'updated_at': environment['updated_at'] + 1})
+
+
+def test_build_and_get_without_network(sg, bundle_path):
+    report = env_bundler.build_bundle(sg, bundle_path, users=True)
+    assert sorted(report['written']) == sorted([NUKE, NUKE_USER, MAYA, MAYA_USER])
+
+    expected = {}
+    for engine_name in [env_fixtures.ENGINE_NAME, 'tk-maya']:
+        for user in [None, env_fixtures.USER]:
+            expected[(engine_name, user['id'] if user else None)] = resolve(sg, engine_name, user)
+    sg.reset_calls()
+
+    bundle = env_bundle.EnvBundle(bundle_path)
+    for (engine_name, user_id), data in expected.items():
+        assert bundle.get(engine_name, env_fixtures.PROJECT['id'], user_id) == data
+    assert bundle.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], env_fixtures.USER['id'])['LEVEL']['value'] == 'user'
+
+    # Users without environments of their own get the project's env
+    assert bundle.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], 7) == expected[(env_fixtures.ENGINE_NAME, None)]
+    assert bundle.get('tk-houdini', env_fixtures.PROJECT['id']) is None
+    assert sg.call_count() == 0
+
+    # Served as native strings, for os.environ
+    data = bundle.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'])
+    assert all(isinstance(value, str) for key, item in data.items() for value in [key, item['action'], item['value']])
+
+
+def test_rebuild_only_updated_combinations(sg, bundle_path):
+    env_bundler.build_bundle(sg, bundle_path, users=True)
+
+    report = env_bundler.build_bundle(sg, bundle_path, users=True)
+    assert report['written'] == [] and len(report['unchanged']) == 4
+
+    # Only the nuke combinations are resolved from the engine environment
+    update_environment(sg, 10, {'NUKE_PATH': {'action': 'append', 'value': '/nuke/11'}})
+    report = env_bundler.build_bundle(sg, bundle_path, users=True)
+    assert sorted(report['written']) == sorted([NUKE, NUKE_USER])
+    assert env_bundle.EnvBundle(bundle_path).get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'])['NUKE_PATH']['value'] == '/nuke/11'
+
+    # Only the user combinations are resolved from the user environment
+    update_environment(sg, 30, {'LEVEL': {'action': 'set', 'value': 'me'}})
+    report = env_bundler.build_bundle(sg, bundle_path, users=True)
+    assert sorted(report['written']) == sorted([NUKE_USER, MAYA_USER])
+
+    assert len(env_bundler.build_bundle(sg, bundle_path, users=True, force=True)['written']) == 4
+
+
+def test_check_freshness(sg, bundle_path):
+    env_bundler.build_bundle(sg, bundle_path, users=True)
+    bundle = env_bundle.EnvBundle(bundle_path)
+    assert bundle.check_freshness(sg) == []
+
+    update_environment(sg, 20, {'LEVEL': {'action': 'set', 'value': 'show'}})
+    sg.reset_calls()
+    assert bundle.check_freshness(sg) == sorted([NUKE, NUKE_USER, MAYA, MAYA_USER])
+    assert sg.call_count() == 1
+
+
+def test_removed_combinations(sg, bundle_path):
+    env_bundler.build_bundle(sg, bundle_path)
+    del sg.data['Software'][6]
+
+    report = env_bundler.build_bundle(sg, bundle_path)
+    assert report['removed'] == [MAYA]
+    assert env_bundle.EnvBundle(bundle_path).get('tk-maya', env_fixtures.PROJECT['id']) is None
+    assert sorted(os.listdir(bundle_path)) == ['index.json', 'tk-nuke_314_default.bat', 'tk-nuke_314_default.json',
+                                               'tk-nuke_314_default.sh']
+
+
+def test_apply_env(tmpdir):
+    nuke_path = tmpdir.mkdir('nuke')
+    python_path = tmpdir.mkdir('python')
+    data = {'LEVEL': {'action': 'set', 'value': 'user'},
+            'NUKE_PATH': {'action': 'append', 'value': str(nuke_path)},
+            'OFX_PLUGIN_PATH': {'action': 'append', 'value': str(tmpdir.join('missing'))},
+            'PYTHONPATH': {'action': 'append', 'value': str(python_path)}}
+
+    # Like Env.set_env, PYTHONPATH goes to sys.path, missing and already added paths are skipped
+    environ = {'LEVEL': 'studio', 'NUKE_PATH': os.pathsep.join(['/plugins', str(nuke_path) + os.sep])}
+    sys_path = []
+    env_bundle.apply_env(data, environ, sys_path)
+    assert environ == {'LEVEL': 'user', 'NUKE_PATH': os.pathsep.join(['/plugins', str(nuke_path) + os.sep])}
+    assert sys_path == [env_bundle.normalize_path(str(python_path))]
+
+    # A new process gets PYTHONPATH from its environ
+    environ = {}
+    env_bundle.apply_env(data, environ)
+    assert environ == {'LEVEL': 'user', 'NUKE_PATH': env_bundle.normalize_path(str(nuke_path)),
+                       'PYTHONPATH': env_bundle.normalize_path(str(python_path))}
+
+
+def test_get_environ(sg, bundle_path, tmpdir):
+    nuke_path = str(tmpdir.mkdir('nuke'))
+    update_environment(sg, 10, {'NUKE_PATH': {'action': 'append', 'value': nuke_path}})
+    env_bundler.build_bundle(sg, bundle_path)
+    bundle = env_bundle.EnvBundle(bundle_path)
+
+    environ = bundle.get_environ(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], environ={'NUKE_PATH': '/plugins'})
+    assert environ['LEVEL'] == 'project'
+    assert environ['NUKE_PATH'] == os.pathsep.join(['/plugins', env_bundle.normalize_path(nuke_path)])
+
+    with pytest.raises(KeyError):
+        bundle.get_environ('tk-houdini', env_fixtures.PROJECT['id'])
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='sources the sh script')
+def test_shell_script(sg, bundle_path, tmpdir):
+    nuke_path = str(tmpdir.mkdir("it's nuke"))
+    update_environment(sg, 10, {'NUKE_PATH': {'action': 'append', 'value': nuke_path},
+                                'OFX_PLUGIN_PATH': {'action': 'append', 'value': str(tmpdir.join('missing'))}})
+    update_environment(sg, 20, {'LEVEL': {'action': 'set', 'value': "it's a project"}})
+    env_bundler.build_bundle(sg, bundle_path)
+
+    # Sourcing it twice doesn't add the path twice, and the missing path isn't added
+    script = os.path.join(bundle_path, 'tk-nuke_314_default.sh')
+    output = subprocess.check_output(['sh', '-c', '. "$0" && . "$0" && echo "$LEVEL|$NUKE_PATH|$OFX_PLUGIN_PATH"',
+                                      script], env={'NUKE_PATH': '/plugins'})
+    assert output.decode('utf-8').strip() == "it's a project|/plugins:%s|" % nuke_path
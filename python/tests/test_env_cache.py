@@ -0,0 +1,123 @@
+import pytest
+
+import sys, os, time
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, myPath + '/../../')
+sys.path.insert(0, myPath)
+
+from blPython.shotgun import env, env_cache
+from fake_shotgun import FakeShotgun
+import env_fixtures
+
+
+@pytest.fixture()
+def sg():
+    yield FakeShotgun(env_fixtures.sg_data())
+
+
+@pytest.fixture()
+def cache(tmpdir):
+    yield env_cache.EnvCache(str(tmpdir.join('env_cache')), ttl=60)
+
+
+def resolve_and_cache(sg, cache):
+    project = sg.find_one('Project', [['id', 'is', env_fixtures.PROJECT['id']]], ['sg_env', 'sg_software'])
+    resolver = env.EnvironmentResolver(sg)
+    data = env.resolve_env(sg, env_fixtures.ENGINE_NAME, project, env_fixtures.USER, resolver=resolver)
+    cache.put(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], env_fixtures.USER['id'], data,
+              resolver.get_updated_at())
+    return data
+
+
+def expire(cache):
+    entry = cache.load(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], env_fixtures.USER['id'])
+    entry['validated_at'] = time.time() - cache.ttl - 1
+    cache.write(entry)
+
+
+def test_hit_without_network(sg, cache):
+    data = resolve_and_cache(sg, cache)
+    sg.reset_calls()
+
+    cached = cache.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], env_fixtures.USER['id'], sg=sg)
+    assert cached == data
+    assert sg.call_count() == 0
+
+    # Served as native strings, for os.environ
+    assert all(isinstance(value, str) for key, item in cached.items() for value in [key, item['value']])
+
+
+def test_miss_for_other_key(sg, cache):
+    resolve_and_cache(sg, cache)
+    assert cache.get('tk-maya', env_fixtures.PROJECT['id'], env_fixtures.USER['id']) is None
+
+
+def test_expired_entry_is_revalidated_in_one_query(sg, cache):
+    data = resolve_and_cache(sg, cache)
+    expire(cache)
+    sg.reset_calls()
+
+    assert cache.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], env_fixtures.USER['id'], sg=sg) == data
+    assert sg.call_count() == 1
+
+    # The entry was renewed, so the next call is served from disk again.
+    assert cache.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], env_fixtures.USER['id'], sg=sg) == data
+    assert sg.call_count() == 1
+
+
+def test_expired_entry_without_sg_is_a_miss(sg, cache):
+    resolve_and_cache(sg, cache)
+    expire(cache)
+    assert cache.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], env_fixtures.USER['id']) is None
+
+
+def test_changed_environment_invalidates_expired_entry(sg, cache):
+    resolve_and_cache(sg, cache)
+    expire(cache)
+    sg.data[env_fixtures.ENV_TYPE][3]['updated_at'] = 2
+
+    assert cache.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], env_fixtures.USER['id'], sg=sg) is None
+    assert cache.load(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], env_fixtures.USER['id']) is None
+
+
+def test_invalidate(sg, cache):
+    resolve_and_cache(sg, cache)
+    assert cache.invalidate(env_id=999) == 0
+    assert cache.invalidate(env_id=3) == 1
+    assert cache.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], env_fixtures.USER['id']) is None
+
+
+def test_invalidate_from_event(sg, cache):
+    resolve_and_cache(sg, cache)
+
+    event = {'event_type': 'Shotgun_Project_Change',
+             'meta': {'entity_type': 'Project', 'entity_id': 1, 'attribute_name': 'sg_env'}}
+    assert cache.invalidate_from_event(event) == 0
+
+    event = {'event_type': 'Shotgun_CustomNonProjectEntity02_Change',
+             'meta': {'entity_type': env_fixtures.ENV_TYPE, 'entity_id': 1, 'attribute_name': 'sg_json'}}
+    assert cache.invalidate_from_event(event) == 1
+
+
+def test_get_cache_disabled(monkeypatch):
+    monkeypatch.setenv('BL_ENV_CACHE_TTL', '0')
+    assert env_cache.get_cache() is None
+
+
+def test_get_cache_off_by_default(monkeypatch, tmpdir):
+    monkeypatch.delenv('BL_ENV_CACHE_TTL', raising=False)
+    assert env_cache.get_cache() is None
+
+    monkeypatch.setenv('BL_ENV_CACHE_TTL', '60')
+    monkeypatch.setenv('BL_ENV_CACHE_DIR', str(tmpdir))
+    assert env_cache.get_cache().ttl == 60
+
+
+def test_expired_entry_without_environments_is_stale(sg, cache):
+    cache.put(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], None, {}, {})
+    entry = cache.load(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], None)
+    entry['validated_at'] = time.time() - cache.ttl - 1
+    cache.write(entry)
+
+    assert cache.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], None, sg=sg) is None
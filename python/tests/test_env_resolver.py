@@ -0,0 +1,165 @@
+import pytest
+
+import sys, os
+import json
+import time
+import threading
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, myPath + '/../../')
+sys.path.insert(0, myPath)
+
+from blPython.shotgun import env
+from fake_shotgun import FakeShotgun
+import env_fixtures
+
+# Round trips needed to resolve the fixture env: Project, Software, user envs and two graph generations.
+MAX_ROUND_TRIPS = 5
+
+
+@pytest.fixture()
+def sg():
+    env.ANCESTRY_CACHE.clear()
+    env.PARSE_CACHE.clear()
+    yield FakeShotgun(env_fixtures.sg_data())
+
+
+def get_project(sg):
+    return sg.find_one('Project', [['id', 'is', env_fixtures.PROJECT['id']]], ['sg_env', 'sg_software'])
+
+
+def test_resolver_fetches_one_query_per_generation(sg):
+    resolver = env.EnvironmentResolver(sg)
+    resolver.fetch([10, 20, 30])
+
+    # generation 1 : 10, 20, 30. generation 2 : 3. generation 3 : 1
+    assert sg.call_count('find') == 3
+    assert sg.call_count('find_one') == 0
+    assert [i['id'] for i in resolver.get_chain(30)] == [30, 20, 3, 1]
+
+
+def test_resolver_matches_recursive_merge_order(sg):
+    resolver = env.EnvironmentResolver(sg)
+    result = resolver.resolve([{'type': env_fixtures.ENV_TYPE, 'id': 10}])
+
+    assert result['LEVEL']['value'] == 'engine'
+    assert result['STUDIO']['value'] == 'base'
+    assert result['NUKE_PATH']['value'] == '/nuke'
+
+
+def test_resolver_handles_missing_and_cyclic_parents(sg):
+    sg.add(env_fixtures.ENV_TYPE, env_fixtures._env(50, 'Loop A', 51, {'A': {'action': 'set', 'value': 'a'}}))
+    sg.add(env_fixtures.ENV_TYPE, env_fixtures._env(51, 'Loop B', 50, {'B': {'action': 'set', 'value': 'b'}}))
+
+    resolver = env.EnvironmentResolver(sg)
+    assert resolver.get_chain(999) == []
+    assert [i['id'] for i in resolver.get_chain(50)] == [50, 51]
+    assert resolver.get_ancestry(50) == {'A': {'action': 'set', 'value': 'a'}, 'B': {'action': 'set', 'value': 'b'}}
+
+
+def test_ancestry_memo(sg, monkeypatch):
+    parsed = []
+    literal_eval = env.ast.literal_eval
+    monkeypatch.setattr(env.ast, 'literal_eval', lambda data: parsed.append(data) or literal_eval(data))
+
+    # Every environment of the graph is parsed once, however many chains it is part of
+    first = env.resolve_env(sg, env_fixtures.ENGINE_NAME, get_project(sg), env_fixtures.USER)
+    assert len(parsed) == 5
+
+    second = env.resolve_env(sg, env_fixtures.ENGINE_NAME, get_project(sg), env_fixtures.USER)
+    assert second == first
+    assert len(parsed) == 5
+
+    # Callers get their own copies
+    second['LEVEL']['value'] = 'changed'
+    assert env.EnvironmentResolver(sg).resolve([{'type': env_fixtures.ENV_TYPE, 'id': 30}])['LEVEL']['value'] == 'user'
+
+    # Updating an ancestor invalidates the chains below it, only its own payload is parsed again
+    sg.data[env_fixtures.ENV_TYPE][20].update({'sg_json': repr({'PROJECT': {'action': 'set', 'value': 'p'}}),
+                                               'updated_at': 2})
+    del parsed[:]
+    resolver = env.EnvironmentResolver(sg)
+    assert resolver.resolve([{'type': env_fixtures.ENV_TYPE, 'id': 30}])['PROJECT']['value'] == 'p'
+    assert resolver.resolve([{'type': env_fixtures.ENV_TYPE, 'id': 10}]) == \
+        env.EnvironmentResolver(sg).resolve([{'type': env_fixtures.ENV_TYPE, 'id': 10}])
+    assert len(parsed) == 1
+
+
+def test_parse_sg_json(sg):
+    payload = {'PYTHONPATH': {'action': 'append', 'value': '/pipeline/python'}}
+
+    assert env.parse_sg_json(1, json.dumps(payload)) == payload
+    assert env.parse_sg_json(2, repr(payload)) == payload
+    assert env.parse_sg_json(3, repr({'FLAG': {'action': 'set', 'value': None}})) == {'FLAG': {'action': 'set', 'value': None}}
+
+    # Unchanged payloads are served from the memo, changed ones are parsed again
+    assert env.parse_sg_json(1, json.dumps(payload)) is env.parse_sg_json(1, json.dumps(payload))
+    assert env.parse_sg_json(1, json.dumps({})) == {}
+    assert env.PARSE_CACHE.stats()['size'] == 4
+
+    # Invalid payloads raise like ast.literal_eval did
+    with pytest.raises(SyntaxError):
+        env.parse_sg_json(4, '{not a payload')
+
+
+def test_parse_sg_json_non_ascii(sg, monkeypatch):
+    data = env.parse_sg_json(5, json.dumps({'BL_TEST_SHOW': {'action': 'set', 'value': u'S:\\caf\u00e9'}}))
+
+    # os.environ only takes native strings, json returns unicode ones under Python 2
+    item = data['BL_TEST_SHOW']
+    assert all(isinstance(value, str) for value in list(data) + list(item) + list(item.values()))
+
+    monkeypatch.setenv('BL_TEST_SHOW', 'before')
+    resolved = env.Env.__new__(env.Env)
+    resolved.env = data
+    resolved.set_env()
+    assert os.environ['BL_TEST_SHOW'] == item['value']
+
+
+def test_resolve_env_layers(sg):
+    result = env.resolve_env(sg, env_fixtures.ENGINE_NAME, get_project(sg), env_fixtures.USER)
+
+    assert result['LEVEL']['value'] == 'user'
+    assert result['NUKE_PATH']['value'] == '/nuke'
+    assert result['STUDIO']['value'] == 'base'
+
+
+def test_resolve_env_round_trips(sg):
+    project = get_project(sg)
+    sg.reset_calls()
+
+    env.resolve_env(sg, env_fixtures.ENGINE_NAME, project, env_fixtures.USER)
+
+    assert sg.call_count() + 1 <= MAX_ROUND_TRIPS
+
+
+def test_concurrent_layers_match_serial(sg):
+    serial = env.resolve_env(sg, env_fixtures.ENGINE_NAME, get_project(sg), env_fixtures.USER)
+    sg.reset_calls()
+
+    project, layers = env.get_env_layers_concurrently(lambda: sg, env_fixtures.ENGINE_NAME, env_fixtures.PROJECT,
+                                                      env_fixtures.USER)
+    assert project == get_project(sg)
+    assert list(layers) == ['studio', 'engine', 'project', 'user']
+    assert env.resolve_layers(env.EnvironmentResolver(sg), layers) == serial
+    assert sg.call_count() <= MAX_ROUND_TRIPS + 1
+
+
+def test_concurrent_layers_latency():
+    delay = 0.1
+    sg = FakeShotgun(env_fixtures.sg_data(), delay=delay)
+    threads = set()
+
+    def get_sg():
+        threads.add(threading.current_thread().ident)
+        return sg
+
+    start = time.time()
+    project, layers = env.get_env_layers_concurrently(get_sg, env_fixtures.ENGINE_NAME, env_fixtures.PROJECT,
+                                                      env_fixtures.USER)
+    elapsed = time.time() - start
+
+    # The three lookups overlap instead of taking a round trip each
+    assert sg.call_count() == 3
+    assert len(threads) == 3
+    assert elapsed < 2 * delay
@@ -0,0 +1,145 @@
+import pytest
+
+import sys, os
+import threading
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, myPath + '/../../')
+sys.path.insert(0, myPath)
+
+from blPython.core import connection
+from blPython.shotgun import env, env_service
+from fake_shotgun import FakeShotgun
+import env_fixtures
+
+
+@pytest.fixture()
+def sg():
+    env.ANCESTRY_CACHE.clear()
+    env.PARSE_CACHE.clear()
+
+    # The service connects through the connection pool, like it does with a real site
+    sg = FakeShotgun(env_fixtures.sg_data())
+    previous = connection.set_pool(connection.ConnectionPool(factory=lambda site, script_name, api_key: sg))
+    yield sg
+    connection.set_pool(previous)
+
+
+@pytest.fixture()
+def server(sg):
+    server = env_service.EnvServer(env_service.EnvService(), ('127.0.0.1', 0))
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def resolve(sg, user):
+    project = sg.find_one('Project', [['id', 'is', env_fixtures.PROJECT['id']]], ['sg_env', 'sg_software'])
+    return env.resolve_env(sg, env_fixtures.ENGINE_NAME, project, user)
+
+
+def test_get(sg, server):
+    client = env_service.EnvServiceClient(server.server_address)
+
+    data = client.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], env_fixtures.USER['id'])
+    assert data == resolve(sg, env_fixtures.USER)
+    assert all(isinstance(value, str) for key, item in data.items() for value in [key, item['action'], item['value']])
+    assert client.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], None) == resolve(sg, None)
+
+    # Served from the service's cache
+    sg.reset_calls()
+    assert client.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], env_fixtures.USER['id']) == data
+    assert sg.call_count() == 0
+
+    stats = client.stats()
+    assert stats['requests'] == 3
+    assert stats['resolutions'] == 2
+    assert stats['cache']['size'] == 2
+    assert stats['cache']['hits'] == 1 and stats['cache']['misses'] == 2
+
+
+def test_coalesce(sg, server):
+    sg.delay = 0.02
+    client = env_service.EnvServiceClient(server.server_address)
+    results = []
+
+    def get():
+        results.append(client.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], env_fixtures.USER['id']))
+
+    threads = [threading.Thread(target=get) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 8 and all(result == results[0] for result in results)
+
+    # One resolution, the other requests waited for it or were served from the cache
+    stats = server.service.stats()
+    assert stats['resolutions'] == 1
+    assert stats['coalesced'] + stats['cache']['hits'] == 7
+    assert stats['in_flight'] == 0
+
+
+def test_invalidate(sg, server):
+    client = env_service.EnvServiceClient(server.server_address)
+    client.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], env_fixtures.USER['id'])
+    client.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], None)
+
+    assert client.invalidate(user_id=env_fixtures.USER['id']) == 1
+    assert client.invalidate() == 1
+
+    sg.data[env_fixtures.ENV_TYPE][30]['sg_json'] = repr({'LEVEL': {'action': 'set', 'value': 'me'}})
+    sg.data[env_fixtures.ENV_TYPE][30]['updated_at'] = 2
+    data = client.get(env_fixtures.ENGINE_NAME, env_fixtures.PROJECT['id'], env_fixtures.USER['id'])
+    assert data['LEVEL']['value'] == 'me'
+
+
+def test_errors(sg, server):
+    client = env_service.EnvServiceClient(server.server_address)
+
+    # Errors are reported to the client, which lets the Env resolve itself
+    assert client.get(env_fixtures.ENGINE_NAME, 999, None) is None
+    assert client.request({'op': 'restart'}) == {'ok': False, 'error': 'Unknown op : restart'}
+    assert server.service.stats()['errors'] == 1
+
+    # Failed resolutions aren't cached
+    assert client.get(env_fixtures.ENGINE_NAME, 999, None) is None
+    assert server.service.stats()['errors'] == 2
+
+
+def test_service_unavailable(server):
+    address = server.server_address
+    server.shutdown()
+    server.server_close()
+
+    assert env_service.EnvServiceClient(address, timeout=1.0).get(env_fixtures.ENGINE_NAME,
+                                                                  env_fixtures.PROJECT['id'], None) is None
+
+
+def test_resolutions_keep_their_connections(sg):
+    pool = connection.ConnectionPool(factory=lambda site, script_name, api_key: sg)
+    previous = connection.set_pool(pool)
+    server = env_service.EnvServer(env_service.EnvService(workers=1), ('127.0.0.1', 0))
+    server.start()
+    try:
+        # Every request has a connection, and a server thread, of its own
+        for user_id in [None, env_fixtures.USER['id'], 7]:
+            env_service.EnvServiceClient(server.server_address).get(env_fixtures.ENGINE_NAME,
+                                                                    env_fixtures.PROJECT['id'], user_id)
+    finally:
+        server.shutdown()
+        server.server_close()
+        connection.set_pool(previous)
+
+    assert server.service.stats()['resolutions'] == 3
+    assert pool.stats()['created'] == 1
+
+
+def test_invalidate_is_local_only(sg, server):
+    assert server.service.handle({'op': 'invalidate'}, local=False)['ok'] is False
+    assert server.service.handle({'op': 'invalidate'}) == {'ok': True, 'removed': 0}
+
+    assert env_service.is_loopback('127.0.0.1') and env_service.is_loopback('::1')
+    assert not env_service.is_loopback('10.0.0.12')
@@ -0,0 +1,143 @@
+import pytest
+
+import sys, os
+import logging
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, myPath + '/../../')
+sys.path.insert(0, myPath)
+
+from blPython.core.cache import LRUCache
+from blPython.events import eventOps
+from fake_shotgun import FakeShotgun
+
+LIVE_PLUGIN = r'S:\pipeline\shotgunEvents\plugins\live\plugin.py'
+
+logger = logging.getLogger('test_event_ops')
+
+
+@pytest.fixture()
+def sg(monkeypatch):
+    monkeypatch.delenv('BLK_EVENTS_DEV', raising=False)
+    eventOps.PROJECT_TYPE_CACHE.clear()
+    eventOps.PROJECT_TYPE_CACHE.reset_stats()
+    yield FakeShotgun({'Project': [{'id': 1, 'sg_type': 'Production'},
+                                   {'id': 2, 'sg_type': 'Dev'}],
+                       'HumanUser': [{'id': 7, 'sg_type': None}]})
+
+
+def make_event(id, project_id=None, entity_type='Shot', entity_id=100, attribute_name='code'):
+    return {'id': id,
+            'event_type': 'Shotgun_%s_Change' % entity_type,
+            'project': {'type': 'Project', 'id': project_id} if project_id else None,
+            'meta': {'entity_type': entity_type, 'entity_id': entity_id, 'attribute_name': attribute_name}}
+
+
+class FakeTimer(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+
+    assert 'b' not in cache
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_lru_cache_ttl():
+    timer = FakeTimer()
+    cache = LRUCache(maxsize=2, ttl=10, timer=timer)
+    cache.set('a', 1)
+
+    timer.now = 10
+    assert cache.get('a') == 1
+    timer.now = 21
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_lru_cache_peek():
+    timer = FakeTimer()
+    cache = LRUCache(maxsize=2, ttl=10, timer=timer)
+    cache.set('a', 1)
+
+    assert cache.peek('a') == 1 and cache.peek('b') is None
+    timer.now = 11
+    assert cache.peek('a') is None
+    assert cache.stats()['hits'] == cache.stats()['misses'] == cache.stats()['expirations'] == 0
+
+
+def test_project_type_is_memoized(sg):
+    for i in range(10):
+        assert eventOps.is_valid_event(LIVE_PLUGIN, make_event(i, project_id=1), sg, logger)
+
+    assert sg.call_count('find_one') == 1
+    assert eventOps.get_cache_stats()['hit_rate'] == 0.9
+
+
+def test_entity_without_project(sg):
+    assert not eventOps.is_valid_event(LIVE_PLUGIN, make_event(1, entity_type='HumanUser', entity_id=99), sg, logger)
+    assert eventOps.is_valid_event(LIVE_PLUGIN, make_event(2, entity_type='HumanUser', entity_id=7), sg, logger)
+    assert eventOps.is_valid_event(LIVE_PLUGIN, make_event(3, entity_type='HumanUser', entity_id=7), sg, logger)
+    assert sg.call_count('find_one') == 2
+
+
+def test_project_type_change_invalidates(sg):
+    eventOps.is_valid_event(LIVE_PLUGIN, make_event(1, project_id=1), sg, logger)
+    assert eventOps.get_project_entity('Project', 1, sg)['sg_type'] == 'Production'
+
+    sg.data['Project'][1]['sg_type'] = 'Dev'
+    change = make_event(2, project_id=1, entity_type='Project', entity_id=1, attribute_name='sg_type')
+    eventOps.is_valid_event(LIVE_PLUGIN, change, sg, logger)
+
+    assert eventOps.get_project_entity('Project', 1, sg)['sg_type'] == 'Dev'
+    assert sg.call_count('find_one') == 2
+
+
+def test_are_valid_events_batches_queries(sg):
+    events = [make_event(1, project_id=1),
+              make_event(2, project_id=2),
+              make_event(3, entity_type='HumanUser', entity_id=7),
+              make_event(4, project_id=1),
+              make_event(5, entity_type='HumanUser', entity_id=99)]
+
+    assert eventOps.are_valid_events(LIVE_PLUGIN, events, sg, logger) == [True, True, True, True, False]
+
+    # One query per entity type
+    assert sg.call_count() == 2
+    assert sg.call_count('find') == 2
+
+    # Everything is now cached
+    eventOps.are_valid_events(LIVE_PLUGIN, events[:4], sg, logger)
+    assert sg.call_count() == 2
+
+
+def test_are_valid_events_matches_is_valid_event(sg):
+    events = [make_event(i, project_id=1 + i % 2) for i in range(6)]
+    expected = [eventOps.is_valid_event(LIVE_PLUGIN, event, sg, logger) for event in events]
+
+    eventOps.PROJECT_TYPE_CACHE.clear()
+    assert eventOps.are_valid_events(LIVE_PLUGIN, events, sg, logger) == expected
+
+
+def test_compact_log_record(sg, caplog):
+    with caplog.at_level(logging.INFO, logger='test_event_ops'):
+        eventOps.is_valid_event(LIVE_PLUGIN, make_event(1, project_id=1), sg, logger)
+
+    assert [r.getMessage() for r in caplog.records] == ['event=1 project=1 valid=True reason=live']
+
+
+def test_event_dump_only_at_debug(sg, caplog):
+    with caplog.at_level(logging.DEBUG, logger='test_event_ops'):
+        eventOps.is_valid_event(LIVE_PLUGIN, make_event(1, project_id=1), sg, logger)
+
+    assert any(r.getMessage().startswith('event : ') for r in caplog.records)
@@ -0,0 +1,63 @@
+import pytest
+
+import sys, os
+import subprocess
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, myPath + '/../../')
+sys.path.insert(0, myPath)
+
+from blPython.git import gitOps
+import git_fixtures
+
+TAGS = [('light', None), ('v1.0.0', 'First release'), ('v1.0.1', "It's a patch")]
+
+
+@pytest.fixture()
+def repo(tmpdir):
+    yield git_fixtures.make_repo(str(tmpdir.join('test-repo')), tags=TAGS)
+
+
+def test_get_git_metadata(repo):
+    metadata = gitOps.get_git_metadata(repo)
+
+    assert metadata.repo_url == 'https://github.com/blacksmith/test-repo.git'
+    assert metadata.repo_name == 'test-repo'
+    assert metadata.branch == 'release/v1.0.0'
+    assert metadata.commit == git_fixtures.git(repo, 'rev-parse', 'HEAD').strip()
+    assert metadata.commit_short == git_fixtures.git(repo, 'rev-parse', '--short', 'HEAD').strip()
+    assert metadata.commit_comment == 'Initial commitWith a body.'
+    assert metadata.tags == ['light', 'v1.0.0', 'v1.0.1']
+    assert metadata.tag_comment == "Initial commit\n\nWith a body.\nFirst release\nIt's a patch\n"
+
+
+def test_get_git_metadata_detached_head(repo):
+    git_fixtures.git(repo, 'checkout', '-q', '--detach')
+    metadata = gitOps.get_git_metadata(repo)
+
+    assert metadata.branch == 'HEAD'
+    assert metadata.commit == git_fixtures.git(repo, 'rev-parse', 'HEAD').strip()
+    assert metadata.commit_comment == 'Initial commitWith a body.'
+
+
+def test_get_git_metadata_spawns_two_processes(repo, monkeypatch):
+    calls = []
+    check_output = subprocess.check_output
+
+    def counting_check_output(*args, **kwargs):
+        calls.append(args[0])
+        return check_output(*args, **kwargs)
+
+    monkeypatch.setattr(subprocess, 'check_output', counting_check_output)
+    gitOps.get_git_metadata(repo)
+
+    assert len(calls) == 2
+
+
+def test_get_git_metadata_invalid_repo(tmpdir):
+    with pytest.raises(subprocess.CalledProcessError):
+        gitOps.get_git_metadata(str(tmpdir))
+
+
+def test_get_current_tag_messages_from_path(repo):
+    assert gitOps.get_current_tag_messages_from_path(repo) == gitOps.get_git_metadata(repo).tag_comment
@@ -0,0 +1,159 @@
+"""
+Parity tests of the native gitReader backend against the git CLI, on throwaway repos.
+"""
+import pytest
+
+import sys, os
+import subprocess
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, myPath + '/../../')
+sys.path.insert(0, myPath)
+
+from blPython.git import gitOps, gitReader
+import git_fixtures
+from git_fixtures import git
+
+TAGS = [('light', None), ('v1.0.0', 'First release'), ('v1.0.1', 'Patch release')]
+
+
+def get_git_version():
+    version = git('.', '--version').split()[2]
+    return tuple(int(i) for i in version.split('.')[:2])
+
+
+def query_all(path, backend):
+    previous = gitOps.BACKEND
+    gitOps.set_backend(backend)
+    try:
+        return (gitOps.get_current_git_branch_from_path(path, strip_parent=False),
+                gitOps.get_current_git_branch_from_path(path),
+                gitOps.get_current_commit_hash_from_path(path, short=False),
+                gitOps.get_current_commit_hash_from_path(path, short=True),
+                gitOps.get_git_remote_url_from_path(path),
+                gitOps.get_current_tags_from_path(path))
+    finally:
+        gitOps.set_backend(previous)
+
+
+def assert_parity(path):
+    assert query_all(path, 'native') == query_all(path, 'cli')
+
+
+def assert_native(path):
+    """
+    Checks the reader answers on its own, without falling back to the CLI.
+    """
+    reader = gitReader.GitRepoReader(path)
+    assert reader.get_branch() == git(path, 'rev-parse', '--abbrev-ref', 'HEAD').strip()
+    assert reader.get_head_commit() == git(path, 'rev-parse', 'HEAD').strip()
+    assert reader.get_remote_url() == git(path, 'config', '--get', 'remote.origin.url').strip()
+    assert reader.get_tags() == git(path, 'tag', '-l', '--points-at', 'HEAD').split()
+
+
+@pytest.fixture()
+def repo(tmpdir):
+    path = git_fixtures.make_repo(str(tmpdir.join('repo')), tags=TAGS)
+
+    # Add an older tag that must not be reported
+    git(path, 'tag', '-a', 'v0.9.0', '-m', 'Old release')
+    with open(os.path.join(path, 'second.txt'), 'w') as f:
+        f.write('second\n')
+    git(path, 'add', '-A')
+    git(path, 'commit', '-q', '-m', 'Second commit')
+    for tag, message in TAGS:
+        git(path, 'tag', '-f', tag) if message is None else git(path, 'tag', '-f', '-a', tag, '-m', message)
+
+    yield path
+
+
+def test_loose_refs(repo):
+    assert_parity(repo)
+    assert_native(repo)
+
+
+def test_packed_refs(repo):
+    git(repo, 'pack-refs', '--all')
+    assert_parity(repo)
+    assert_native(repo)
+
+
+def test_gc(repo):
+    git(repo, 'gc', '-q')
+    assert_parity(repo)
+    assert_native(repo)
+
+
+def test_new_tags_after_gc(repo):
+    git(repo, 'gc', '-q')
+    git(repo, 'tag', '-a', 'v1.0.2', '-m', 'Loose tag of a packed commit')
+    assert_parity(repo)
+    assert_native(repo)
+
+
+@pytest.mark.skipif(get_git_version() < (2, 42), reason='git only fully peels tags for --points-at since 2.42')
+def test_nested_tags(repo):
+    git(repo, '-c', 'advice.nestedTag=false', 'tag', '-a', 'nested', '-m', 'Tag of a tag', 'v1.0.1')
+    assert_parity(repo)
+    git(repo, 'pack-refs', '--all')
+    assert_parity(repo)
+
+
+def test_detached_head(repo):
+    git(repo, 'checkout', '-q', '--detach')
+    assert_parity(repo)
+    assert_native(repo)
+
+
+def test_abbrev(repo):
+    git(repo, 'config', 'core.abbrev', '10')
+    assert_parity(repo)
+    assert gitReader.GitRepoReader(repo).get_short_commit() == git(repo, 'rev-parse', '--short', 'HEAD').strip()
+
+
+def test_subdirectory(repo):
+    subdirectory = os.path.join(repo, 'sub', 'dir')
+    os.makedirs(subdirectory)
+    assert_parity(subdirectory)
+    assert_native(subdirectory)
+
+
+def test_worktree(repo, tmpdir):
+    worktree = str(tmpdir.join('worktree'))
+    git(repo, 'worktree', 'add', '-q', '-b', 'release/v2.0.0', worktree)
+    assert_parity(worktree)
+    assert_native(worktree)
+
+
+def test_ambiguous_branch_falls_back(repo):
+    git(repo, 'checkout', '-q', '-b', 'v1.0.0')
+    assert_parity(repo)
+
+
+def test_missing_remote(repo):
+    git(repo, 'remote', 'remove', 'origin')
+    for backend in ('native', 'cli'):
+        gitOps.set_backend(backend)
+        try:
+            with pytest.raises(subprocess.CalledProcessError):
+                gitOps.get_git_remote_url_from_path(repo)
+        finally:
+            gitOps.set_backend('cli')
+
+
+def test_native_branch_spawns_no_process(repo, monkeypatch):
+    def no_subprocess(*args, **kwargs):
+        raise AssertionError('git was started : %s' % (args,))
+
+    monkeypatch.setattr(subprocess, 'check_output', no_subprocess)
+    gitOps.set_backend('native')
+    try:
+        assert gitOps.get_current_git_branch_from_path(repo) == 'v1.0.0'
+        assert gitOps.get_current_tags_from_path(repo) == ['light', 'v1.0.0', 'v1.0.1']
+    finally:
+        gitOps.set_backend('cli')
+
+
+def test_invalid_backend():
+    with pytest.raises(ValueError):
+        gitOps.set_backend('libgit2')
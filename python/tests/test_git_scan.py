@@ -0,0 +1,98 @@
+import pytest
+
+import sys, os
+import json
+from collections import OrderedDict
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, myPath + '/../../')
+sys.path.insert(0, myPath)
+
+from blPython.git import gitOps, gitScan
+import git_fixtures
+
+
+@pytest.fixture()
+def tree(tmpdir):
+    root = str(tmpdir.join('pipeline'))
+    git_fixtures.make_repo(os.path.join(root, 'tools', 'repo_a'), branch='master', tags=[('v1.0.0', 'First')])
+    git_fixtures.make_repo(os.path.join(root, 'tools', 'repo_b'), branch='develop')
+    git_fixtures.make_repo(os.path.join(root, 'configs', 'repo_c'), branch='master')
+    os.makedirs(os.path.join(root, 'configs', 'not_a_repo'))
+
+    # Nested repos aren't searched
+    git_fixtures.make_repo(os.path.join(root, 'tools', 'repo_a', 'vendor', 'nested'))
+
+    with open(os.path.join(root, 'tools', 'repo_b', 'README.md'), 'a') as f:
+        f.write('dirty\n')
+
+    yield root
+
+
+def test_find_repos(tree):
+    assert gitScan.find_repos(tree) == [os.path.join(tree, 'configs', 'repo_c'),
+                                        os.path.join(tree, 'tools', 'repo_a'),
+                                        os.path.join(tree, 'tools', 'repo_b')]
+    assert gitScan.find_repos(tree, max_depth=1) == []
+
+
+@pytest.mark.parametrize('backend', gitOps.BACKENDS)
+def test_scan(tree, backend):
+    previous = gitOps.BACKEND
+    gitOps.set_backend(backend)
+    try:
+        results = dict((status.path, status) for status in gitScan.scan_root(tree, workers=2))
+    finally:
+        gitOps.set_backend(previous)
+
+    assert len(results) == 3
+
+    repo_a = results[os.path.join(tree, 'tools', 'repo_a')]
+    assert repo_a.branch == 'master'
+    assert repo_a.commit == git_fixtures.git(repo_a.path, 'rev-parse', 'HEAD').strip()
+    assert repo_a.dirty is False
+    assert repo_a.tags == ['v1.0.0']
+    assert repo_a.error is None
+
+    repo_b = results[os.path.join(tree, 'tools', 'repo_b')]
+    assert repo_b.branch == 'develop'
+    assert repo_b.dirty is True
+    assert repo_b.tags == []
+
+
+def test_scan_reports_errors(tree):
+    path = os.path.join(tree, 'configs', 'not_a_repo')
+    results = list(gitScan.scan([path]))
+
+    assert len(results) == 1
+    assert results[0].path == path
+    assert results[0].error
+    assert results[0].commit is None
+
+
+def test_scan_empty():
+    assert list(gitScan.scan([])) == []
+
+
+def test_status_to_dict_is_json(tree):
+    status = gitScan.get_repo_status(os.path.join(tree, 'tools', 'repo_a'))
+    data = json.loads(json.dumps(gitScan.status_to_dict(status)), object_pairs_hook=OrderedDict)
+
+    assert list(data.keys()) == list(gitScan.RepoStatus._fields)
+    assert data['branch'] == 'master'
+
+
+def test_get_repo_status_git_calls(tree, monkeypatch):
+    calls = []
+    git = gitOps._git
+
+    def record(path, *args):
+        calls.append(args[0])
+        return git(path, *args)
+
+    monkeypatch.setattr(gitOps, '_git', record)
+    monkeypatch.setattr(gitOps, 'BACKEND', 'cli')
+
+    status = gitScan.get_repo_status(os.path.join(tree, 'tools', 'repo_a'))
+    assert status.branch == 'master' and status.tags == ['v1.0.0']
+    assert calls == ['for-each-ref', 'diff-index']
@@ -0,0 +1,99 @@
+import pytest
+
+import sys, os
+import json
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, myPath + '/../../')
+sys.path.insert(0, myPath)
+
+from blPython.core import connection
+from blPython.scripts.tools import sg_packager, repo_packager
+from fake_shotgun import FakeShotgun
+
+REPORT = {'archive_digest': 'a' * 64, 'commit_comment': 'Release v1.0.0'}
+
+UPLOAD_FUNCTIONS = [sg_packager.upload_pc_to_sg, repo_packager.upload_package_to_sg]
+
+
+@pytest.fixture()
+def sg(tmpdir, monkeypatch):
+    tmpdir.join('Python', 'shotgun', 'shotgun_config.json').write(json.dumps({'SHOTGUN_SITE': 'https://sg'}),
+                                                                   ensure=True)
+    monkeypatch.setenv('PIPELINE_ROOT', str(tmpdir))
+
+    sg = FakeShotgun({'PipelineConfiguration': [{'id': 66}]})
+    previous = connection.set_pool(connection.ConnectionPool(factory=lambda site, script_name, api_key: sg))
+    yield sg
+    connection.set_pool(previous)
+
+
+@pytest.fixture()
+def package(tmpdir):
+    path = tmpdir.join('shotgun-config_release_v1.0.0.zip')
+    path.write_binary(b'PK' * 1000)
+    yield str(path)
+
+
+def get_calls(sg):
+    return [call[0] for call in sg.calls]
+
+
+@pytest.mark.parametrize('upload', UPLOAD_FUNCTIONS)
+def test_upload_round_trips(sg, package, upload):
+    upload(package, 66, report_data=REPORT)
+
+    # The lookup, the upload and a single batch of updates
+    assert get_calls(sg) == ['find_one', 'upload', 'batch']
+
+    pipeline_config = sg.data['PipelineConfiguration'][66]
+    attachment_id = pipeline_config['uploaded_config']['id']
+    assert pipeline_config['descriptor'].endswith('&version=%s' % attachment_id)
+    assert sg.data['Attachment'][attachment_id]['description'] == 'Release v1.0.0'
+    assert REPORT['archive_digest'] in sg.data['Attachment'][attachment_id]['metadata']
+
+    # Releasing the same package again doesn't write anything
+    sg.reset_calls()
+    upload(package, 66, report_data=REPORT)
+    assert get_calls(sg) == ['find_one', 'find_one']
+
+
+@pytest.mark.parametrize('upload', UPLOAD_FUNCTIONS)
+def test_upload_new_version(sg, package, tmpdir, upload):
+    upload(package, 66, report_data=REPORT)
+
+    # The field holds the previous release, which isn't looked up
+    next_package = tmpdir.join('shotgun-config_release_v1.0.1.zip')
+    next_package.write_binary(b'PK' * 1001)
+    sg.reset_calls()
+    upload(str(next_package), 66, report_data=dict(REPORT, archive_digest='b' * 64))
+    assert get_calls(sg) == ['find_one', 'upload', 'batch']
+
+
+@pytest.mark.parametrize('upload', UPLOAD_FUNCTIONS)
+def test_upload_resumes_updates(sg, package, upload):
+    upload(package, 66, report_data=REPORT)
+
+    # A previous release uploaded the package but didn't update the descriptor
+    sg.data['PipelineConfiguration'][66]['descriptor'] = None
+    sg.reset_calls()
+
+    upload(package, 66, report_data=REPORT)
+    assert get_calls(sg) == ['find_one', 'find_one', 'batch']
+    assert sg.data['PipelineConfiguration'][66]['descriptor']
+
+
+@pytest.mark.parametrize('upload', UPLOAD_FUNCTIONS)
+def test_upload_missing_pipeline_config(sg, package, upload):
+    upload(package, 67, report_data=REPORT)
+    assert get_calls(sg) == ['find_one']
+
+
+@pytest.mark.parametrize('upload', UPLOAD_FUNCTIONS)
+def test_upload_metadata_without_file_digests(sg, package, upload):
+    upload(package, 66, report_data=dict(REPORT, file_digests={'README.md': 'b' * 64}))
+
+    # The per file digests stay in the package's report
+    metadata = sg.data['Attachment'][sg.data['PipelineConfiguration'][66]['uploaded_config']['id']]['metadata']
+    assert REPORT['archive_digest'] in metadata and 'Release v1.0.0' in metadata
+    assert 'file_digests' not in metadata
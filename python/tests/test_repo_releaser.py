@@ -0,0 +1,90 @@
+import pytest
+
+import sys, os
+import zipfile
+from multiprocessing.pool import ThreadPool
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, myPath + '/../../')
+sys.path.insert(0, myPath)
+
+from blPython.release import zipOps
+from blPython.scripts.tools import repo_releaser
+import git_fixtures
+
+
+@pytest.fixture()
+def repos(tmpdir):
+    config = git_fixtures.make_repo(str(tmpdir.join('shotgun-config')),
+                                    remote='https://github.com/blacksmith/shotgun-config.git',
+                                    files={'README.md': 'config\n', 'env/project.yml': 'engines: {}\n'})
+    framework = git_fixtures.make_repo(str(tmpdir.join('tk-framework-blPython')),
+                                       remote='https://github.com/blacksmith/tk-framework-blPython.git',
+                                       files={'python/__init__.py': '\n'})
+    feature = git_fixtures.make_repo(str(tmpdir.join('tk-multi-publish2')), branch='feature/publish',
+                                     remote='https://github.com/blacksmith/tk-multi-publish2.git')
+    yield [config, str(tmpdir.join('missing')), framework, feature]
+
+
+def test_release_repos(repos, tmpdir):
+    release_root = str(tmpdir.join('_release'))
+    report = repo_releaser.release_repos(repos, processes=2, release_root=release_root, workers=2)
+
+    assert report['repos_count'] == 4
+    assert report['released'] == 2
+    assert report['failed'] == 2
+
+    # Results keep the order of the repos given
+    config, missing, framework, feature = report['repos']
+    assert [result['path'] for result in report['repos']] == repos
+
+    for result in [config, framework]:
+        assert result['status'] == repo_releaser.RELEASED
+        assert list(result['timings']) == ['validate', 'report', 'zip', 'release']
+        assert result['release_path'].startswith(release_root)
+        assert os.path.isdir(result['release_path'])
+        assert len(result['archive_digest']) == 64
+        with zipfile.ZipFile(result['package']) as ziph:
+            assert ziph.testzip() is None
+            assert zipOps.read_report(ziph, 'package_info.json')['compression_level'] is None
+
+    # A failure doesn't stop the other repos
+    assert missing['status'] == feature['status'] == repo_releaser.FAILED
+    assert 'feature/publish' in feature['error']
+    assert list(feature['timings']) == ['validate']
+    assert missing['error']
+
+    assert list(report['phases']) == ['validate', 'report', 'zip', 'release']
+    assert report['phases']['zip'] == round(config['timings']['zip'] + framework['timings']['zip'], 3)
+
+
+@pytest.mark.parametrize('use_store', [False, True])
+def test_release_store_is_opt_in(repos, tmpdir, use_store):
+    release_root = str(tmpdir.join('_release'))
+    report = repo_releaser.release_repos(repos[:1], processes=1, release_root=release_root, use_store=use_store)
+    release_path = report['repos'][0]['release_path']
+
+    # Copies keep the whole repo, the store leaves out .git as its objects are shared read-only
+    assert os.path.isfile(os.path.join(release_path, 'env', 'project.yml'))
+    assert os.path.isdir(os.path.join(release_path, '.git')) != use_store
+    assert os.path.isdir(os.path.join(release_root, '_store')) == use_store
+
+
+def test_release_repos_once(repos, tmpdir, monkeypatch):
+    # One process shares the cpus with no other, its zip gets them all
+    monkeypatch.setattr(repo_releaser.zipOps, 'get_default_workers', lambda: 4)
+    zip_workers = []
+    zipdir = zipOps.zipdir
+
+    def record(*args, **kwargs):
+        zip_workers.append(kwargs['workers'])
+        return zipdir(*args, **kwargs)
+
+    monkeypatch.setattr(zipOps, 'zipdir', record)
+    # Release in this process to see the zip calls
+    monkeypatch.setattr(repo_releaser.multiprocessing, 'Pool', ThreadPool)
+
+    report = repo_releaser.release_repos([repos[0], repos[0] + os.sep], processes=1,
+                                         release_root=str(tmpdir.join('_release')))
+    assert report['repos_count'] == report['released'] == 1
+    assert zip_workers == [4]
@@ -0,0 +1,130 @@
+import pytest
+
+import sys, os
+import stat
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, myPath + '/../../')
+sys.path.insert(0, myPath)
+
+from blPython.release import copyOps, storeOps
+
+FILES = {'README.md': b'release\n',
+         'core/core_api.yml': b'location: {type: app_store}\n',
+         'hooks/publish.py': b'import os\n',
+         'hooks/copy_of_publish.py': b'import os\n',
+         'bin/launch.sh': b'#!/bin/sh\n'}
+
+
+def write_tree(root, files):
+    for relative_path, content in files.items():
+        file_path = os.path.join(root, *relative_path.split('/'))
+        if not os.path.isdir(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path))
+        with open(file_path, 'wb') as f:
+            f.write(content)
+    return root
+
+
+@pytest.fixture()
+def source(tmpdir):
+    root = write_tree(str(tmpdir.join('repo')), FILES)
+    os.chmod(os.path.join(root, 'bin', 'launch.sh'), 0o755)
+    os.makedirs(os.path.join(root, 'cache', 'empty'))
+    yield root
+
+
+@pytest.fixture()
+def store(tmpdir):
+    yield storeOps.ObjectStore(str(tmpdir.join('_release', '_store')))
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def count_objects(store):
+    return sum(len(files) for _, _, files in os.walk(store.objects_path))
+
+
+@pytest.mark.parametrize('method', ['auto', 'hardlink', 'copy'])
+def test_release(source, store, tmpdir, method):
+    dest = str(tmpdir.join('_release', 'repo', 'v1.0.0'))
+    manifest = store.release(source, dest, method=method)
+
+    for relative_path, content in FILES.items():
+        assert read(os.path.join(dest, *relative_path.split('/'))) == content
+    assert os.path.isdir(os.path.join(dest, 'cache', 'empty'))
+    assert os.stat(os.path.join(dest, 'bin', 'launch.sh')).st_mode & stat.S_IXUSR
+
+    assert manifest == copyOps.read_manifest(dest)
+    assert manifest['directories'] == ['bin', 'cache', 'cache/empty', 'core', 'hooks']
+    assert [entry['path'] for entry in manifest['files']] == sorted(FILES)
+    assert manifest['stats']['files'] == len(FILES)
+    assert manifest['stats']['methods'][method if method != 'auto' else 'hardlink'] == len(FILES)
+    assert list(manifest['timings']) == ['scan', 'hash', 'store', 'materialize', 'verify']
+
+    # The two identical hooks share an object
+    assert manifest['stats']['new_objects'] == len(FILES) - 1
+    assert count_objects(store) == len(FILES) - 1
+
+
+def test_release_dedupes_across_releases(source, store, tmpdir):
+    store.release(source, str(tmpdir.join('_release', 'repo', 'v1.0.0')))
+
+    with open(os.path.join(source, 'hooks', 'publish.py'), 'ab') as f:
+        f.write(b'import sys\n')
+    dest = str(tmpdir.join('_release', 'repo', 'v1.0.1'))
+    manifest = store.release(source, dest)
+
+    assert manifest['stats']['new_objects'] == 1
+    assert manifest['stats']['new_bytes'] == len(b'import os\nimport sys\n')
+    # Only the new object is hashed again, the other files are links to verified objects
+    assert manifest['stats']['verified_files'] == 1
+    assert count_objects(store) == len(FILES)
+
+    # Unchanged files are the same inode in both releases
+    assert os.path.samefile(os.path.join(dest, 'README.md'),
+                            str(tmpdir.join('_release', 'repo', 'v1.0.0', 'README.md')))
+    assert read(os.path.join(dest, 'hooks', 'publish.py')) == b'import os\nimport sys\n'
+
+
+def test_objects_are_read_only(source, store):
+    digest = copyOps.hash_file(os.path.join(source, 'README.md'))
+    assert store.add(os.path.join(source, 'README.md')) is True
+    assert store.add(os.path.join(source, 'README.md')) is False
+
+    object_path = store.get_object_path(digest)
+    assert store.has(digest)
+    assert not os.stat(object_path).st_mode & stat.S_IWUSR
+
+
+def test_executable_objects_are_stored_apart(source, store):
+    script = os.path.join(source, 'bin', 'launch.sh')
+    plain = write_tree(os.path.join(source, 'plain'), {'launch.sh': read(script)})
+
+    assert store.add(script) is True
+    assert store.add(os.path.join(plain, 'launch.sh')) is True
+    assert store.has(copyOps.hash_file(script), executable=True)
+    assert store.has(copyOps.hash_file(script), executable=False)
+
+
+def test_materialize_falls_back_to_copy(source, store, tmpdir, monkeypatch):
+    def unsupported(src, dest):
+        raise OSError(18, 'Invalid cross-device link')
+
+    monkeypatch.setattr(os, 'link', unsupported)
+    monkeypatch.setattr(storeOps, 'reflink', unsupported)
+
+    manifest = store.release(source, str(tmpdir.join('_release', 'repo', 'v1.0.0')))
+    assert manifest['stats']['methods'] == {'hardlink': 0, 'reflink': 0, 'copy': len(FILES)}
+    assert manifest['stats']['verified_files'] == len(FILES)
+
+
+def test_release_existing_destination(source, store, tmpdir):
+    dest = str(tmpdir.join('_release', 'repo', 'v1.0.0'))
+    os.makedirs(dest)
+
+    with pytest.raises(RuntimeError):
+        store.release(source, dest)
@@ -0,0 +1,163 @@
+import pytest
+
+import sys, os
+import errno
+import socket
+import logging
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, myPath + '/../../')
+sys.path.insert(0, myPath)
+
+from blPython.release import uploadOps
+from fake_shotgun import FakeShotgun
+
+DIGEST = 'a' * 64
+
+
+class FlakyShotgun(FakeShotgun):
+    """
+    Fails the first uploads with the given errors.
+    """
+
+    def __init__(self, data=None, errors=(), stored=False):
+        super(FlakyShotgun, self).__init__(data)
+        self.errors = list(errors)
+        self.stored = stored
+
+    def upload(self, *args, **kwargs):
+        if self.errors:
+            if self.stored:
+                # The file is stored but the response is lost, eg. a read timeout
+                super(FlakyShotgun, self).upload(*args, **kwargs)
+            else:
+                self._record('upload', *args)
+            raise self.errors.pop(0)
+        return super(FlakyShotgun, self).upload(*args, **kwargs)
+
+
+@pytest.fixture()
+def package(tmpdir):
+    path = tmpdir.join('shotgun-config_release_v1.0.0.zip')
+    path.write_binary(b'PK' * 1000)
+    yield str(path)
+
+
+def upload(sg, package, **kwargs):
+    progress = []
+    delays = []
+    kwargs.setdefault('field_name', 'uploaded_config')
+    result = uploadOps.upload(sg, 'PipelineConfiguration', 66, package, progress=progress.append,
+                              sleep=delays.append, **kwargs)
+    return result, [p.state for p in progress], delays
+
+
+def test_upload(package):
+    sg = FakeShotgun({'PipelineConfiguration': [{'id': 66}]})
+    result, states, delays = upload(sg, package, archive_digest=DIGEST)
+
+    assert states == [uploadOps.STARTED, uploadOps.UPLOADED]
+    assert result.attempts == 1 and not result.skipped and not delays
+    assert result.size == 2000
+    assert sg.data['PipelineConfiguration'][66]['uploaded_config']['id'] == result.attachment_id
+    assert sg.data['Attachment'][result.attachment_id]['display_name'] == os.path.basename(package)
+
+
+def test_skip_uploaded(package):
+    sg = FakeShotgun({'PipelineConfiguration': [{'id': 66}],
+                      'Attachment': [{'id': 5, 'metadata': str({'archive_digest': DIGEST})}]})
+    current = {'type': 'Attachment', 'id': 5}
+
+    result, states, delays = upload(sg, package, archive_digest=DIGEST, current=current)
+    assert states == [uploadOps.SKIPPED]
+    assert result.skipped and result.attachment_id == 5
+    assert sg.call_count('upload') == 0
+
+    # Another package is uploaded
+    result, states, delays = upload(sg, package, archive_digest='b' * 64, current=current)
+    assert not result.skipped and result.attachment_id != 5
+    assert sg.call_count('upload') == 1
+
+
+def test_skip_uploaded_without_query(package):
+    sg = FakeShotgun({'PipelineConfiguration': [{'id': 66}],
+                      'Attachment': [{'id': 5, 'metadata': str({'archive_digest': DIGEST})}]})
+
+    # The metadata fetched with the field is compared as is
+    current = {'type': 'Attachment', 'id': 5, 'metadata': str({'archive_digest': DIGEST})}
+    result, states, delays = upload(sg, package, archive_digest=DIGEST, current=current)
+    assert result.skipped and sg.call_count() == 0
+
+    # An Attachment named after another package isn't looked up
+    current = {'type': 'Attachment', 'id': 5, 'name': 'shotgun-config_release_v0.9.0.zip'}
+    result, states, delays = upload(sg, package, archive_digest=DIGEST, current=current)
+    assert not result.skipped
+    assert sg.call_count('find_one') == 0 and sg.call_count('upload') == 1
+
+
+def test_retry(package):
+    sg = FlakyShotgun({'PipelineConfiguration': [{'id': 66}]},
+                      errors=[socket.error('Connection reset'), IOError('Broken pipe')])
+
+    result, states, delays = upload(sg, package, backoff=1.5)
+    assert states == [uploadOps.STARTED, uploadOps.RETRYING, uploadOps.STARTED, uploadOps.RETRYING,
+                      uploadOps.STARTED, uploadOps.UPLOADED]
+    assert delays == [1.5, 3.0]
+    assert result.attempts == 3
+    assert sg.call_count('upload') == 3
+
+
+def test_retries_exhausted(package):
+    sg = FlakyShotgun({'PipelineConfiguration': [{'id': 66}]}, errors=[socket.error('Connection reset')] * 3)
+
+    with pytest.raises(socket.error):
+        upload(sg, package, retries=2)
+    assert sg.call_count('upload') == 3
+
+
+def test_error_not_retried(package):
+    sg = FakeShotgun({'PipelineConfiguration': [{'id': 66}]})
+
+    # FakeShotgun raises a ValueError for missing entities, like a SG fault it isn't worth retrying
+    with pytest.raises(ValueError):
+        uploadOps.upload(sg, 'PipelineConfiguration', 67, package, 'uploaded_config', sleep=pytest.fail)
+    assert sg.call_count('upload') == 1
+
+
+def test_stored_upload_not_retried(package):
+    sg = FlakyShotgun({'PipelineConfiguration': [{'id': 66, 'uploaded_config': {'type': 'Attachment', 'id': 5}}],
+                       'Attachment': [{'id': 5, 'metadata': str({'archive_digest': 'b' * 64})}]},
+                      errors=[socket.timeout('timed out')], stored=True)
+    current = {'type': 'Attachment', 'id': 5}
+
+    # The field was checked before retrying, the package is already there
+    result, states, delays = upload(sg, package, archive_digest=DIGEST, current=current)
+    assert states == [uploadOps.STARTED, uploadOps.RETRYING, uploadOps.UPLOADED]
+    assert result.attempts == 1 and delays == [uploadOps.DEFAULT_BACKOFF]
+    assert sg.call_count('upload') == 1
+    assert sg.data['PipelineConfiguration'][66]['uploaded_config']['id'] == result.attachment_id != 5
+
+
+def test_local_error_not_retried(package):
+    sg = FlakyShotgun({'PipelineConfiguration': [{'id': 66}]},
+                      errors=[IOError(errno.EACCES, 'Permission denied', package)])
+
+    with pytest.raises(IOError):
+        upload(sg, package)
+    assert sg.call_count('upload') == 1
+
+    with pytest.raises(OSError):
+        upload(sg, package + '.missing')
+    assert sg.call_count('upload') == 1
+
+
+def test_log_upload_progress(package, caplog):
+    sg = FlakyShotgun({'PipelineConfiguration': [{'id': 66}]}, errors=[socket.error('Connection reset')])
+    log = logging.getLogger('packager')
+
+    with caplog.at_level(logging.INFO, logger='packager'):
+        uploadOps.upload(sg, 'PipelineConfiguration', 66, package, 'uploaded_config', sleep=lambda seconds: None,
+                         progress=lambda progress: uploadOps.log_upload_progress(progress, log=log))
+
+    assert [record.levelname for record in caplog.records if record.name == 'packager'] == [
+        'INFO', 'WARNING', 'INFO', 'INFO']
@@ -0,0 +1,457 @@
+import pytest
+
+import sys, os
+import json
+import hashlib
+import stat
+import subprocess
+import zipfile
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, myPath + '/../../')
+sys.path.insert(0, myPath)
+
+from blPython.release import zipOps
+import git_fixtures
+
+FILES = {'README.md': b'release\n' * 100,
+         'hooks/tk-multi-publish2/basic/publish.py': b'import os\n' * 5000,
+         'hooks/empty.py': b'',
+         'env/includes/app_locations.yml': b'location: {type: app_store}\n' * 200,
+         'resources/icon.png': os.urandom(20000),
+         '.git/HEAD': b'ref: refs/heads/master\n',
+         'install/.git/config': b'[core]\n',
+         '.idea/workspace.xml': b'<xml/>\n'}
+
+
+@pytest.fixture()
+def tree(tmpdir):
+    root = str(tmpdir.join('config'))
+    for relative_path, content in FILES.items():
+        file_path = os.path.join(root, *relative_path.split('/'))
+        if not os.path.isdir(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path))
+        with open(file_path, 'wb') as f:
+            f.write(content)
+
+    yield root
+
+
+def expected_names():
+    return sorted(name for name in FILES if '.git/' not in name and '.idea/' not in name)
+
+
+def zip_tree(tree, zip_path, compress_type=zipfile.ZIP_DEFLATED, **kwargs):
+    with zipfile.ZipFile(zip_path, 'w', compress_type) as ziph:
+        stats = zipOps.zipdir(tree, ziph, **kwargs)
+    return stats
+
+
+def test_list_files(tree):
+    members = zipOps.list_files(tree)
+
+    assert [member.arcname for member in members] == [
+        'README.md', 'env/includes/app_locations.yml', 'hooks/empty.py',
+        'hooks/tk-multi-publish2/basic/publish.py', 'resources/icon.png']
+    assert members[0].size == len(FILES['README.md'])
+
+    with pytest.raises(ValueError):
+        zipOps.list_files(os.path.join(tree, 'README.md'))
+
+
+@pytest.mark.parametrize('compression', [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED])
+@pytest.mark.parametrize('large_file_size', [zipOps.LARGE_FILE_SIZE, 1000])
+def test_zipdir(tree, tmpdir, compression, large_file_size):
+    zip_path = str(tmpdir.join('release.zip'))
+    stats = zip_tree(tree, zip_path, compression, workers=3, large_file_size=large_file_size)
+
+    with zipfile.ZipFile(zip_path) as ziph:
+        assert ziph.testzip() is None
+        assert sorted(ziph.namelist()) == expected_names()
+        for name in expected_names():
+            assert ziph.read(name) == FILES[name]
+            assert ziph.getinfo(name).compress_type == compression
+
+    assert stats.files == len(expected_names())
+    assert stats.bytes_in == sum(len(FILES[name]) for name in expected_names())
+    assert stats.mb_per_second >= 0
+
+
+@pytest.mark.parametrize('large_file_size', [zipOps.LARGE_FILE_SIZE, 1000])
+def test_zipdir_matches_zipfile_write(tree, tmpdir, large_file_size):
+    zip_path = str(tmpdir.join('parallel.zip'))
+    zip_tree(tree, zip_path, large_file_size=large_file_size)
+
+    reference_path = str(tmpdir.join('reference.zip'))
+    with zipfile.ZipFile(reference_path, 'w', zipfile.ZIP_DEFLATED) as ziph:
+        for member in zipOps.list_files(tree):
+            ziph.write(member.path, member.arcname)
+
+    with zipfile.ZipFile(zip_path) as parallel, zipfile.ZipFile(reference_path) as reference:
+        for zinfo, reference_info in zip(parallel.infolist(), reference.infolist()):
+            assert zinfo.filename == reference_info.filename
+            assert zinfo.date_time == reference_info.date_time
+            assert zinfo.external_attr == reference_info.external_attr
+            assert zinfo.CRC == reference_info.CRC
+            assert zinfo.compress_size == reference_info.compress_size
+
+
+def test_zipdir_is_deterministic(tree, tmpdir):
+    paths = [str(tmpdir.join('a.zip')), str(tmpdir.join('b.zip'))]
+    zip_tree(tree, paths[0], workers=1)
+    zip_tree(tree, paths[1], workers=4)
+
+    with open(paths[0], 'rb') as a, open(paths[1], 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_get_batches():
+    members = [zipOps.ZipMember(str(i), str(i), size) for i, size in enumerate([10, 10, 50, 10, 200, 10])]
+    batches = list(zipOps.get_batches(members, large_file_size=100, max_batch_size=30))
+
+    assert [[member.size for member in batch] for batch in batches] == [[10, 10], [50], [10], [200], [10]]
+
+
+def rezip(tree, tmpdir, previous_path, name, **kwargs):
+    zip_path = str(tmpdir.join(name))
+    with zipfile.ZipFile(previous_path) as previous:
+        stats = zip_tree(tree, zip_path, previous=previous, **kwargs)
+    return zip_path, stats
+
+
+@pytest.mark.parametrize('large_file_size', [zipOps.LARGE_FILE_SIZE, 1000])
+def test_zipdir_incremental(tree, tmpdir, large_file_size):
+    previous_path = str(tmpdir.join('v1.0.0.zip'))
+    zip_tree(tree, previous_path)
+
+    changed = os.path.join(tree, 'hooks', 'tk-multi-publish2', 'basic', 'publish.py')
+    with open(changed, 'ab') as f:
+        f.write(b'# patched\n')
+
+    zip_path, stats = rezip(tree, tmpdir, previous_path, 'v1.0.1.zip', large_file_size=large_file_size)
+    assert stats.reused == len(expected_names()) - 1
+    assert stats.bytes_in == sum(len(FILES[name]) for name in expected_names()) + len(b'# patched\n')
+
+    # The incremental archive is identical to a full rebuild.
+    full_path = str(tmpdir.join('full.zip'))
+    zip_tree(tree, full_path, large_file_size=large_file_size)
+    with open(zip_path, 'rb') as incremental, open(full_path, 'rb') as full:
+        assert incremental.read() == full.read()
+
+    with zipfile.ZipFile(zip_path) as ziph:
+        assert ziph.testzip() is None
+        assert ziph.read('hooks/tk-multi-publish2/basic/publish.py').endswith(b'# patched\n')
+
+
+def test_zipdir_incremental_verify_crc(tree, tmpdir):
+    previous_path = str(tmpdir.join('v1.0.0.zip'))
+    zip_tree(tree, previous_path)
+
+    # Same size and modification time, different content.
+    changed = os.path.join(tree, 'README.md')
+    st = os.stat(changed)
+    with open(changed, 'wb') as f:
+        f.write(b'RELEASE\n' * 100)
+    os.utime(changed, (st.st_atime, st.st_mtime))
+
+    zip_path, stats = rezip(tree, tmpdir, previous_path, 'stale.zip')
+    assert stats.reused == len(expected_names())
+
+    zip_path, stats = rezip(tree, tmpdir, previous_path, 'verified.zip', verify_crc=True)
+    assert stats.reused == len(expected_names()) - 1
+    with zipfile.ZipFile(zip_path) as ziph:
+        assert ziph.read('README.md') == b'RELEASE\n' * 100
+
+
+def test_zipdir_incremental_compression_change(tree, tmpdir):
+    previous_path = str(tmpdir.join('v1.0.0.zip'))
+    zip_tree(tree, previous_path, compress_type=zipfile.ZIP_STORED)
+
+    zip_path, stats = rezip(tree, tmpdir, previous_path, 'v1.0.1.zip')
+    assert stats.reused == 0
+    with zipfile.ZipFile(zip_path) as ziph:
+        assert ziph.testzip() is None
+
+
+def test_zipdir_incremental_level_change(tree, tmpdir):
+    previous_path = str(tmpdir.join('v1.0.0.zip'))
+    previous_stats = zip_tree(tree, previous_path, compression=zipOps.parse_compression('auto:1'))
+    assert previous_stats.level == 1
+
+    # Only the stored png is reused when the level changes
+    zip_path, stats = rezip(tree, tmpdir, previous_path, 'v1.0.1.zip', compression=zipOps.parse_compression('auto:9'),
+                            previous_level=previous_stats.level)
+    assert stats.reused == 1
+    zip_path, stats = rezip(tree, tmpdir, previous_path, 'v1.0.2.zip', compression=zipOps.parse_compression('auto:1'),
+                            previous_level=previous_stats.level)
+    assert stats.reused == len(expected_names())
+
+    # Releases that don't record their level were compressed with the default level
+    zip_path, stats = rezip(tree, tmpdir, previous_path, 'v1.0.3.zip', compression=zipOps.parse_compression('auto:9'))
+    assert stats.reused == 1
+
+    full_path = str(tmpdir.join('full.zip'))
+    zip_tree(tree, full_path, compression=zipOps.parse_compression('auto:9'))
+    with open(str(tmpdir.join('v1.0.1.zip')), 'rb') as incremental, open(full_path, 'rb') as full:
+        assert incremental.read() == full.read()
+
+
+def test_zipdir_incremental_odd_mtime(tree, tmpdir):
+    # Zip rounds the modification time down to an even second.
+    for member in zipOps.list_files(tree):
+        os.utime(member.path, (1600000001, 1600000001))
+
+    previous_path = str(tmpdir.join('v1.0.0.zip'))
+    zip_tree(tree, previous_path)
+
+    zip_path, stats = rezip(tree, tmpdir, previous_path, 'v1.0.1.zip')
+    assert stats.reused == len(expected_names())
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.parametrize('large_file_size', [zipOps.LARGE_FILE_SIZE, 1000])
+def test_zipdir_digests(tree, tmpdir, large_file_size):
+    stats = zip_tree(tree, str(tmpdir.join('release.zip')), large_file_size=large_file_size)
+
+    assert list(stats.digests) == sorted(expected_names())
+    for name in expected_names():
+        assert stats.digests[name] == sha256(FILES[name])
+
+    listing = ''.join('%s  %s\n' % (sha256(FILES[name]), name) for name in sorted(expected_names()))
+    assert stats.archive_digest == sha256(listing.encode('utf-8'))
+
+
+def test_archive_digest_ignores_compression(tree, tmpdir):
+    deflated = zip_tree(tree, str(tmpdir.join('deflated.zip')), workers=4)
+    stored = zip_tree(tree, str(tmpdir.join('stored.zip')), zipfile.ZIP_STORED, workers=1)
+
+    assert deflated.archive_digest == stored.archive_digest
+
+
+def test_zipdir_incremental_digests(tree, tmpdir):
+    previous_path = str(tmpdir.join('v1.0.0.zip'))
+    previous_stats = zip_tree(tree, previous_path)
+
+    with open(os.path.join(tree, 'README.md'), 'ab') as f:
+        f.write(b'patched\n')
+
+    # Digests of the reused members come from the previous release, or are hashed when it has none.
+    with zipfile.ZipFile(previous_path) as previous:
+        stats = zip_tree(tree, str(tmpdir.join('v1.0.1.zip')), previous=previous,
+                         previous_digests=previous_stats.digests)
+    zip_path, hashed_stats = rezip(tree, tmpdir, previous_path, 'hashed.zip')
+
+    assert stats.reused == hashed_stats.reused == len(expected_names()) - 1
+    assert stats.digests == hashed_stats.digests
+    assert stats.digests['README.md'] == sha256(FILES['README.md'] + b'patched\n')
+    assert stats.digests['hooks/empty.py'] == previous_stats.digests['hooks/empty.py']
+
+
+def test_zipdir_exclude_and_read_digests(tree, tmpdir):
+    with open(os.path.join(tree, 'package_info.json'), 'w') as f:
+        f.write('{}')
+
+    zip_path = str(tmpdir.join('release.zip'))
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as ziph:
+        stats = zipOps.zipdir(tree, ziph, exclude=['package_info.json'])
+        assert 'package_info.json' not in stats.digests
+        ziph.writestr('package_info.json', json.dumps({'file_digests': stats.digests, 'compression_level': 9}))
+
+    with zipfile.ZipFile(zip_path) as ziph:
+        assert zipOps.read_digests(ziph, 'package_info.json') == stats.digests
+        assert zipOps.read_digests(ziph, 'missing.json') == {}
+        assert zipOps.read_level(ziph, 'package_info.json') == 9
+        assert zipOps.read_level(ziph, 'missing.json') is None
+
+
+def test_add_report_digests(tree, tmpdir):
+    report_path = str(tmpdir.join('package_info.json'))
+    report = {'data': {'commit': 'abc1234', 'report_file_path': report_path}, 'report_path': report_path}
+
+    stats = zip_tree(tree, str(tmpdir.join('release.zip')), compression=zipOps.parse_compression('deflate:9'))
+    assert zipOps.add_report_digests(report, stats) is report
+
+    with open(report_path) as f:
+        data = json.load(f)
+    assert data == {'commit': 'abc1234', 'archive_digest': stats.archive_digest, 'file_digests': stats.digests,
+                    'compression_level': 9}
+
+
+GIT_FILES = {'README.md': 'release\n' * 100,
+             'hooks/publish.py': 'import os\n' * 5000,
+             'env/app_locations.yml': 'location: {type: app_store}\n',
+             '.idea/workspace.xml': '<xml/>\n'}
+
+
+@pytest.fixture()
+def repo(tmpdir):
+    path = git_fixtures.make_repo(str(tmpdir.join('repo')), files=GIT_FILES)
+
+    # Untracked files aren't exported
+    with open(os.path.join(path, 'hooks', 'publish.pyc'), 'wb') as f:
+        f.write(b'junk')
+    yield path
+
+
+@pytest.mark.parametrize('large_file_size', [zipOps.LARGE_FILE_SIZE, 1000])
+def test_zipgit(repo, tmpdir, large_file_size):
+    zip_path = str(tmpdir.join('release.zip'))
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as ziph:
+        stats = zipOps.zipgit(repo, ziph, workers=2, large_file_size=large_file_size)
+
+    names = ['README.md', 'env/app_locations.yml', 'hooks/publish.py']
+    assert sorted(stats.digests) == names
+    assert stats.files == len(names)
+    assert stats.bytes_in == sum(len(GIT_FILES[name]) for name in names)
+
+    with zipfile.ZipFile(zip_path) as ziph:
+        assert ziph.testzip() is None
+        assert sorted(ziph.namelist()) == names
+        for name in names:
+            assert ziph.read(name) == GIT_FILES[name].encode('utf-8')
+            assert stats.digests[name] == sha256(GIT_FILES[name].encode('utf-8'))
+
+    # The archive digest matches the working copy when it holds the same files
+    os.remove(os.path.join(repo, 'hooks', 'publish.pyc'))
+    walk_stats = zip_tree(repo, str(tmpdir.join('walk.zip')))
+    assert walk_stats.archive_digest == stats.archive_digest
+
+
+def test_zipgit_modes_and_links(repo, tmpdir):
+    os.chmod(os.path.join(repo, 'README.md'), 0o755)
+    os.symlink('README.md', os.path.join(repo, 'LINK.md'))
+    git_fixtures.git(repo, 'add', '-A', '.')
+    git_fixtures.git(repo, 'reset', '-q', 'hooks/publish.pyc')
+    git_fixtures.git(repo, 'commit', '-q', '-m', 'Modes')
+
+    zip_path = str(tmpdir.join('release.zip'))
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as ziph:
+        zipOps.zipgit(repo, ziph)
+
+    with zipfile.ZipFile(zip_path) as ziph:
+        assert ziph.getinfo('README.md').external_attr >> 16 & 0o111 == 0o111
+        assert not ziph.getinfo('hooks/publish.py').external_attr >> 16 & 0o111
+        assert stat.S_ISLNK(ziph.getinfo('LINK.md').external_attr >> 16)
+        assert ziph.read('LINK.md') == b'README.md'
+
+
+def test_zipgit_incremental(repo, tmpdir):
+    previous_path = str(tmpdir.join('v1.0.0.zip'))
+    with zipfile.ZipFile(previous_path, 'w', zipfile.ZIP_DEFLATED) as ziph:
+        previous_stats = zipOps.zipgit(repo, ziph)
+
+    with open(os.path.join(repo, 'README.md'), 'a') as f:
+        f.write('patched\n')
+    git_fixtures.git(repo, 'commit', '-q', '-am', 'Patch')
+
+    zip_path = str(tmpdir.join('v1.0.1.zip'))
+    with zipfile.ZipFile(previous_path) as previous:
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as ziph:
+            stats = zipOps.zipgit(repo, ziph, previous=previous, previous_digests=previous_stats.digests,
+                                  exclude=['env/app_locations.yml'])
+
+    assert stats.reused == 1
+    assert sorted(stats.digests) == ['README.md', 'hooks/publish.py']
+    with zipfile.ZipFile(zip_path) as ziph:
+        assert ziph.testzip() is None
+        assert ziph.read('README.md').endswith(b'patched\n')
+
+
+def test_zipgit_incremental_level_change(repo, tmpdir):
+    previous_path = str(tmpdir.join('v1.0.0.zip'))
+    with zipfile.ZipFile(previous_path, 'w', zipfile.ZIP_DEFLATED) as ziph:
+        previous_stats = zipOps.zipgit(repo, ziph, compression=zipOps.parse_compression('deflate:1'))
+
+    for value, reused in [('deflate:9', 0), ('deflate:1', 3)]:
+        with zipfile.ZipFile(previous_path) as previous:
+            with zipfile.ZipFile(str(tmpdir.join('v1.0.1.zip')), 'w') as ziph:
+                stats = zipOps.zipgit(repo, ziph, previous=previous, previous_digests=previous_stats.digests,
+                                      compression=zipOps.parse_compression(value), previous_level=previous_stats.level)
+        assert stats.reused == reused
+
+
+def test_zipgit_bad_treeish(repo, tmpdir):
+    with zipfile.ZipFile(str(tmpdir.join('release.zip')), 'w') as ziph:
+        with pytest.raises(subprocess.CalledProcessError):
+            zipOps.zipgit(repo, ziph, treeish='missing-branch')
+
+
+def test_parse_compression():
+    assert zipOps.parse_compression('store') == (zipfile.ZIP_STORED, None, ())
+    assert zipOps.parse_compression('deflate:9') == (zipfile.ZIP_DEFLATED, 9, ())
+    assert zipOps.parse_compression('auto') == (zipfile.ZIP_DEFLATED, None, zipOps.STORED_EXTENSIONS)
+    assert zipOps.parse_compression('auto:1').level == 1
+
+    for value in ['gzip', 'store:1', 'deflate:10', 'deflate:fast', 'lzma:3']:
+        with pytest.raises(ValueError):
+            zipOps.parse_compression(value)
+
+
+def test_auto_compression(tmpdir):
+    tree = tmpdir.join('tree')
+    tree.join('icons', 'app.PNG').write_binary(os.urandom(4096), ensure=True)
+    tree.join('hooks', 'publish.py').write('import os\n' * 1000, ensure=True)
+
+    zip_path = str(tmpdir.join('release.zip'))
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as ziph:
+        zipOps.zipdir(str(tree), ziph, compression=zipOps.parse_compression('auto'))
+
+    with zipfile.ZipFile(zip_path) as ziph:
+        assert ziph.testzip() is None
+        assert ziph.getinfo('icons/app.PNG').compress_type == zipfile.ZIP_STORED
+        assert ziph.getinfo('hooks/publish.py').compress_type == zipfile.ZIP_DEFLATED
+
+    # Members are only reused with the compression they were stored with
+    with zipfile.ZipFile(zip_path) as previous:
+        with zipfile.ZipFile(str(tmpdir.join('stored.zip')), 'w') as ziph:
+            stats = zipOps.zipdir(str(tree), ziph, previous=previous, compression=zipOps.parse_compression('store'))
+    assert stats.reused == 1
+
+
+@pytest.mark.skipif(not hasattr(zipfile, 'ZIP_LZMA'), reason='bzip2 and lzma members require Python 3')
+@pytest.mark.parametrize('value', ['bzip2:9', 'lzma', 'deflate:0'])
+def test_compression(tree, tmpdir, value):
+    compression = zipOps.parse_compression(value)
+    for large_file_size in [zipOps.LARGE_FILE_SIZE, 1000]:
+        stats = zip_tree(tree, str(tmpdir.join('release.zip')), zipfile.ZIP_STORED, large_file_size=large_file_size,
+                         compression=compression)
+
+        with zipfile.ZipFile(str(tmpdir.join('release.zip'))) as ziph:
+            assert ziph.testzip() is None
+            assert set(zinfo.compress_type for zinfo in ziph.infolist()) == set([compression.compress_type])
+            for name in expected_names():
+                assert ziph.read(name) == FILES[name]
+                assert stats.digests[name] == sha256(FILES[name])
+
+
+def test_raw_writes_on_tested_versions():
+    assert zipOps.RAW_WRITES == (tuple(sys.version_info[:2]) in zipOps.TESTED_VERSIONS)
+
+
+@pytest.mark.parametrize('large_file_size', [zipOps.LARGE_FILE_SIZE, 1000])
+def test_zip_without_raw_writes(tree, repo, tmpdir, monkeypatch, large_file_size):
+    previous_path = str(tmpdir.join('v1.0.0.zip'))
+    previous_stats = zip_tree(tree, previous_path)
+
+    # Untested interpreters write the members through ZipFile.writestr and reuse nothing
+    monkeypatch.setattr(zipOps, 'RAW_WRITES', False)
+    zip_path, stats = rezip(tree, tmpdir, previous_path, 'v1.0.1.zip', previous_digests=previous_stats.digests,
+                            large_file_size=large_file_size)
+    assert stats.reused == 0
+    assert stats.digests == previous_stats.digests
+
+    git_path = str(tmpdir.join('git.zip'))
+    with zipfile.ZipFile(git_path, 'w', zipfile.ZIP_DEFLATED) as ziph:
+        git_stats = zipOps.zipgit(repo, ziph, large_file_size=large_file_size)
+
+    for path, expected in [(zip_path, FILES), (git_path, GIT_FILES)]:
+        with zipfile.ZipFile(path) as ziph:
+            assert ziph.testzip() is None
+            for zinfo in ziph.infolist():
+                assert zinfo.compress_type == zipfile.ZIP_DEFLATED
+                content = expected[zinfo.filename]
+                assert ziph.read(zinfo) == (content if isinstance(content, bytes) else content.encode('utf-8'))
+    assert sorted(git_stats.digests) == ['README.md', 'env/app_locations.yml', 'hooks/publish.py']